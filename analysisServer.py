@@ -0,0 +1,254 @@
+# Purpose: Resident analysis server. The STRING network is compiled and loaded once, then GMT
+#   jobs are accepted over a local Unix socket (or a localhost TCP port) and run concurrently
+#   on a pool of worker processes. Each worker memory-maps the same compiled network and
+#   degree bins, so nothing is parsed again between jobs. Nothing leaves the machine.
+#
+#   Protocol: JSON lines. The client sends one job per line and then closes its sending side
+#   (or sends an empty line). A job is
+#       {"id": "optional name", "genesFile": "path/to/file.gmt", "params": {"numSubnetworks": 1000, ...}}
+#   where params are main.py's options, checked against each option's type and range. Every job
+#   writes its files to its own directory under the server's outDir. The server answers with one
+#   line per job, in the order the jobs finish
+#       {"id": ..., "status": "done", "result": {...}}  or  {"id": ..., "status": "error", "error": "..."}
+#
+#   python analysisServer.py serve --interactionsFile STRING.txt --socket /tmp/analysis.sock --outDir jobs
+#   python analysisServer.py submit Input.gmt.txt Other.gmt.txt --socket /tmp/analysis.sock --params '{"calcPVal": true}'
+
+import argparse, concurrent.futures, json, os, socket, socketserver, sys, tempfile, time
+import fileParsing, geneScoring, degreeBins, rendering
+import main as pipeline
+
+# options fixed when the server starts, jobs cannot change the loaded network
+SERVER_OPTIONS = ('interactionsFile', 'backend', 'minScore')
+# where and what a job writes, the server gives every job its own directory
+OUTPUT_OPTIONS = ('genesFile', 'outDir', 'geneOutFile', 'networkOutFile', 'plots', 'plotDir', 'plotBackground', 'log',
+                  'profile', 'profileFile', 'checkpoint', 'checkpointSeconds', 'resume')
+# lowest and highest allowed value of numeric options, None for no limit
+JOB_RANGES = {'numPermutations': (1, None), 'numBins': (1, None), 'numSubnetworks': (1, None), 'islands': (1, None),
+              'workers': (1, None), 'migrationInterval': (1, None), 'numMigrants': (0, None), 'numGenes': (1, None),
+              'hops': (0, None), 'alpha': (0, 1), 'scoreTolerance': (0, None)}
+# main.py option actions by name, flags without a value are left out
+JOB_ACTIONS = {action.dest: action for action in pipeline.parser._actions
+               if action.option_strings and action.nargs != 0}
+
+# set in each worker by initWorker
+workerInteractions = None
+
+
+# Worker process initializer, maps the compiled network
+# @param serverArgs: parsed main.py arguments the server was started with
+def initWorker(serverArgs):
+    global workerInteractions
+    rendering.configure('none')
+    workerInteractions = pipeline.loadInteractions(serverArgs)
+
+
+# Check a job parameter against the main.py option it sets
+# @param key: option name
+# @param value: JSON value sent by the client
+# @returns value: the value converted with the option's type
+def jobValue(key, value):
+    if key in SERVER_OPTIONS:
+        raise ValueError(key + ' is set when the server starts')
+    if key in OUTPUT_OPTIONS:
+        raise ValueError(key + ' is chosen by the server')
+    action = JOB_ACTIONS.get(key)
+    if action is None:
+        raise ValueError('unknown parameter: ' + key)
+    if action.type is bool:
+        # main.py reads any non-empty string as true for these
+        if not isinstance(value, bool):
+            raise ValueError(key + ' must be true or false')
+        return value
+    if value is None or isinstance(value, (bool, list, dict)):
+        raise ValueError(key + ' must be ' + action.type.__name__)
+    try:
+        value = action.type(str(value))
+    except ValueError:
+        raise ValueError(key + ' must be ' + action.type.__name__ + ', not ' + json.dumps(value))
+    if action.choices is not None and value not in action.choices:
+        raise ValueError(key + ' must be one of ' + ', '.join(action.choices))
+    low, high = JOB_RANGES.get(key, (None, None))
+    if (low is not None and value < low) or (high is not None and value > high):
+        raise ValueError(key + ' must be ' + ('at least ' + str(low) if high is None else
+                                              'between ' + str(low) + ' and ' + str(high)) + ', not ' + str(value))
+    return value
+
+
+# @param genesFile: GMT file of the job
+# @param params: dict of main.py options for the job
+# @returns args: parsed main.py arguments of the job, outDir still to be set
+def jobArgs(genesFile, params):
+    if not isinstance(genesFile, str) or not os.path.isfile(genesFile):
+        raise ValueError('genesFile must be an existing file: ' + json.dumps(genesFile))
+    if not isinstance(params, dict):
+        raise ValueError('params must be a JSON object')
+    args = pipeline.parser.parse_args(['--', genesFile])
+    # the job's own null model and islands run in the worker unless asked otherwise
+    args.workers = 1
+    for key, value in params.items():
+        setattr(args, key, jobValue(key, value))
+    return args
+
+
+# Run one GMT job in a worker
+# @param args: main.py arguments of the job from jobArgs, with its outDir
+# @returns result: JSON serializable dict of the job's results
+def runJob(args):
+    start = time.time()
+    lociLists = fileParsing.readLociIndex(args.genesFile)
+    network, geneAvg, population = pipeline.evolve(args, lociLists, workerInteractions)
+
+    result = {'genesFile': args.genesFile, 'outDir': args.outDir,
+              'populationDensity': population.totalDensity/len(population)}
+    topGenes = geneScoring.getTopLociGenes(geneAvg, lociLists, args.numGenes)
+    result['topGenes'] = [{'gene': gene, 'locus': lociLists.locusOf(gene), 'score': float(geneAvg[gene])}
+                          for gene in topGenes]
+    best = population.fitness.argsort()[::-1][:10]
+    subnetworks = population.toSubnetworks()
+    result['networks'] = [{'density': float(population.fitness[n]), 'genes': list(subnetworks[n])}
+                          for n in best.tolist()]
+
+    result['pval'] = 'NA'
+    if args.calcPVal:
+        nullResult = pipeline.nullPValue(args, workerInteractions, population, plots=False)
+        result.update(pval=nullResult.pval, ciLow=nullResult.ciLow, ciHigh=nullResult.ciHigh,
+                      numPermutations=nullResult.numPermutations)
+    result['seconds'] = time.time() - start
+    return result
+
+
+# One client connection: read its jobs, submit each as it arrives, stream back results
+class JobHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        futures = {}
+        for n, line in enumerate(self.rfile):
+            line = line.strip()
+            if not line:
+                break
+            jobId = n
+            try:
+                job = json.loads(line)
+                jobId = job.get('id', n)
+                args = jobArgs(job['genesFile'], job.get('params', {}))
+                # a new directory per job so concurrent jobs never write the same files
+                name = os.path.basename(args.genesFile).split('.')[0] or 'job'
+                args.outDir = tempfile.mkdtemp(prefix=name + '_', dir=self.server.outRoot)
+                future = self.server.executor.submit(runJob, args)
+                futures[future] = (jobId, args.outDir)
+            except (ValueError, KeyError, TypeError, AttributeError, OSError) as e:
+                self.send({'id': jobId, 'status': 'error', 'error': 'bad job: ' + str(e)})
+
+        for future in concurrent.futures.as_completed(futures):
+            jobId, outDir = futures[future]
+            try:
+                self.send({'id': jobId, 'status': 'done', 'result': future.result()})
+            except Exception as e:
+                # a job that failed before writing anything leaves no directory behind
+                if not os.listdir(outDir):
+                    os.rmdir(outDir)
+                self.send({'id': jobId, 'status': 'error', 'error': repr(e)})
+
+    # @param message: dict to send as one JSON line
+    def send(self, message):
+        self.wfile.write((json.dumps(message) + '\n').encode())
+        self.wfile.flush()
+
+
+class UnixJobServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class TCPJobServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+# Load the network once and serve jobs until interrupted
+# @param serverArgs: namespace of the network options, interactionsFile, backend, minScore,
+#   numBins and binning
+# @param socketPath: Unix socket to listen on, or None to use port
+# @param port: localhost TCP port
+# @param jobWorkers: number of jobs run at once
+# @param outRoot: directory the job directories are made in
+def serve(serverArgs, socketPath=None, port=None, jobWorkers=None, outRoot='server_output'):
+    # compile the cache and the default degree bins now so workers only map them
+    interactions = pipeline.loadInteractions(serverArgs)
+    degreeBins.graphDegreeBins(interactions, serverArgs.numBins, serverArgs.binning)
+
+    executor = concurrent.futures.ProcessPoolExecutor(jobWorkers, initializer=initWorker, initargs=(serverArgs,))
+    if socketPath is not None:
+        if os.path.exists(socketPath):
+            os.remove(socketPath)
+        server = UnixJobServer(socketPath, JobHandler)
+    else:
+        server = TCPJobServer(('127.0.0.1', port), JobHandler)
+    server.executor = executor
+    os.makedirs(outRoot, exist_ok=True)
+    server.outRoot = os.path.abspath(outRoot)
+    print('Serving', serverArgs.interactionsFile, 'on', socketPath or '127.0.0.1:' + str(port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        executor.shutdown(cancel_futures=True)
+        if socketPath is not None and os.path.exists(socketPath):
+            os.remove(socketPath)
+
+
+# Send jobs to a running server
+# @param jobs: list of job dicts
+# @param socketPath: Unix socket of the server, or None to use port
+# @param port: localhost TCP port of the server
+# @returns results: generator of result dicts in the order jobs finish
+def submitJobs(jobs, socketPath=None, port=None):
+    if socketPath is not None:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(socketPath)
+    else:
+        connection = socket.create_connection(('127.0.0.1', port))
+    with connection:
+        for job in jobs:
+            connection.sendall((json.dumps(job) + '\n').encode())
+        connection.shutdown(socket.SHUT_WR)
+        with connection.makefile('r') as f:
+            for line in f:
+                yield json.loads(line)
+
+
+def parseArgs(argv=None):
+    parser = argparse.ArgumentParser(description='Keep the STRING network loaded and run GMT jobs on request.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    serveParser = commands.add_parser('serve', help='load the network and accept jobs')
+    serveParser.add_argument('--interactionsFile', type=str, default='STRING.txt')
+    serveParser.add_argument('--backend', type=str, default='compact', choices=['compact', 'sparse', 'symmetric'])
+    serveParser.add_argument('--minScore', type=float, default=None)
+    serveParser.add_argument('--numBins', type=int, default=128, help='degree bins computed when the server starts')
+    serveParser.add_argument('--binning', type=str, default='quantile', choices=['fixed', 'quantile', 'log'])
+    serveParser.add_argument('--outDir', type=str, default='server_output', help='directory the job directories '
+                                                                                 'are made in')
+    serveParser.add_argument('--jobWorkers', type=int, default=None, help='jobs run at once, defaults to the CPU count')
+    submitParser = commands.add_parser('submit', help='send GMT files to a running server')
+    submitParser.add_argument('genesFiles', nargs='+')
+    submitParser.add_argument('--params', type=json.loads, default={}, help='JSON object of main.py options')
+    for command in (serveParser, submitParser):
+        where = command.add_mutually_exclusive_group(required=True)
+        where.add_argument('--socket', type=str, help='Unix socket path')
+        where.add_argument('--port', type=int, help='localhost TCP port')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    options = parseArgs()
+    if options.command == 'serve':
+        serverArgs = argparse.Namespace(interactionsFile=options.interactionsFile, backend=options.backend,
+                                        minScore=options.minScore, numBins=options.numBins, binning=options.binning)
+        serve(serverArgs, options.socket, options.port, options.jobWorkers, options.outDir)
+    else:
+        jobs = [{'id': genesFile, 'genesFile': os.path.abspath(genesFile), 'params': options.params}
+                for genesFile in options.genesFiles]
+        for message in submitJobs(jobs, options.socket, options.port):
+            sys.stdout.write(json.dumps(message) + '\n')
+            sys.stdout.flush()
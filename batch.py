@@ -0,0 +1,161 @@
+# Purpose: Run main.py's analysis on many GMT files at once. The STRING network and its degree
+#   bins are compiled and loaded once, then the files are analyzed on a pool of worker processes
+#   that map the same compiled network. Each file gets its own output directory, named after the
+#   file, and index.tsv in the output root lists every file's directory, status and p-value as
+#   the files finish.
+#
+#   python batch.py gmts/ --outDir results --jobWorkers 4 --calcPVal=True --numSubnetworks=1000
+#   python batch.py 'gmts/*.gmt.txt' other.gmt --outDir results --no-plots
+#   Options other than the batch's own are passed to main.py for every file.
+
+import argparse, concurrent.futures, contextlib, glob, os, sys, time
+import fileParsing, degreeBins, instrumentation, rendering
+import main as pipeline
+
+GMT_PATTERNS = ('*.gmt', '*.gmt.txt', '*.gmt.gz')
+INDEX_COLUMNS = ('genesFile', 'outDir', 'status', 'pval', 'ciLow', 'ciHigh', 'numPermutations', 'populationDensity',
+                 'seconds', 'error')
+
+# set in each worker by initWorker
+workerInteractions = None
+
+
+# Worker process initializer, maps the compiled network
+# @param loadArgs: parsed main.py arguments of the network
+def initWorker(loadArgs):
+    global workerInteractions
+    workerInteractions = pipeline.loadInteractions(loadArgs)
+
+
+# Analyze one GMT file in a worker, its printed progress goes to run.log in its output directory
+# @param args: parsed main.py arguments of the file, outDir set to the file's output directory
+# @returns summary: dict from main.analyze plus the time taken
+def analyzeFile(args):
+    start = time.time()
+    os.makedirs(args.outDir, exist_ok=True)
+    recorder = instrumentation.Recorder()
+    log = None
+    if args.log is not None:
+        log = instrumentation.JsonLinesLog(os.path.join(args.outDir, args.log))
+        recorder.subscribe(log)
+    # the pool already runs in the background, figures are drawn in the worker
+    rendering.configure(args.plots, args.plotDir or args.outDir, None)
+    try:
+        with open(os.path.join(args.outDir, 'run.log'), 'w') as out, contextlib.redirect_stdout(out):
+            recorder.subscribe(instrumentation.ConsoleProgress(out))
+            lociLists = fileParsing.readLociIndex(args.genesFile)
+            summary = pipeline.analyze(args, lociLists, workerInteractions, recorder)
+            rendering.finish()
+            recorder.finish()
+    finally:
+        rendering.configure('none')
+        if log is not None:
+            log.close()
+    summary['seconds'] = time.time() - start
+    return summary
+
+
+# @param inputs: list of GMT files, directories of GMT files or glob patterns
+# @returns genesFiles: GMT files in the order given, each once
+def findInputs(inputs):
+    genesFiles = []
+    for item in inputs:
+        if os.path.isdir(item):
+            matches = sorted(set(f for pattern in GMT_PATTERNS for f in glob.glob(os.path.join(item, pattern))))
+        else:
+            matches = sorted(glob.glob(item))
+        for genesFile in matches:
+            if genesFile not in genesFiles:
+                genesFiles.append(genesFile)
+    return genesFiles
+
+
+# Output directory of each file, named after the file without its extensions, numbered when two
+# files have the same name
+# @param genesFiles: list of GMT files
+# @param outRoot: directory the output directories are made in
+# @returns outDirs: list of output directories
+def outputDirs(genesFiles, outRoot):
+    outDirs = []
+    used = set()
+    for genesFile in genesFiles:
+        name = os.path.basename(genesFile)
+        for extension in ('.gz', '.txt', '.gmt'):
+            if name.endswith(extension) and len(name) > len(extension):
+                name = name[:-len(extension)]
+        unique, n = name, 1
+        while unique in used:
+            n += 1
+            unique = name + '_' + str(n)
+        used.add(unique)
+        outDirs.append(os.path.join(outRoot, unique))
+    return outDirs
+
+
+# @param index: open index.tsv file
+# @param row: dict of INDEX_COLUMNS values
+def writeIndexRow(index, row):
+    index.write('\t'.join(str(row.get(column, '')) for column in INDEX_COLUMNS) + '\n')
+    index.flush()
+
+
+# Analyze every GMT file with the STRING network loaded once
+# @param genesFiles: list of GMT files
+# @param pipelineArgv: main.py options applied to every file
+# @param outRoot: directory the per file output directories and index.tsv are written to
+# @param jobWorkers: files analyzed at once, defaults to the CPU count
+# @returns rows: list of index rows in the order the files finished
+def runBatch(genesFiles, pipelineArgv, outRoot, jobWorkers=None):
+    jobs = []
+    for genesFile, outDir in zip(genesFiles, outputDirs(genesFiles, outRoot)):
+        args = pipeline.parser.parse_args([genesFile] + pipelineArgv)
+        args.outDir = outDir
+        if args.checkpoint is not None:
+            args.checkpoint = os.path.join(outDir, args.checkpoint)
+        # files run in parallel already, so each one samples its null distribution in its own worker
+        if args.workers is None:
+            args.workers = 1
+        jobs.append(args)
+
+    # compile the cache and the degree bins now so workers only map them
+    loadArgs = jobs[0]
+    interactions = pipeline.loadInteractions(loadArgs)
+    if loadArgs.calcPVal:
+        degreeBins.graphDegreeBins(interactions, loadArgs.numBins, loadArgs.binning)
+    del interactions
+
+    os.makedirs(outRoot, exist_ok=True)
+    rows = []
+    with open(os.path.join(outRoot, 'index.tsv'), 'w') as index, \
+            concurrent.futures.ProcessPoolExecutor(jobWorkers, initializer=initWorker,
+                                                   initargs=(loadArgs,)) as executor:
+        index.write('\t'.join(INDEX_COLUMNS) + '\n')
+        futures = {executor.submit(analyzeFile, args): args for args in jobs}
+        for future in concurrent.futures.as_completed(futures):
+            args = futures[future]
+            row = {'genesFile': args.genesFile, 'outDir': args.outDir}
+            try:
+                row.update(future.result(), status='done')
+            except Exception as e:
+                row.update(status='error', error=repr(e))
+            writeIndexRow(index, row)
+            rows.append(row)
+            print(row['status'], args.genesFile, '->', args.outDir, 'pval', row.get('pval', 'NA'))
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the analysis on every GMT file in directories or glob '
+                                                 'patterns. Other options are passed to main.py.')
+    parser.add_argument('inputs', nargs='+', help='GMT files, directories of GMT files or glob patterns')
+    parser.add_argument('--outDir', type=str, default='batch_output', help='directory the per file output '
+                                                                           'directories and index.tsv go in')
+    parser.add_argument('--jobWorkers', type=int, default=None, help='files analyzed at once, defaults to the CPU '
+                                                                     'count')
+    options, pipelineArgv = parser.parse_known_args()
+    genesFiles = findInputs(options.inputs)
+    if not genesFiles:
+        sys.exit('no GMT files found in ' + ' '.join(options.inputs))
+    rows = runBatch(genesFiles, pipelineArgv, options.outDir, options.jobWorkers)
+    if any(row['status'] != 'done' for row in rows):
+        sys.exit(1)
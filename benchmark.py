@@ -0,0 +1,302 @@
+# Purpose: Benchmark the pipeline stage by stage on synthetic data, so no real STRING file is needed.
+#   A synthetic STRING file is generated with a chosen node count and degree distribution, and a
+#   GMT file with a chosen number and size of loci drawn from its genes. Each stage is timed
+#   separately, the GA per phase, and the results are written as JSON so runs of different
+#   versions can be compared.
+#   distributions
+#       powerlaw    Chung-Lu graph with Pareto node weights, a few hubs like STRING
+#       uniform     every pair equally likely, Poisson degrees
+#       lognormal   Chung-Lu graph with lognormal node weights
+#
+#   python benchmark.py --nodes 20000 --meanDegree 30 --loci 12 --lociSize 40 --out bench.json
+#   python benchmark.py --nodes 20000 --meanDegree 30 --baseline bench.json
+
+import argparse, contextlib, json, os, platform, resource, shutil, subprocess, sys, tempfile, time, tracemalloc
+import numpy as np
+import networkCreation, fileParsing, geneScoring, geneticAlgorithm, statistics, nullDistribution, degreeBins, \
+    networkCache, stringParser, rendering
+
+DISTRIBUTIONS = ('powerlaw', 'uniform', 'lognormal')
+
+
+# @param numNodes: number of genes
+# @param distribution: one of DISTRIBUTIONS
+# @param rng: numpy Generator
+# @param exponent: power law exponent of the degree distribution
+# @returns weights: float array of the expected degree share of each gene
+def nodeWeights(numNodes, distribution, rng, exponent=2.5):
+    if distribution == 'powerlaw':
+        return rng.pareto(exponent - 1, numNodes) + 1
+    if distribution == 'uniform':
+        return np.ones(numNodes)
+    if distribution == 'lognormal':
+        return rng.lognormal(0, 1, numNodes)
+    raise ValueError('unknown degree distribution: ' + str(distribution))
+
+
+# Write a synthetic STRING file, every edge on two lines like the real file
+# @param stringFile: file to write
+# @param numNodes: number of genes, named G0, G1, ...
+# @param meanDegree: average number of edges per gene
+# @param distribution: one of DISTRIBUTIONS
+# @param rng: numpy Generator
+# @param exponent: power law exponent for the powerlaw distribution
+# @returns genes, numEdges: gene names and the number of distinct edges written
+def makeSyntheticString(stringFile, numNodes, meanDegree, distribution, rng, exponent=2.5):
+    genes = np.array(['G' + str(i) for i in range(numNodes)])
+    weights = nodeWeights(numNodes, distribution, rng, exponent)
+    p = weights/weights.sum()
+    numDraws = int(numNodes*meanDegree/2)
+    src = rng.choice(numNodes, numDraws, p=p)
+    dst = rng.choice(numNodes, numDraws, p=p)
+    keep = src != dst
+    pairs = np.unique(np.stack([np.minimum(src[keep], dst[keep]), np.maximum(src[keep], dst[keep])], axis=1), axis=0)
+    scores = rng.integers(150, 1000, len(pairs))/1000
+
+    with open(stringFile, 'w') as f:
+        for start in range(0, len(pairs), 100000):
+            block = pairs[start:start + 100000]
+            a, b = genes[block[:, 0]], genes[block[:, 1]]
+            s = np.char.mod('%.3f', scores[start:start + 100000])
+            lines = np.char.add(np.char.add(np.char.add(a, '\t'), np.char.add(b, '\t')), s)
+            back = np.char.add(np.char.add(np.char.add(b, '\t'), np.char.add(a, '\t')), s)
+            f.write('\n'.join(np.stack([lines, back], axis=1).ravel().tolist()) + '\n')
+    return genes.tolist(), len(pairs)
+
+
+# Write a synthetic GMT file of disjoint loci of genes from the STRING file
+# @param gmtFile: file to write
+# @param genes: gene names to draw from
+# @param numLoci: number of loci
+# @param lociSize: genes in each locus
+# @param rng: numpy Generator
+def makeSyntheticGmt(gmtFile, genes, numLoci, lociSize, rng):
+    if numLoci*lociSize > len(genes):
+        raise ValueError('not enough genes for ' + str(numLoci) + ' loci of ' + str(lociSize))
+    chosen = rng.choice(len(genes), numLoci*lociSize, replace=False)
+    with open(gmtFile, 'w') as f:
+        for l in range(numLoci):
+            lociGenes = [genes[g] for g in chosen[l*lociSize:(l + 1)*lociSize]]
+            f.write('\t'.join(['Synthetic locus ' + str(l), 'Locus for ' + lociGenes[0]] + lociGenes) + '\n')
+
+
+# Wall time and traced peak memory of named stages
+# @param traceMemory: bool of whether to trace peak Python/numpy allocations per stage, slows stages down
+class StageTimer:
+    def __init__(self, traceMemory=False):
+        self.traceMemory = traceMemory
+        self.stages = {}
+
+    # @param name: stage name
+    # @param seconds: time to add
+    # @param peakBytes: optional traced peak of the stage
+    def add(self, name, seconds, peakBytes=None):
+        stage = self.stages.setdefault(name, {'name': name, 'seconds': 0.0, 'calls': 0})
+        stage['seconds'] += seconds
+        stage['calls'] += 1
+        if peakBytes is not None:
+            stage['peakTracedBytes'] = max(stage.get('peakTracedBytes', 0), peakBytes)
+
+    # time the body as one call of stage name
+    @contextlib.contextmanager
+    def stage(self, name):
+        if self.traceMemory:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] - baseline if self.traceMemory else None
+            self.add(name, seconds, peak)
+
+    # Time every call of module.function as stage name while the body runs
+    # @param module: module the function is looked up in by its callers
+    # @param function: function name
+    # @param name: stage name
+    @contextlib.contextmanager
+    def timeCalls(self, module, function, name):
+        original = getattr(module, function)
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.add(name, time.perf_counter() - start)
+
+        setattr(module, function, timed)
+        try:
+            yield
+        finally:
+            setattr(module, function, original)
+
+    # @returns stages: list of stage dicts in the order they first ran
+    def results(self):
+        return list(self.stages.values())
+
+
+# @param workDir: directory the synthetic files are written to
+# @param args: parsed benchmark arguments
+# @returns report: dict of parameters, stage timings, memory and results
+def runBenchmark(workDir, args):
+    rng = np.random.default_rng(args.seed)
+    timer = StageTimer(args.tracemalloc)
+    if args.tracemalloc:
+        tracemalloc.start()
+    stringFile = os.path.join(workDir, 'STRING.txt')
+    gmtFile = os.path.join(workDir, 'Input.gmt')
+
+    with timer.stage('generate'):
+        genes, numEdges = makeSyntheticString(stringFile, args.nodes, args.meanDegree, args.distribution, rng,
+                                              args.exponent)
+        makeSyntheticGmt(gmtFile, genes, args.loci, args.lociSize, rng)
+
+    with timer.stage('parse'):
+        stringParser.readInteractions(stringFile)
+    with timer.stage('compileNetwork'):
+        networkCache.compileInteractionNetwork(stringFile)
+    with timer.stage('loadNetwork'):
+        interactions = networkCache.loadInteractionNetwork(stringFile)
+        lociLists = fileParsing.readLociIndex(gmtFile)
+
+    with timer.stage('makeNetwork'):
+        network = fileParsing.makeNetwork(lociLists, interactions)
+    if args.legacy:
+        with timer.stage('makeLociSubnetworks'):
+            lociSubN = networkCreation.makeLociSubnetworks(args.numSubnetworks, network, lociLists)
+        with timer.stage('getGeneScores'):
+            geneScoring.getGeneScores(lociSubN, lociLists, network)
+    with timer.stage('makeLociWeightMatrix'):
+        lociWeights = networkCreation.makeLociWeightMatrix(network, lociLists)
+    with timer.stage('makeLociGenomes'):
+        lociGenomes = networkCreation.makeLociGenomes(args.numSubnetworks, lociLists, rng)
+    with timer.stage('getGenomeGeneScores'):
+        scoreSums, scoreCounts = geneScoring.getGenomeGeneScores(lociGenomes, lociLists, lociWeights)
+        geneScoring.getGenomeGeneScoreAvg(scoreSums, scoreCounts, lociLists)
+
+    # GA phases are timed by wrapping the functions the generation loop calls
+    population = geneticAlgorithm.Population(lociGenomes, lociLists, lociWeights)
+    with contextlib.ExitStack() as phases:
+        phases.enter_context(timer.timeCalls(geneticAlgorithm, 'mutateGenomes', 'ga.mutation'))
+        phases.enter_context(timer.timeCalls(geneticAlgorithm, 'selectParents', 'ga.selection'))
+        phases.enter_context(timer.timeCalls(geneticAlgorithm, 'crossoverGenomes', 'ga.crossover'))
+        phases.enter_context(timer.timeCalls(statistics, 'calcGenomeEdgeDensityW', 'ga.fitness'))
+        phases.enter_context(timer.timeCalls(geneticAlgorithm, 'outputGenerationStats', 'ga.output'))
+        with timer.stage('geneticAlg'):
+            population = geneticAlgorithm.geneticAlgGenomes(population, rng, maxGenerations=args.maxGenerations)
+
+    with timer.stage('degreeBins'):
+        bins = degreeBins.graphDegreeBins(interactions, args.numBins)
+    with timer.stage('nullModel'):
+        nullModel = nullDistribution.NullModel.fromSubnetworks(interactions, bins, population.toSubnetworks())
+    with timer.stage('nullLoop'):
+        nullResult = nullDistribution.empiricalNullPVal(nullModel, population.totalDensity/len(population), args.seed,
+                                                        args.workers, maxPermutations=args.numPermutations)
+    if args.tracemalloc:
+        tracemalloc.stop()
+
+    usage, childUsage = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    rssUnit = 1 if sys.platform == 'darwin' else 1024
+    stages = timer.results()
+    return {'version': versionInfo(),
+            'parameters': vars(args),
+            'network': {'genes': len(interactions.genes), 'edges': numEdges},
+            'stages': stages,
+            'totalSeconds': sum(stage['seconds'] for stage in stages if '.' not in stage['name']),
+            'maxRSSBytes': usage.ru_maxrss*rssUnit,
+            'maxChildRSSBytes': childUsage.ru_maxrss*rssUnit,
+            'results': {'generations': timer.stages['ga.mutation']['calls'],
+                        'populationDensity': population.totalDensity/len(population),
+                        'pval': nullResult.pval, 'numPermutations': nullResult.numPermutations}}
+
+
+# @returns version: dict of the git commit and library versions the benchmark ran with
+def versionInfo():
+    commit = None
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return {'commit': commit, 'python': platform.python_version(), 'numpy': np.__version__,
+            'machine': platform.machine(), 'cpus': os.cpu_count()}
+
+
+# Print each stage's time against a baseline report
+# @param report: report from runBenchmark
+# @param baseline: report of an earlier run
+# @param threshold: ratio of time above which a stage counts as a regression
+# @returns regressions: names of stages slower than threshold times the baseline
+def compareReports(report, baseline, threshold=1.2):
+    before = {stage['name']: stage['seconds'] for stage in baseline['stages']}
+    regressions = []
+    print('%-22s %10s %10s %8s' % ('stage', 'baseline', 'seconds', 'ratio'))
+    for stage in report['stages']:
+        if stage['name'] not in before or before[stage['name']] == 0:
+            continue
+        ratio = stage['seconds']/before[stage['name']]
+        flag = ''
+        if ratio > threshold:
+            regressions.append(stage['name'])
+            flag = '  slower'
+        print('%-22s %10.4f %10.4f %7.2fx%s' % (stage['name'], before[stage['name']], stage['seconds'], ratio, flag))
+    return regressions
+
+
+def parseArgs(argv=None):
+    parser = argparse.ArgumentParser(description='Time the pipeline stages on a synthetic STRING network.')
+    parser.add_argument('--nodes', type=int, default=20000, help='genes in the synthetic STRING network')
+    parser.add_argument('--meanDegree', type=float, default=30, help='average edges per gene')
+    parser.add_argument('--distribution', type=str, default='powerlaw', choices=DISTRIBUTIONS)
+    parser.add_argument('--exponent', type=float, default=2.5, help='power law degree exponent')
+    parser.add_argument('--loci', type=int, default=12, help='number of loci in the synthetic GMT file')
+    parser.add_argument('--lociSize', type=int, default=40, help='genes in each locus')
+    parser.add_argument('--numSubnetworks', type=int, default=5000)
+    parser.add_argument('--maxGenerations', type=int, default=None, help='stop the GA after this many generations')
+    parser.add_argument('--numBins', type=int, default=128)
+    parser.add_argument('--numPermutations', type=int, default=100, help='most null populations to sample')
+    parser.add_argument('--workers', type=int, default=None, help='null model worker processes')
+    parser.add_argument('--seed', type=int, default=5)
+    parser.add_argument('--legacy', action='store_true', help='also time the dictionary makeLociSubnetworks and '
+                                                              'getGeneScores')
+    parser.add_argument('--tracemalloc', action='store_true', help='trace peak allocations of each stage, slower')
+    parser.add_argument('--workDir', type=str, default=None, help='keep the synthetic files here')
+    parser.add_argument('--out', type=str, default=None, help='write the JSON report here instead of stdout')
+    parser.add_argument('--baseline', type=str, default=None, help='JSON report to compare stage times against')
+    parser.add_argument('--threshold', type=float, default=1.2, help='slowdown ratio that counts as a regression')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parseArgs()
+    rendering.configure('none')
+    workDir = args.workDir
+    if workDir is None:
+        workDir = tempfile.mkdtemp()
+    os.makedirs(workDir, exist_ok=True)
+    # stages print progress and the GA writes its stats file to the working directory
+    startDir = os.getcwd()
+    os.chdir(workDir)
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            report = runBenchmark(workDir, args)
+    finally:
+        os.chdir(startDir)
+        if args.workDir is None:
+            shutil.rmtree(workDir)
+
+    if args.out is None:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            regressions = compareReports(report, json.load(f), args.threshold)
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,88 @@
+# Purpose: Checkpoints of long runs so a crashed or pre-empted job can resume where it stopped.
+#   A checkpoint file holds named sections, one per resumable stage (the GA population, the
+#   islands, the partial null distribution), each a small JSON state (random generator states,
+#   counters, exact running totals) and numpy arrays. Genomes are stored in the smallest integer
+#   type that holds their gene ids. The file is a single .npz written to a temporary file and
+#   renamed, so a crash while saving leaves the previous checkpoint intact.
+#   Resuming restores exactly what the stage had, so a resumed run gives the same results as one
+#   that was never stopped.
+
+import json, os, time
+import numpy as np
+
+CHECKPOINT_VERSION = 1
+
+
+# Sections of one run's checkpoint file
+# @param fileName: checkpoint file, .npz
+# @param runKey: string identifying the run's inputs and parameters, a checkpoint is only resumed
+#   by a run with the same key
+# @param interval: seconds between periodic saves, 0 to save at every chance
+class Checkpoint:
+    def __init__(self, fileName, runKey, interval=300):
+        self.fileName = fileName
+        self.runKey = runKey
+        self.interval = interval
+        self.sections = {}
+        self.lastSave = time.monotonic()
+
+    # Load the sections saved by an earlier run with the same key
+    # @param fileName: checkpoint file
+    # @param runKey: key of this run
+    # @param interval: seconds between periodic saves
+    # @returns checkpoint: Checkpoint with the saved sections, empty if the file does not exist
+    @classmethod
+    def resume(cls, fileName, runKey, interval=300):
+        checkpoint = cls(fileName, runKey, interval)
+        if not os.path.exists(fileName):
+            return checkpoint
+        with np.load(fileName) as data:
+            meta = json.loads(str(data['meta']))
+            if meta['version'] != CHECKPOINT_VERSION or meta['runKey'] != runKey:
+                raise ValueError(fileName + ' is a checkpoint of a different run or version')
+            for name, state in meta['sections'].items():
+                prefix = name + '.'
+                arrays = {key[len(prefix):]: data[key] for key in data.files if key.startswith(prefix)}
+                checkpoint.sections[name] = (state, arrays)
+        return checkpoint
+
+    # @param name: section name
+    # @returns state, arrays: the saved section, or None if it was not saved
+    def get(self, name):
+        return self.sections.get(name)
+
+    # @returns due: bool of whether the interval has passed since the last save
+    def due(self):
+        return time.monotonic() - self.lastSave >= self.interval
+
+    # Replace a section and write the checkpoint file
+    # @param name: section name
+    # @param state: JSON serializable dict
+    # @param arrays: dict of numpy arrays
+    def save(self, name, state, arrays):
+        self.sections[name] = (state, arrays)
+        meta = {'version': CHECKPOINT_VERSION, 'runKey': self.runKey,
+                'sections': {section: saved[0] for section, saved in self.sections.items()}}
+        files = {'meta': np.array(json.dumps(meta))}
+        for section, (sectionState, sectionArrays) in self.sections.items():
+            for key, array in sectionArrays.items():
+                files[section + '.' + key] = array
+        # write then rename so a partly written file is never loaded, the temporary name has the
+        # process id so runs sharing a checkpoint path never write the same temporary file
+        tempFile = self.fileName + '.' + str(os.getpid()) + '.tmp.npz'
+        try:
+            np.savez(tempFile, **files)
+            os.replace(tempFile, self.fileName)
+        finally:
+            if os.path.exists(tempFile):
+                os.remove(tempFile)
+        self.lastSave = time.monotonic()
+
+
+# @param genomes: int matrix of gene ids
+# @returns genomes: the same ids in the smallest unsigned type that holds them
+def compactGenomes(genomes):
+    genomes = np.asarray(genomes)
+    if genomes.size == 0:
+        return genomes.astype(np.uint8)
+    return genomes.astype(np.min_scalar_type(int(genomes.max())))
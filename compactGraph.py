@@ -0,0 +1,586 @@
+# Purpose: Compact integer-id graph shared by all modules. Gene names are interned to ids once
+#   and adjacency is stored CSR style as sorted numpy neighbor arrays with float weights.
+#   The graph also behaves like the old dict of dicts (gene in graph, graph[gene][gene2],
+#   len(graph[gene])) so existing code keeps working while hot paths use the id arrays.
+
+import collections
+from collections.abc import Mapping
+import numpy as np
+
+
+# Read-only dict view of one gene's neighbors, gene name: float weight
+class NeighborView(Mapping):
+    def __init__(self, graph, geneId):
+        self.graph = graph
+        self.geneId = geneId
+
+    def __getitem__(self, gene):
+        j = self.graph.geneIndex.get(gene)
+        if j is None:
+            raise KeyError(gene)
+        w = self.graph.weight(self.geneId, j, default=None)
+        if w is None:
+            raise KeyError(gene)
+        return w
+
+    def __contains__(self, gene):
+        j = self.graph.geneIndex.get(gene)
+        return j is not None and self.graph.hasEdge(self.geneId, j)
+
+    def __iter__(self):
+        genes = self.graph.genes
+        return (genes[j] for j in self.graph.neighborIds(self.geneId))
+
+    def __len__(self):
+        return int(self.graph.degrees[self.geneId])
+
+    def items(self):
+        genes = self.graph.genes
+        return [(genes[j], float(w)) for j, w in zip(self.graph.neighborIds(self.geneId),
+                                                     self.graph.neighborWeights(self.geneId))]
+
+
+# Gene interaction graph with interned gene ids
+# @param genes: list of gene names, index is the gene id
+# @param offsets: CSR row offsets of length len(genes) + 1
+# @param neighbors: neighbor ids, sorted within each row
+# @param weights: edge weights aligned with neighbors
+# @param geneIndex: optional dict of gene name: id, built from genes if not given
+class CompactGraph:
+    # file name prefix of the graph's arrays in a networkCache directory
+    storePrefix = ''
+
+    def __init__(self, genes, offsets, neighbors, weights, geneIndex=None):
+        self.genes = genes
+        self.offsets = offsets
+        self.neighbors = neighbors
+        self.weights = weights
+        if geneIndex is None:
+            geneIndex = {gene: i for i, gene in enumerate(genes)}
+        self.geneIndex = geneIndex
+        self.degrees = np.diff(np.asarray(offsets))
+        # networkCache directory the graph was loaded from, None for graphs built in memory
+        self.cacheDir = None
+
+    # @param interactions: dict of dicts gene: gene: weight from fileParsing.makeInteractionNetwork
+    # @returns graph: CompactGraph of the same network with float weights
+    @classmethod
+    def fromDict(cls, interactions):
+        geneIndex = {}
+        genes = []
+        for gene1 in interactions:
+            for gene in [gene1] + list(interactions[gene1]):
+                if gene not in geneIndex:
+                    geneIndex[gene] = len(genes)
+                    genes.append(gene)
+
+        src = []
+        dst = []
+        weight = []
+        for gene1 in interactions:
+            i = geneIndex[gene1]
+            for gene2, w in interactions[gene1].items():
+                src.append(i)
+                dst.append(geneIndex[gene2])
+                weight.append(float(w))
+        return cls.fromEdges(genes, src, dst, weight, geneIndex)
+
+    # When the same gene pair appears more than once the last edge wins, same as
+    # makeInteractionNetwork overwriting its dict entry
+    # @param genes: list of gene names
+    # @param src: first gene id of each directed edge
+    # @param dst: second gene id of each directed edge
+    # @param weight: weight of each directed edge
+    # @param geneIndex: optional dict of gene name: id
+    # @returns graph: CompactGraph with the given edges
+    @classmethod
+    def fromEdges(cls, genes, src, dst, weight, geneIndex=None):
+        offsets, neighbors, weights = buildCSR(len(genes), src, dst, weight)
+        return cls(genes, offsets, neighbors, weights, geneIndex)
+
+    def __len__(self):
+        return len(self.genes)
+
+    def __contains__(self, gene):
+        return gene in self.geneIndex
+
+    def __iter__(self):
+        return iter(self.genes)
+
+    def __getitem__(self, gene):
+        return NeighborView(self, self.geneIndex[gene])
+
+    def keys(self):
+        return list(self.genes)
+
+    # @param genes: iterable of gene names
+    # @returns ids: int array of gene ids, -1 for genes not in the graph
+    def ids(self, genes):
+        return np.array([self.geneIndex.get(g, -1) for g in genes], dtype=np.int64)
+
+    def neighborIds(self, i):
+        return self.neighbors[self.offsets[i]:self.offsets[i + 1]]
+
+    def neighborWeights(self, i):
+        return self.weights[self.offsets[i]:self.offsets[i + 1]]
+
+    # @param i: gene id
+    # @param j: gene id
+    # @param default: value returned when there is no edge
+    # @returns weight: float weight of edge i-j
+    def weight(self, i, j, default=0.0):
+        start = self.offsets[i]
+        end = self.offsets[i + 1]
+        pos = start + np.searchsorted(self.neighbors[start:end], j)
+        if pos < end and self.neighbors[pos] == j:
+            return float(self.weights[pos])
+        return default
+
+    def hasEdge(self, i, j):
+        return self.weight(i, j, default=None) is not None
+
+    # Genes within a number of hops of the given genes. Stored edges are followed both ways, so
+    # pairs listed in one direction only and the upper rows of a SymmetricGraph are covered.
+    # @param ids: int array of gene ids
+    # @param hops: number of edges away from ids to include
+    # @returns ids: sorted int array of gene ids within hops of ids, including ids
+    def neighborhood(self, ids, hops=1):
+        ids = np.asarray(ids, dtype=np.int64)
+        src = np.repeat(np.arange(len(self.genes), dtype=np.int32), np.diff(np.asarray(self.offsets)))
+        dst = np.asarray(self.neighbors)
+        reached = np.zeros(len(self.genes), dtype=bool)
+        reached[ids[ids >= 0]] = True
+        frontier = reached.copy()
+        for hop in range(hops):
+            if not frontier.any():
+                break
+            found = np.zeros(len(self.genes), dtype=bool)
+            found[dst[frontier[src]]] = True
+            found[src[frontier[dst]]] = True
+            frontier = found & ~reached
+            reached |= frontier
+        return np.flatnonzero(reached)
+
+    # Induced subgraph kernel, the one place edges inside gene sets are found.
+    # Every member's sorted neighbor row is matched against the sorted (set, gene) keys of the
+    # whole batch with searchsorted. When only totals are wanted and the sets share a small
+    # universe of genes, weights are read from a dense submatrix of that universe instead.
+    # @param idSets: numSets x setSize int array of gene ids, -1 entries are padding and a gene
+    #   repeated in a set counts once
+    # @param withEdges: bool to also return the edges inside each set
+    # @param denseLimit: largest gene universe read through a dense submatrix
+    # @param chunkEntries: neighbor entries gathered at once on the sparse path
+    # @returns totals: float array of the stored edge weight inside each set halved, so each
+    #   undirected edge counts once
+    # @returns edges: with withEdges, (setIds, src, dst, w) arrays of every stored edge inside a
+    #   set, ordered by set, then src, then dst
+    def inducedWeights(self, idSets, withEdges=False, denseLimit=1024, chunkEntries=1 << 22):
+        idSets = uniqueRows(np.atleast_2d(np.asarray(idSets, dtype=np.int64)))
+        numSets = len(idSets)
+        totals = np.zeros(numSets, dtype=np.float64)
+
+        if not withEdges:
+            universe = np.unique(idSets[idSets >= 0])
+            if len(universe) <= denseLimit:
+                # padding maps to an extra all-zero row and column
+                matrix = np.zeros((len(universe) + 1, len(universe) + 1), dtype=np.float64)
+                matrix[:-1, :-1] = self.denseWeights(universe)
+                local = np.where(idSets >= 0, np.searchsorted(universe, idSets), len(universe))
+                chunkSize = max(1, chunkEntries//max(1, idSets.shape[1]**2))
+                for start in range(0, numSets, chunkSize):
+                    chunk = local[start:start + chunkSize]
+                    pairWeights = matrix[chunk[:, :, None], chunk[:, None, :]]
+                    totals[start:start + chunkSize] = pairWeights.sum(axis=(1, 2))/2
+                return totals
+
+        edges = []
+        for start, end in self.degreeChunks(idSets, chunkEntries):
+            chunkTotals, chunkEdges = self.inducedChunk(idSets[start:end], withEdges)
+            totals[start:end] = chunkTotals
+            if withEdges:
+                edges.append((chunkEdges[0] + start,) + chunkEdges[1:])
+
+        if not withEdges:
+            return totals
+        if not edges:
+            empty = np.zeros(0, dtype=np.int64)
+            return totals, (empty, empty, empty, np.zeros(0, dtype=np.float32))
+        return totals, tuple(np.concatenate(parts) for parts in zip(*edges))
+
+    # Split a batch of sets so each chunk gathers about chunkEntries neighbors
+    # @param idSets: numSets x setSize int array of gene ids, -1 for padding
+    # @param chunkEntries: neighbor entries per chunk
+    # @returns chunks: list of (start, end) set ranges
+    def degreeChunks(self, idSets, chunkEntries):
+        setDegrees = np.where(idSets >= 0, self.degrees[np.maximum(idSets, 0)], 0).sum(axis=1)
+        cumulative = np.cumsum(setDegrees)
+        chunks = []
+        start = 0
+        while start < len(idSets):
+            before = cumulative[start - 1] if start > 0 else 0
+            end = max(start + 1, int(np.searchsorted(cumulative, before + chunkEntries, side='right')))
+            chunks.append((start, end))
+            start = end
+        return chunks
+
+    # Sparse path of inducedWeights for one chunk of sets
+    # @param idSets: numSets x setSize int array of gene ids from uniqueRows, -1 for padding
+    # @param withEdges: bool to also return the edges
+    # @returns totals, edges: as inducedWeights, edges is None without withEdges
+    def inducedChunk(self, idSets, withEdges):
+        # (set, member) keys are sorted since uniqueRows sorts each set
+        sets, cols = np.nonzero(idSets >= 0)
+        members = idSets[sets, cols]
+        numGenes = len(self.genes)
+        keys = sets*numGenes + members
+
+        # expand every member into its CSR neighbor row
+        offsets = np.asarray(self.offsets)
+        counts = offsets[members + 1] - offsets[members]
+        entry = np.repeat(np.arange(len(members)), counts)
+        rowStarts = np.cumsum(counts) - counts
+        idx = np.arange(int(counts.sum()), dtype=np.int64) - rowStarts[entry] + offsets[members][entry]
+        neighborKeys = sets[entry]*numGenes + np.asarray(self.neighbors)[idx]
+
+        pos = np.searchsorted(keys, neighborKeys)
+        pos[pos == len(keys)] = 0
+        hit = keys[pos] == neighborKeys if len(keys) > 0 else np.zeros(0, dtype=bool)
+        entry = entry[hit]
+        idx = idx[hit]
+        w = np.asarray(self.weights)[idx]
+        totals = np.bincount(sets[entry], weights=w, minlength=len(idSets))/2
+        if not withEdges:
+            return totals, None
+        return totals, (sets[entry], members[entry], np.asarray(self.neighbors)[idx].astype(np.int64), w)
+
+    # Edges between the given genes, each undirected edge is returned once per direction
+    # as stored in the graph
+    # @param ids: int array of gene ids
+    # @returns src, dst, w: arrays of the edges with both ends in ids
+    def inducedEdges(self, ids):
+        src, dst, w = self.inducedWeights(np.asarray(ids, dtype=np.int64)[None, :], withEdges=True)[1][1:]
+        return src, dst, w
+
+    # @param i: gene id
+    # @param ids: int array of gene ids
+    # @returns w, found: weights of edges from i to each of ids (0 if missing) and bool array
+    #   of which edges exist
+    def weightsTo(self, i, ids):
+        ids = np.asarray(ids)
+        row = self.neighborIds(i)
+        w = np.zeros(len(ids), dtype=np.float64)
+        if len(row) == 0:
+            return w, np.zeros(len(ids), dtype=bool)
+        pos = np.searchsorted(row, ids)
+        pos[pos == len(row)] = 0
+        found = (row[pos] == ids) & (ids >= 0)
+        w[found] = self.neighborWeights(i)[pos[found]]
+        return w, found
+
+    # Dense weight matrix between the given genes, only meant for small gene sets such as
+    # the loci network
+    # @param ids: int array of gene ids, -1 for genes with no edges
+    # @param missing: value for gene pairs with no edge
+    # @returns matrix: len(ids) x len(ids) float array of edge weights
+    def denseWeights(self, ids, missing=0.0):
+        ids = np.asarray(ids, dtype=np.int64)
+        matrix = np.full((len(ids), len(ids)), missing, dtype=np.float64)
+        src, dst, w = self.inducedEdges(ids)
+        # map gene ids back to positions in ids
+        present = np.flatnonzero(ids >= 0)
+        order = np.argsort(ids[present], kind='stable')
+        sortedIds = ids[present][order]
+        rows = present[order][np.searchsorted(sortedIds, src)]
+        cols = present[order][np.searchsorted(sortedIds, dst)]
+        matrix[rows, cols] = w
+        return matrix
+
+    # @param genes: list of gene names
+    # @returns network: dict of dicts gene: gene: float weight of the subgraph induced by genes,
+    #   genes not in the graph are kept with no edges
+    def subnetworkDict(self, genes):
+        return self.subnetworkDicts([genes])[0]
+
+    # Subnetwork dicts of many gene sets with one inducedWeights call
+    # @param geneSets: list of lists of gene names, sets can differ in size
+    # @returns networks: list of dict of dicts gene: gene: float weight, as subnetworkDict
+    def subnetworkDicts(self, geneSets):
+        networks = [{gene: {} for gene in genes} for genes in geneSets]
+        width = max([len(network) for network in networks] + [0])
+        idSets = np.full((len(networks), width), -1, dtype=np.int64)
+        for n, network in enumerate(networks):
+            idSets[n, :len(network)] = self.ids(network)
+        sets, src, dst, w = self.inducedWeights(idSets, withEdges=True)[1]
+        genes = self.genes
+        for n, i, j, weight in zip(sets.tolist(), src.tolist(), dst.tolist(), w.tolist()):
+            networks[n][genes[i]][genes[j]] = weight
+        return networks
+
+    # @param genes: list of gene names
+    # @returns graph: CompactGraph induced by genes with genes as its gene table, genes not
+    #   in this graph are kept with no edges
+    def subgraph(self, genes):
+        genes = list(dict.fromkeys(genes))
+        ids = self.ids(genes)
+        src, dst, w = self.inducedEdges(ids)
+        # map old ids to positions in the new gene table
+        present = ids >= 0
+        order = np.argsort(ids[present])
+        oldIds = ids[present][order]
+        newIds = np.flatnonzero(present)[order]
+        src = newIds[np.searchsorted(oldIds, src)]
+        dst = newIds[np.searchsorted(oldIds, dst)]
+        return CompactGraph.fromEdges(genes, src, dst, w)
+
+    # @returns numEdges: number of undirected edges, each is stored once per direction
+    def numEdges(self):
+        return len(self.neighbors)/2
+
+    # @returns total: sum of the undirected edge weights
+    def totalWeight(self):
+        return float(np.asarray(self.weights).sum(dtype=np.float64))/2
+
+    # @returns src, dst, w: arrays of every stored edge
+    def edgeArrays(self):
+        src = np.repeat(np.arange(len(self.genes), dtype=np.int64), self.degrees)
+        return src, np.asarray(self.neighbors), np.asarray(self.weights)
+
+    # @param keep: bool array aligned with edgeArrays() of which edges to keep
+    # @returns graph: CompactGraph with the same gene table and only the kept edges
+    def filterEdges(self, keep):
+        src, dst, w = self.edgeArrays()
+        return CompactGraph.fromEdges(self.genes, src[keep], dst[keep], w[keep], self.geneIndex)
+
+    # @returns interactions: dict of dicts view of the whole graph with float weights
+    def toDict(self):
+        return {gene: dict(self[gene].items()) for gene in self.genes}
+
+
+# Sort each row and replace repeated ids with -1 padding
+# @param idSets: numSets x setSize int array of gene ids, -1 for padding
+# @returns idSets: copy with the ids of each row ascending and each id once, repeats become -1
+def uniqueRows(idSets):
+    idSets = np.sort(idSets, axis=1)
+    if idSets.shape[1] > 1:
+        repeats = np.zeros(idSets.shape, dtype=bool)
+        repeats[:, 1:] = (idSets[:, 1:] == idSets[:, :-1]) & (idSets[:, 1:] >= 0)
+        idSets[repeats] = -1
+    return idSets
+
+
+# Gene interaction graph storing each undirected edge once, in the row of its lower gene id.
+# Self-loops are not stored. Weights are looked up symmetrically with a binary search in the
+# lower gene's row. Neighbors with a lower id are found through a transposed index that is only
+# built the first time full neighbor lists are asked for (one edge position per stored pair), so
+# graphs used through inducedWeights and weightsTo keep half the memory.
+# @param genes: list of gene names, index is the gene id
+# @param offsets: CSR row offsets of the upper triangle
+# @param neighbors: higher neighbor ids, sorted within each row
+# @param weights: edge weights aligned with neighbors
+# @param geneIndex: optional dict of gene name: id, built from genes if not given
+class SymmetricGraph(CompactGraph):
+    storePrefix = 'symmetric-'
+
+    def __init__(self, genes, offsets, neighbors, weights, geneIndex=None):
+        super().__init__(genes, offsets, neighbors, weights, geneIndex)
+        self.degrees = self.degrees + np.bincount(np.asarray(neighbors), minlength=len(genes))
+        self.lowerOffsets = None
+        self.lowerPositions = None
+
+    # When the same gene pair appears more than once, in either direction, the last edge wins
+    @classmethod
+    def fromEdges(cls, genes, src, dst, weight, geneIndex=None):
+        offsets, neighbors, weights = buildUpperCSR(len(genes), src, dst, weight)
+        return cls(genes, offsets, neighbors, weights, geneIndex)
+
+    # Transposed index of the upper triangle, the edge positions of each gene's lower neighbors
+    # in row order. Lower neighbor ids are found from the positions, so only the positions are kept.
+    def buildLowerIndex(self):
+        neighbors = np.asarray(self.neighbors)
+        dtype = np.int32 if len(neighbors) < 2**31 else np.int64
+        self.lowerPositions = np.argsort(neighbors, kind='stable').astype(dtype)
+        self.lowerOffsets = np.zeros(len(self.genes) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(neighbors, minlength=len(self.genes)), out=self.lowerOffsets[1:])
+
+    # @param i: gene id
+    # @returns positions: int array of the edge positions of gene i in the rows of lower genes
+    def lowerEdgePositions(self, i):
+        if self.lowerOffsets is None:
+            self.buildLowerIndex()
+        return self.lowerPositions[self.lowerOffsets[i]:self.lowerOffsets[i + 1]]
+
+    def neighborIds(self, i):
+        positions = self.lowerEdgePositions(i)
+        lower = np.searchsorted(np.asarray(self.offsets), positions, side='right') - 1
+        return np.concatenate((lower.astype(self.neighbors.dtype), self.neighbors[self.offsets[i]:self.offsets[i + 1]]))
+
+    def neighborWeights(self, i):
+        positions = self.lowerEdgePositions(i)
+        return np.concatenate((np.asarray(self.weights)[positions], self.weights[self.offsets[i]:self.offsets[i + 1]]))
+
+    def weight(self, i, j, default=0.0):
+        return super().weight(min(i, j), max(i, j), default)
+
+    def weightsTo(self, i, ids):
+        ids = np.asarray(ids, dtype=np.int64)
+        valid = ids >= 0
+        rows = np.where(valid, np.minimum(ids, i), 0)
+        pos, found = searchRows(self.offsets, self.neighbors, rows, np.maximum(ids, i))
+        found &= valid
+        w = np.zeros(len(ids), dtype=np.float64)
+        w[found] = np.asarray(self.weights)[pos[found]]
+        return w, found
+
+    # Upper rows only, so each undirected edge inside a set is found once. Edges are returned
+    # in both directions to match CompactGraph.
+    def inducedChunk(self, idSets, withEdges):
+        totals, edges = super().inducedChunk(idSets, True)
+        totals = totals*2
+        if not withEdges:
+            return totals, None
+        sets, src, dst, w = edges
+        sets, src, dst, w = (np.concatenate((sets, sets)), np.concatenate((src, dst)), np.concatenate((dst, src)),
+                             np.concatenate((w, w)))
+        order = np.lexsort((dst, src, sets))
+        return totals, (sets[order], src[order], dst[order], w[order])
+
+    def numEdges(self):
+        return len(self.neighbors)
+
+    def totalWeight(self):
+        return float(np.asarray(self.weights).sum(dtype=np.float64))
+
+    def edgeArrays(self):
+        src = np.repeat(np.arange(len(self.genes), dtype=np.int64), np.diff(np.asarray(self.offsets)))
+        dst = np.asarray(self.neighbors, dtype=np.int64)
+        w = np.asarray(self.weights)
+        return np.concatenate((src, dst)), np.concatenate((dst, src)), np.concatenate((w, w))
+
+
+# Counts of input edges that a symmetric store would silently merge or drop
+#   numPairs    distinct gene pairs of two different genes
+#   duplicated  edges repeating an earlier gene1 gene2 line
+#   oneWay      gene pairs listed in only one direction
+#   mismatched  gene pairs whose two directions have different weights
+#   selfLoops   genes with an edge to themselves, not kept by the symmetric store
+#   examples    a few (gene1, gene2, problem) tuples
+EdgeReport = collections.namedtuple('EdgeReport', ['numEdges', 'numPairs', 'duplicated', 'oneWay', 'mismatched',
+                                                   'selfLoops', 'examples'])
+
+
+# @param genes: list of gene names
+# @param src: int array of first gene ids
+# @param dst: int array of second gene ids
+# @param weight: float array of edge weights
+# @param maxExamples: most example pairs to keep
+# @returns report: EdgeReport of the input edges
+def checkSymmetry(genes, src, dst, weight, maxExamples=5):
+    src = np.asarray(src, dtype=np.int64)
+    dst = np.asarray(dst, dtype=np.int64)
+    weight = np.asarray(weight, dtype=np.float64)
+    low = np.minimum(src, dst)
+    high = np.maximum(src, dst)
+    reverse = src > dst
+
+    # group by pair and direction, input order kept inside each group
+    order = np.lexsort((reverse, high, low))
+    low, high, reverse, weight = low[order], high[order], reverse[order], weight[order]
+    newDirection = np.ones(len(low), dtype=bool)
+    newDirection[1:] = (low[1:] != low[:-1]) | (high[1:] != high[:-1]) | (reverse[1:] != reverse[:-1])
+    newPair = np.ones(len(low), dtype=bool)
+    newPair[1:] = (low[1:] != low[:-1]) | (high[1:] != high[:-1])
+
+    # last edge of each direction, then pairs with one or two directions
+    lastOfDirection = np.ones(len(low), dtype=bool)
+    lastOfDirection[:-1] = newDirection[1:]
+    directionStarts = np.flatnonzero(lastOfDirection)
+    directionPair = np.cumsum(newPair)[directionStarts] - 1
+    directionsPerPair = np.bincount(directionPair, minlength=int(newPair.sum()))
+    # a self-loop has a single direction but is not a one way pair
+    pairRows = np.flatnonzero(newPair)
+    loops = low[pairRows] == high[pairRows]
+    oneWay = np.flatnonzero((directionsPerPair == 1) & ~loops)
+    twoWay = np.flatnonzero(directionsPerPair == 2)
+    pairFirst = np.searchsorted(directionPair, twoWay)
+    mismatched = twoWay[weight[directionStarts[pairFirst]] != weight[directionStarts[pairFirst + 1]]]
+    duplicated = ~newDirection
+
+    examples = []
+    for rows, problem in ((np.flatnonzero(duplicated), 'duplicated'), (pairRows[oneWay], 'one way'),
+                          (pairRows[mismatched], 'mismatched weights'), (pairRows[loops], 'self loop')):
+        for r in rows[:maxExamples - len(examples)].tolist():
+            examples.append((genes[low[r]], genes[high[r]], problem))
+    return EdgeReport(len(src), int((~loops).sum()), int(duplicated.sum()), len(oneWay), len(mismatched),
+                      int(loops.sum()), examples)
+
+
+# Binary search of each value in its own sorted CSR row, all rows at once
+# @param offsets: CSR row offsets
+# @param neighbors: CSR neighbor ids, sorted within each row
+# @param rows: int array of row ids
+# @param values: int array of the neighbor id to find in each row
+# @returns positions, found: int array of positions in neighbors and bool array of which values were found
+def searchRows(offsets, neighbors, rows, values):
+    offsets = np.asarray(offsets)
+    neighbors = np.asarray(neighbors)
+    low = offsets[rows]
+    high = offsets[np.asarray(rows) + 1]
+    end = high
+    active = low < high
+    while active.any():
+        middle = (low + high)//2
+        smaller = active & (neighbors[np.where(active, middle, 0)] < values)
+        low = np.where(smaller, middle + 1, low)
+        high = np.where(active & ~smaller, middle, high)
+        active = low < high
+    found = low < end
+    found[found] = neighbors[low[found]] == values[found]
+    return low, found
+
+
+# Build upper triangle CSR arrays from edge arrays in either or both directions, keeping the
+# last edge of any gene pair. Self-loops are dropped, each is one direction of one gene and
+# would otherwise be counted twice by SymmetricGraph.
+# @param numGenes: number of interned genes
+# @param src: int array of first gene ids
+# @param dst: int array of second gene ids
+# @param weight: float array of edge weights
+# @returns offsets, neighbors, weights: CSR arrays of the pairs, neighbors sorted in each row
+def buildUpperCSR(numGenes, src, dst, weight):
+    src = np.asarray(src, dtype=np.int64)
+    dst = np.asarray(dst, dtype=np.int64)
+    keep = src != dst
+    return buildCSR(numGenes, np.minimum(src, dst)[keep], np.maximum(src, dst)[keep], np.asarray(weight)[keep])
+
+
+# Build CSR arrays from parallel edge arrays, keeping the last of any duplicated pair
+# @param numGenes: number of interned genes
+# @param src: int array of first gene ids
+# @param dst: int array of second gene ids
+# @param weight: float array of edge weights
+# @returns offsets, neighbors, weights: CSR arrays with neighbors sorted in each row
+def buildCSR(numGenes, src, dst, weight):
+    src = np.asarray(src, dtype=np.int64)
+    dst = np.asarray(dst, dtype=np.int32)
+    weight = np.asarray(weight, dtype=np.float32)
+
+    # stable sort so duplicates keep input order, then keep the last of each pair
+    order = np.lexsort((dst, src))
+    src, dst, weight = src[order], dst[order], weight[order]
+    if len(src) > 0:
+        last = np.ones(len(src), dtype=bool)
+        last[:-1] = (src[1:] != src[:-1]) | (dst[1:] != dst[:-1])
+        src, dst, weight = src[last], dst[last], weight[last]
+
+    offsets = np.zeros(numGenes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=numGenes), out=offsets[1:])
+    return offsets, dst, weight
+
+
+# Compatibility layer so modules can take either representation
+# @param network: CompactGraph or dict of dicts gene: gene: weight
+# @returns graph: CompactGraph of network
+def asCompactGraph(network):
+    if isinstance(network, CompactGraph):
+        return network
+    return CompactGraph.fromDict(network)
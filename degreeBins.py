@@ -0,0 +1,135 @@
+# Purpose: Bin network nodes by degree for co-functional node sampling. Bins are computed from a
+#   degree array in numpy and stored compactly as a bin number per node plus the nodes grouped
+#   bin by bin with offsets, instead of lists of node names.
+#   Bins of the STRING network are cached in its networkCache directory so repeated p-value
+#   runs load them instead of recomputing them.
+#   strategies
+#       fixed       equal width degree ranges from 0 to the largest degree
+#       quantile    equal numbers of nodes, in degree order
+#       log         log spaced degree ranges, narrow for low degrees and wide for hubs
+
+import os
+import numpy as np
+
+STRATEGIES = ('fixed', 'quantile', 'log')
+
+
+# Nodes binned by degree
+# @param assignment: int array of the bin of each node id
+# @param order: node ids grouped by bin, sorted by degree inside each bin
+# @param offsets: bin b is order[offsets[b]:offsets[b+1]]
+# @param strategy: binning strategy the bins were made with
+class DegreeBins:
+    def __init__(self, assignment, order, offsets, strategy):
+        self.assignment = assignment
+        self.order = order
+        self.offsets = offsets
+        self.strategy = strategy
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def sizes(self):
+        return np.diff(self.offsets)
+
+    # @param b: bin number
+    # @returns ids: node ids in bin b, lowest degree first
+    def binMembers(self, b):
+        return self.order[self.offsets[b]:self.offsets[b + 1]]
+
+    # @param genes: gene name of each node id
+    # @returns fullNetworkBins: list of lists of gene names in each bin, as from makeFixedBins
+    def toLists(self, genes):
+        return [[genes[i] for i in self.binMembers(b)] for b in range(len(self))]
+
+
+# @param degrees: int array of the degree of each node
+# @param numBins: number of bins
+# @param strategy: one of STRATEGIES
+# @returns assignment: int array of the bin of each node
+def assignBins(degrees, numBins, strategy='quantile'):
+    degrees = np.asarray(degrees, dtype=np.int64)
+    if numBins < 1:
+        raise ValueError('numBins must be at least 1')
+    maxDegree = int(degrees.max()) if len(degrees) > 0 else 0
+    if maxDegree == 0 and strategy in ('fixed', 'log'):
+        return np.zeros(len(degrees), dtype=np.int32)
+
+    if strategy == 'quantile':
+        if len(degrees) == 0:
+            return np.zeros(0, dtype=np.int32)
+        # rank in degree order, numBins equal slices with every node in one
+        ranks = np.empty(len(degrees), dtype=np.int64)
+        ranks[np.argsort(degrees, kind='stable')] = np.arange(len(degrees))
+        assignment = ranks*numBins//len(degrees)
+    elif strategy == 'fixed':
+        edges = np.linspace(0, maxDegree, numBins + 1)[1:-1]
+        assignment = np.digitize(degrees, edges, right=False)
+    elif strategy == 'log':
+        edges = np.geomspace(1, maxDegree + 1, numBins + 1)[1:-1]
+        assignment = np.digitize(degrees + 1, edges, right=False)
+    else:
+        raise ValueError('unknown binning strategy: ' + str(strategy))
+    return np.minimum(assignment, numBins - 1).astype(np.int32)
+
+
+# @param degrees: int array of the degree of each node
+# @param numBins: number of bins
+# @param strategy: one of STRATEGIES
+# @returns bins: DegreeBins of the nodes
+def makeDegreeBins(degrees, numBins, strategy='quantile'):
+    degrees = np.asarray(degrees, dtype=np.int64)
+    assignment = assignBins(degrees, numBins, strategy)
+    # sort by degree, then stable sort by bin keeps degree order inside each bin
+    byDegree = np.argsort(degrees, kind='stable')
+    order = byDegree[np.argsort(assignment[byDegree], kind='stable')]
+    offsets = np.zeros(numBins + 1, dtype=np.int64)
+    np.cumsum(np.bincount(assignment, minlength=numBins), out=offsets[1:])
+    return DegreeBins(assignment, order.astype(np.int64), offsets, strategy)
+
+
+# @param cacheDir: network cache directory
+# @param numBins: number of bins
+# @param strategy: one of STRATEGIES
+# @param prefix: file name prefix of the graph's store in the cache, degrees differ between stores
+# @returns binsFile: file the bins are cached in
+def binsFile(cacheDir, numBins, strategy, prefix=''):
+    return os.path.join(cacheDir, prefix + 'bins-' + strategy + '-' + str(numBins) + '.npz')
+
+
+# Degree bins of a graph, loaded from the graph's network cache when it has one
+# @param graph: CompactGraph, from networkCache if the bins should be cached
+# @param numBins: number of bins
+# @param strategy: one of STRATEGIES
+# @returns bins: DegreeBins of the graph's nodes
+def graphDegreeBins(graph, numBins, strategy='quantile'):
+    cacheDir = graph.cacheDir
+    if cacheDir is None:
+        return makeDegreeBins(graph.degrees, numBins, strategy)
+
+    fileName = binsFile(cacheDir, numBins, strategy, graph.storePrefix)
+    if os.path.exists(fileName):
+        with np.load(fileName) as data:
+            if len(data['assignment']) == len(graph.genes):
+                return DegreeBins(data['assignment'], data['order'], data['offsets'], strategy)
+
+    bins = makeDegreeBins(graph.degrees, numBins, strategy)
+    # write then rename so a partly written file is never loaded, the temporary name has the
+    # process id since workers and other runs may compute the same bins at once
+    tempFile = fileName + '.' + str(os.getpid()) + '.tmp.npz'
+    try:
+        np.savez(tempFile, assignment=bins.assignment, order=bins.order, offsets=bins.offsets)
+        os.replace(tempFile, fileName)
+    finally:
+        if os.path.exists(tempFile):
+            os.remove(tempFile)
+    return bins
+
+
+# Remove cached bins, for when the network cache is recompiled
+# @param cacheDir: network cache directory
+def clearCachedBins(cacheDir):
+    for fileName in os.listdir(cacheDir):
+        if 'bins-' in fileName and fileName.endswith('.npz'):
+            os.remove(os.path.join(cacheDir, fileName))
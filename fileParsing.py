@@ -2,8 +2,12 @@
 # Date: September 29, 2021
 # Purpose: get data from input and STRING files
 
-import operator
+import io, operator
 from functools import reduce
+import numpy as np
+from compactGraph import CompactGraph, SymmetricGraph
+from lociIndex import LociIndex, asLociIndex
+import networkCache, stringParser
 
 
 # assumptions:
@@ -18,7 +22,7 @@ from functools import reduce
 #   only known gene interactions and given genes
 #
 #   Returns a list of genes.
-#   Expects a .txt tab-delimited file as input.
+#   Expects a .txt tab-delimited file as input, optionally gzip or zstd compressed like the STRING file.
 #   First two columns in file rows are discarded
 #
 #   @param fileIn file with genes to be read in
@@ -27,8 +31,8 @@ from functools import reduce
 def readInput(fileIn, asLoci=True):
     # read in GMT file
     # separate file into list by tabs
-    fI = open(fileIn, 'r')
-    genes = fI.read().strip().split('\n')
+    with io.TextIOWrapper(stringParser.openStringFile(fileIn)) as fI:
+        genes = fI.read().strip().split('\n')
     genes = [g.split('\t') for g in genes]
 
     # Delete first two columns
@@ -44,6 +48,15 @@ def readInput(fileIn, asLoci=True):
     return genes
 
 
+#   Returns a LociIndex of the loci in the input file, built once and passed to every
+#   module in place of the loci lists.
+#
+#   @param fileIn file with genes to be read in
+#   @return lociIndex LociIndex of the loci genes
+def readLociIndex(fileIn):
+    return LociIndex(readInput(fileIn))
+
+
 # assumptions:
 #   input is organized as protein'\t'protein'\t'weight'\n'
 #   protein1:protein2:weight is also represented in the list as protein2:protein1:weight
@@ -70,20 +83,84 @@ def makeInteractionNetwork(stringFile):
     return interactions
 
 
-#   @param   genes list of genes to check interactions for (gotten from readInput(file))
+#   Returns the STRING network as a CompactGraph with integer gene ids and float weights.
+#   By default the network is memory-mapped from the binary cache made by networkCache,
+#   compiling it on the first run.
+#
+#   The STRING file may have a header, space delimiters, 0-1000 integer scores and gzip or zstd
+#   compression, see stringParser. Edges can be filtered while the file is read.
+#
+#   @param   stringFile STRING file of protein-protein interactions
+#   @param   useCache bool of whether to use the binary cache or parse the text file
+#   @param   minScore optional lowest score to keep, in the file's units
+#   @param   genes optional gene whitelist, only edges between two of them are kept
+#   @param   symmetric bool to store each gene pair once as a SymmetricGraph, half the memory
+#   @returns interactions CompactGraph of protein interactions
+def makeCompactInteractionNetwork(stringFile, useCache=True, minScore=None, genes=None, symmetric=False):
+    if useCache:
+        return networkCache.loadInteractionNetwork(stringFile, minScore=minScore, genes=genes, symmetric=symmetric)
+    geneNames, src, dst, weight = networkCache.parseInteractions(stringFile, minScore, genes)
+    graphClass = SymmetricGraph if symmetric else CompactGraph
+    return graphClass.fromEdges(geneNames, src, dst, weight)
+
+
+#   Returns the STRING network as a sparseNetwork.SparseNetwork, a CompactGraph backed by a
+#   scipy.sparse matrix. scipy is only imported when this backend is used.
+#
+#   @param   stringFile STRING file of protein-protein interactions
+#   @param   minScore optional lowest score to keep, in the file's units
+#   @param   genes optional gene whitelist, only edges between two of them are kept
+#   @returns interactions SparseNetwork of protein interactions
+def makeSparseInteractionNetwork(stringFile, minScore=None, genes=None):
+    import sparseNetwork
+    return sparseNetwork.loadSparseNetwork(stringFile, minScore=minScore, genes=genes)
+
+
+#   Returns the network between the input genes. Each gene's STRING neighbors are checked
+#   against a set of the input genes, so the cost is the number of STRING edges touching the
+#   input genes rather than the square of the number of genes. If interactionsNetwork is a
+#   CompactGraph the result is a CompactGraph whose gene table is the input genes.
+#
+#   With partition the edges are also split into edges between genes of the same locus and
+#   edges between genes of different loci, returned as two networks of the same type.
+#
+#   @param   genes LociIndex or list of loci lists of genes to check interactions for (gotten from readInput(file))
 #   @param   interactionsNetwork dict of protein-protein interactions from makeInteractionNetwork(stringFile)
+#            or CompactGraph from makeCompactInteractionNetwork(stringFile)
+#   @param   partition bool of whether to also return the intra-locus and inter-locus networks
 #   @returns geneInteractions dict of gene interactions from input GMT file
-def makeNetwork(genes, interactionsNetwork):
+#            (geneInteractions, intraLoci, interLoci) if partition
+def makeNetwork(genes, interactionsNetwork, partition=False):
+    # locus of each gene, first locus wins if a gene is listed twice
+    geneLoci = asLociIndex(genes).geneLocus
+
+    if isinstance(interactionsNetwork, CompactGraph):
+        geneInteractions = interactionsNetwork.subgraph(list(geneLoci))
+        if not partition:
+            return geneInteractions
+        lociIds = np.array(list(geneLoci.values()), dtype=np.int64)
+        src, dst, w = geneInteractions.edgeArrays()
+        sameLoci = lociIds[src] == lociIds[dst]
+        return geneInteractions, geneInteractions.filterEdges(sameLoci), geneInteractions.filterEdges(~sameLoci)
+
     geneInteractions = {}
-    genes = reduce(operator.add, genes)
-    for gene1 in genes:
+    intraLoci = {}
+    interLoci = {}
+    for gene1 in geneLoci:
         # input gene1 check if connected to any other gene
         geneInteractions[gene1] = {}
+        intraLoci[gene1] = {}
+        interLoci[gene1] = {}
         if gene1 in interactionsNetwork:
-            for gene2 in genes:
-                if gene2 in interactionsNetwork[gene1]:
-                    if gene2 in genes:
-                        # make sure not to duplicate edges
-                        #if gene1 not in geneInteractions[gene2]:
-                        geneInteractions[gene1][gene2] = interactionsNetwork[gene1][gene2]
-    return geneInteractions
\ No newline at end of file
+            for gene2, weight in interactionsNetwork[gene1].items():
+                if gene2 in geneLoci:
+                    geneInteractions[gene1][gene2] = weight
+                    if partition:
+                        if geneLoci[gene1] == geneLoci[gene2]:
+                            intraLoci[gene1][gene2] = weight
+                        else:
+                            interLoci[gene1][gene2] = weight
+
+    if partition:
+        return geneInteractions, intraLoci, interLoci
+    return geneInteractions
@@ -5,15 +5,23 @@
 #   gene scores are then averaged to get one gene score. This score indicates relative connectivity to
 #   genes in other loci
 
+import numpy as np
+from compactGraph import CompactGraph
+from lociIndex import asLociIndex
+import statistics
+
 
 # Calculate gene scores for each gene for each subnetwork
 # Assumption: each gene only appears once in one locus
 # genes cant be connected to themselves
 # @param lociSubNs: List of dictionaries of subnetworks
-# @param lociLists: list of list of genes separated by loci
-# @param interactions: dictionary of genes and their edges
+# @param lociLists: LociIndex or list of list of genes separated by loci
+# @param interactions: dictionary of genes and their edges or CompactGraph
 # @returns geneScores: dictionary of genes and the list of gene scores calculated from each subnetwork
 def getGeneScores(lociSubNs, lociL, interactions):
+    lociL = asLociIndex(lociL)
+    if isinstance(interactions, CompactGraph):
+        return getCompactGeneScores(lociSubNs, lociL, interactions)
     geneScores = {}
 
     # get subNetwork
@@ -21,10 +29,7 @@ def getGeneScores(lociSubNs, lociL, interactions):
         # pick a gene from a loci
         for lociGene in subN:
             # figure out which loci it comes from
-            for l in lociL:
-                if lociGene in l:
-                    loci = l
-                    break
+            loci = lociL.lociOf(lociGene)
 
             # get all the genes in the specified loci
             for gene in loci:
@@ -47,6 +52,170 @@ def getGeneScores(lociSubNs, lociL, interactions):
     return geneScores
 
 
+# getGeneScores on a CompactGraph. The weights between all loci genes are looked up once
+# into a dense matrix so scoring a subnetwork is array indexing instead of dict lookups
+# @param lociSubNs: List of dictionaries of subnetworks
+# @param lociLists: LociIndex of the loci genes
+# @param interactions: CompactGraph of genes and their edges
+# @returns geneScores: dictionary of genes and the list of gene scores calculated from each subnetwork
+def getCompactGeneScores(lociSubNs, lociL, interactions):
+    geneScores = {}
+    weights = interactions.denseWeights(interactions.ids(lociL.genes), missing=np.nan)
+
+    for subN in lociSubNs:
+        subGenes = list(subN)
+        subCols = np.array([lociL.geneIds[gene] for gene in subGenes])
+        for col, lociGene in enumerate(subGenes):
+            l = lociL.locusOf(lociGene)
+            loci = [lociL.genes[i] for i in lociL.lociGenes[l]]
+
+            # same as getGeneScores, score is the weight of the last edge found
+            others = np.delete(subCols, col)
+            block = weights[np.ix_(lociL.lociGenes[l], others)]
+            found = ~np.isnan(block)
+            last = block.shape[1] - 1 - np.argmax(found[:, ::-1], axis=1)
+            scores = np.where(found.any(axis=1), block[np.arange(len(block)), last], 0.0)
+
+            for gene, geneS in zip(loci, scores.tolist()):
+                if gene in geneScores:
+                    geneScores[gene].append(geneS)
+                else:
+                    geneScores[gene] = [geneS]
+
+    return geneScores
+
+
+# Gene scores of every loci gene for a block of genomes. Since a genome has one gene per locus and
+# lociWeights has no edges inside a locus, the edges from a candidate gene to its whole genome are
+# the edges to the genes of the other loci.
+# modes:
+#   'sum'  total weight of the edges the gene adds to the subnetwork
+#   'max'  weight of the strongest edge the gene adds
+#   'last' weight of the last edge found in locus order, what getGeneScores computes
+# @param genomes: numNetworks x numLoci int matrix of LociIndex gene ids
+# @param lociWeights: numGenes x numGenes inter-locus weight matrix from networkCreation.makeLociWeightMatrix
+# @param mode: 'sum', 'max' or 'last'
+# @returns scores: numGenes x numNetworks float array of gene scores
+def scoreGenomeBlock(genomes, lociWeights, mode='sum'):
+    edges = lociWeights[:, genomes]
+    if mode == 'sum':
+        return edges.sum(axis=2, dtype=np.float64)
+    if mode == 'max':
+        return edges.max(axis=2).astype(np.float64)
+    if mode == 'last':
+        found = edges != 0
+        last = edges.shape[2] - 1 - np.argmax(found[:, :, ::-1], axis=2)
+        return np.take_along_axis(edges, last[:, :, None], axis=2)[:, :, 0].astype(np.float64)
+    raise ValueError('unknown gene score mode: ' + str(mode))
+
+
+# Matrix version of getGeneScores. Every loci gene is scored against every genome with numpy gathers
+# and only the running sum and count of each gene's scores are kept.
+# @param genomes: numNetworks x numLoci int matrix from networkCreation.makeLociGenomes
+# @param lociLists: LociIndex or list of list of genes separated by loci
+# @param lociWeights: inter-locus weight matrix from networkCreation.makeLociWeightMatrix
+# @param mode: 'sum', 'max' or 'last', see scoreGenomeBlock
+# @param chunkSize: number of genomes gathered at once
+# @returns scoreSums, counts: float arrays indexed by LociIndex gene id
+def getGenomeGeneScores(genomes, lociLists, lociWeights, mode='sum', chunkSize=1024):
+    lociIndex = asLociIndex(lociLists)
+    genomes = np.asarray(genomes)
+    counts = np.full(lociIndex.numGenes, len(genomes), dtype=np.int64)
+
+    if mode == 'sum':
+        # summed over genomes the score is the weight to every time a gene was picked
+        picked = np.bincount(genomes.ravel(), minlength=lociIndex.numGenes)
+        scoreSums = lociWeights.astype(np.float64) @ picked
+        return scoreSums, counts
+
+    scoreSums = np.zeros(lociIndex.numGenes, dtype=np.float64)
+    for start in range(0, len(genomes), chunkSize):
+        scoreSums += scoreGenomeBlock(genomes[start:start + chunkSize], lociWeights, mode).sum(axis=1)
+    return scoreSums, counts
+
+
+# @param scoreSums: float array of summed gene scores indexed by LociIndex gene id
+# @param counts: number of scores summed for each gene
+# @param lociLists: LociIndex or list of list of genes separated by loci
+# @returns geneSAvg: dictionary of average gene score for each gene
+def getGenomeGeneScoreAvg(scoreSums, counts, lociLists):
+    lociIndex = asLociIndex(lociLists)
+    avg = scoreSums/np.maximum(counts, 1)
+    return dict(zip(lociIndex.genes, avg.tolist()))
+
+
+# Streaming gene scores. Genomes are added in batches and each gene's count, mean and variance
+# are updated in place so memory stays O(genes) however many subnetworks are scored.
+# @param lociLists: LociIndex or list of list of genes separated by loci
+# @param lociWeights: inter-locus weight matrix from networkCreation.makeLociWeightMatrix
+# @param mode: 'sum', 'max' or 'last', see scoreGenomeBlock
+# @param reservoirSize: samples kept per gene for quantiles, 0 for none
+# @param rng: numpy Generator or seed for the reservoir
+class GeneScoreAccumulator:
+    def __init__(self, lociLists, lociWeights, mode='sum', reservoirSize=0, rng=None):
+        self.lociIndex = asLociIndex(lociLists)
+        self.lociWeights = lociWeights
+        self.mode = mode
+        self.stats = statistics.RunningStats(self.lociIndex.numGenes, reservoirSize, rng)
+        self.lastTop = None
+
+    @property
+    def count(self):
+        return self.stats.count
+
+    # @param genomes: numNetworks x numLoci int matrix of LociIndex gene ids
+    # @param chunkSize: number of genomes gathered at once
+    def addGenomes(self, genomes, chunkSize=1024):
+        genomes = np.asarray(genomes)
+        for start in range(0, len(genomes), chunkSize):
+            self.stats.update(scoreGenomeBlock(genomes[start:start + chunkSize], self.lociWeights, self.mode))
+
+    # @param numGenes: number of genes to return, from each locus with perLocus
+    # @param perLocus: bool to take the top genes of every locus, as getTopLociGenes reports them
+    # @returns topIds: LociIndex gene ids of the genes with the highest mean score
+    def topGeneIds(self, numGenes, perLocus=False):
+        if not perLocus:
+            return np.argsort(-self.stats.mean, kind='stable')[:numGenes]
+        # genes grouped by locus, highest mean first inside each locus
+        order = np.lexsort((-self.stats.mean, self.lociIndex.geneLoci))
+        loci = self.lociIndex.geneLoci[order]
+        ranks = np.arange(len(order)) - self.lociIndex.lociOffsets[loci]
+        return order[ranks < numGenes]
+
+    # The top genes are stable once they are the same genes as at the last check and the
+    # confidence interval of each of their mean scores is narrower than tolerance
+    # @param numGenes: number of top ranked genes to check, from each locus with perLocus
+    # @param tolerance: largest allowed confidence interval half width
+    # @param z: z score of the interval, 1.96 for 95%
+    # @param perLocus: bool to check the top genes of every locus instead of the top genes overall
+    # @returns stable: bool of whether scoring can stop
+    def isStable(self, numGenes, tolerance, z=1.96, perLocus=False):
+        top = self.topGeneIds(numGenes, perLocus)
+        sameTop = self.lastTop is not None and set(top.tolist()) == set(self.lastTop.tolist())
+        self.lastTop = top
+        return sameTop and bool(np.all(self.stats.confidenceHalfWidth(z)[top] <= tolerance))
+
+    # @returns geneSAvg: dictionary of average gene score for each gene
+    def geneScoreAvg(self):
+        return dict(zip(self.lociIndex.genes, self.stats.mean.tolist()))
+
+
+# Score a stream of genome batches, stopping early once the top ranked genes are stable
+# @param genomeBatches: iterable of numNetworks x numLoci genome matrices
+# @param accumulator: GeneScoreAccumulator to add the batches to
+# @param numGenes: number of top ranked genes to check for stability, from each locus with perLocus
+# @param tolerance: confidence interval half width to stop at, None to score every batch
+# @param z: z score of the interval, 1.96 for 95%
+# @param perLocus: bool to check the top genes of every locus, the genes getTopLociGenes reports
+# @returns accumulator: the accumulator after the last batch used
+def accumulateGeneScores(genomeBatches, accumulator, numGenes=10, tolerance=None, z=1.96, perLocus=False):
+    for genomes in genomeBatches:
+        accumulator.addGenomes(genomes)
+        if tolerance is not None and accumulator.isStable(numGenes, tolerance, z, perLocus):
+            break
+    return accumulator
+
+
 # Average the gene Score lists to get one score for each gene
 #
 # @param geneScores: a dictionary of lists of gene scores for each gene
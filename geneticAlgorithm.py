@@ -14,52 +14,107 @@
 #    Compute fitness
 # UNTIL population does not have significant change in density
 # STOP
-import copy
-import random, statistics
-import matplotlib.pyplot as plt
+import os, random, statistics, time, networkCreation, rendering
+import numpy as np
+from compactGraph import CompactGraph
+from lociIndex import asLociIndex
+from checkpoint import compactGenomes
 
+# Replace the edges of every gene in network with all of its edges to other genes in network
 # @param network: dictionary of subnetwork of genes
-# @param connections: dictionary of all genes and their interactions
+# @param connections: dictionary of all genes and their interactions or CompactGraph
 # @returns network: dictionary of gene subnetwork with edges
 def makeEdges(network, connections):
+    if isinstance(connections, CompactGraph):
+        edges = connections.subnetworkDict(list(network))
+        for gene in edges:
+            network[gene] = edges[gene]
+        return network
+
     for gene in network:
+        network[gene] = {}
         for gene2 in connections[gene]:
             if gene2 in network:
-                weight = connections[gene][gene2]
-                network[gene] = {gene2:weight}
+                network[gene][gene2] = connections[gene][gene2]
     return network
 
 
 # Mutate at 5% chance each gene in all subnetworks in a list
 # mutated genes are chosen from same loci as old gene
+# the input subnetworks are left unchanged
 # @param subnetworks: list of subnetworks to mutate
-# @param lociLists: list of list of loci and their genes
+# @param lociLists: LociIndex or list of list of loci and their genes
 # @param connections: all genes and connections to other genes
 # @returns newPop: list of mustated subnetworks
 def mutation(subnetworks, lociLists, connections):
-    newPop = copy.deepcopy(subnetworks)
+    lociLists = asLociIndex(lociLists)
+    newPop = []
 
-    for network in range(len(subnetworks)):
-        for gene in subnetworks[network]:
+    for network in subnetworks:
+        genes = list(network)
+        for g, gene in enumerate(genes):
             # mutation at 5% chance
-            subnetworks[network][gene] = {}
             mChance = random.randint(0, 100)
             if mChance < 5:
-                for loci in lociLists:
-                    if gene in loci:
+                loci = lociLists.lociOf(gene)
+                if loci is not None and len(loci) > 1:
+                    mutatedG = random.choice(loci)
+                    while mutatedG == gene:
                         mutatedG = random.choice(loci)
-                        while mutatedG == gene:
-                            mutatedG = random.choice(loci)
 
-                        # replace gene with mutatedG
-                        newPop[network][mutatedG] = {}
-                        newPop[network].pop(gene)
+                    # replace gene with mutatedG
+                    genes[g] = mutatedG
 
-        newPop[network] = makeEdges(newPop[network], connections)
+        newPop.append(makeEdges(dict.fromkeys(genes), connections))
 
     return newPop
 
 
+# Mutate genomes in place. Every position of every genome mutates with chance rate, all drawn
+# in one call, and a mutated gene is replaced by a different gene from the same locus.
+# Fitness is updated by the change in edge weight at the mutated positions only, so the cost
+# scales with the number of mutations rather than the population size.
+# @param genomes: numNetworks x numLoci int matrix of LociIndex gene ids, changed in place
+# @param fitness: float array of total edge weight of each genome, changed in place
+# @param lociLists: LociIndex or list of list of loci and their genes
+# @param lociWeights: inter-locus weight matrix from networkCreation.makeLociWeightMatrix
+# @param rng: numpy Generator
+# @param rate: chance of each gene mutating
+# @returns numMutations, fitnessChange: number of genes mutated and total change in fitness
+def mutateGenomes(genomes, fitness, lociLists, lociWeights, rng, rate=0.05):
+    lociIndex = asLociIndex(lociLists)
+    mutated = rng.random(genomes.shape) < rate
+    # loci with one gene have nothing to mutate to
+    mutated &= (lociIndex.lociSizes > 1)[None, :]
+    rows, cols = np.nonzero(mutated)
+    if len(rows) == 0:
+        return 0, 0.0
+
+    # shift by 1..size-1 within the locus so the new gene always differs from the old one
+    sizes = lociIndex.lociSizes[cols]
+    starts = lociIndex.lociOffsets[cols]
+    shifts = rng.integers(1, sizes)
+    newGenes = starts + (genomes[rows, cols] - starts + shifts) % sizes
+
+    # apply one locus at a time so mutations in the same genome see each other
+    fitnessChange = 0.0
+    for col in np.unique(cols):
+        hit = cols == col
+        r = rows[hit]
+        current = genomes[r]
+        oldGenes = current[:, col]
+        # both directions halved like calcGenomeEdgeDensityW, STRING edges are not always symmetric
+        new, old = newGenes[hit][:, None], oldGenes[:, None]
+        delta = (lociWeights[new, current].sum(axis=1, dtype=np.float64)
+                 + lociWeights[current, new].sum(axis=1, dtype=np.float64)
+                 - lociWeights[old, current].sum(axis=1, dtype=np.float64)
+                 - lociWeights[current, old].sum(axis=1, dtype=np.float64))/2
+        fitness[r] += delta
+        fitnessChange += delta.sum()
+        genomes[r, col] = newGenes[hit]
+    return len(rows), float(fitnessChange)
+
+
 # calculate selection scores for networks to use in mating
 # @param subnetworks: list of subnetworks
 # @returns scores: list of scores for corresponding subnetworks
@@ -71,46 +126,243 @@ def calculateSelectionScores(subnetworks):
     return scores
 
 
+# Fitness proportional selection weight, each network's chance of being chosen is its total
+# edge weight multiplied by 10, plus 1 so networks with no edges can still be chosen
+# @param scores: selection scores from calculateSelectionScores or genome fitness
+# @returns weights: float array of selection weights
+def selectionWeights(scores):
+    return np.asarray(scores, dtype=np.float64)*10 + 1
+
+
+# Walker alias table for O(1) draws from a fixed discrete distribution
+# @param weights: non-negative float array of weights
+# @returns prob, alias: acceptance probability and alias index of each slot
+def makeAliasTable(weights):
+    n = len(weights)
+    scaled = np.asarray(weights, dtype=np.float64)*n/np.sum(weights)
+    prob = np.ones(n, dtype=np.float64)
+    alias = np.arange(n, dtype=np.int64)
+    small = [i for i in range(n) if scaled[i] < 1]
+    large = [i for i in range(n) if scaled[i] >= 1]
+    while small and large:
+        s = small.pop()
+        l = large[-1]
+        prob[s] = scaled[s]
+        alias[s] = l
+        scaled[l] -= 1 - scaled[s]
+        if scaled[l] < 1:
+            small.append(large.pop())
+    return prob, alias
+
+
+# @param prob: acceptance probabilities from makeAliasTable
+# @param alias: alias indices from makeAliasTable
+# @param size: number of draws
+# @param rng: numpy Generator
+# @returns draws: int array of drawn indices
+def aliasSample(prob, alias, size, rng):
+    slots = rng.integers(0, len(prob), size=size)
+    keep = rng.random(size) < prob[slots]
+    return np.where(keep, slots, alias[slots])
+
+
+# Draw every parent for a generation in one batch
+# methods:
+#   'proportional'  chance proportional to selectionWeights, cumulative sum + binary search
+#   'alias'         same distribution as proportional using a Walker alias table
+#   'rank'          chance proportional to fitness rank, lowest rank 1
+#   'tournament'    best of tournamentSize networks drawn uniformly
+# @param fitness: float array of total edge weight of each network
+# @param numParents: number of parents to draw
+# @param rng: numpy Generator
+# @param method: selection method
+# @param tournamentSize: networks per tournament
+# @returns parents: int array of selected network indices
+def selectParents(fitness, numParents, rng, method='proportional', tournamentSize=2):
+    fitness = np.asarray(fitness, dtype=np.float64)
+    if method == 'proportional':
+        cumulative = np.cumsum(selectionWeights(fitness))
+        draws = rng.random(numParents)*cumulative[-1]
+        return np.minimum(np.searchsorted(cumulative, draws, side='right'), len(fitness) - 1)
+    if method == 'alias':
+        prob, alias = makeAliasTable(selectionWeights(fitness))
+        return aliasSample(prob, alias, numParents, rng)
+    if method == 'rank':
+        ranks = np.empty(len(fitness), dtype=np.float64)
+        ranks[np.argsort(fitness, kind='stable')] = np.arange(1, len(fitness) + 1)
+        cumulative = np.cumsum(ranks)
+        draws = rng.random(numParents)*cumulative[-1]
+        return np.minimum(np.searchsorted(cumulative, draws, side='right'), len(fitness) - 1)
+    if method == 'tournament':
+        entrants = rng.integers(0, len(fitness), size=(numParents, tournamentSize))
+        winners = np.argmax(fitness[entrants], axis=1)
+        return entrants[np.arange(numParents), winners]
+    raise ValueError('unknown selection method: ' + str(method))
+
+
 # Mate each network with a randomly chosen one. Networks with higher selection scores
 # are more likely to be randomly chosen for mating.
 # @param subnetworks: list of subnetworks to mate
-# @param lociLists: list of lists of loci and their genes
+# @param lociLists: LociIndex or list of lists of loci and their genes
 # @param connections: dictionary of genes and interactions
+# @param selection: selection method, see selectParents
 # @returns subnetworks: list of mated subnetworks
-def mating(subnetworks, lociLists, connections):
-    origSNetworks = copy.deepcopy(subnetworks)
+def mating(subnetworks, lociLists, connections, selection='proportional'):
+    lociLists = asLociIndex(lociLists)
+    # only the original genes are needed from each mate
+    origGenes = [list(network) for network in subnetworks]
     selScores = calculateSelectionScores(subnetworks)
-    selList = []
-    networkIndex = 0
-    for score in selScores:
-        for s in range(int((score*10)+1)):
-            selList.append(networkIndex)
-        networkIndex +=1
+    rng = np.random.default_rng(random.getrandbits(64))
+    mates = selectParents(selScores, len(subnetworks), rng, selection)
 
-    for network in subnetworks:
-        mateIndex = random.choice(selList)
-        # get corresponding network to mate with network
-        mateN = list(origSNetworks[mateIndex].keys())
+    for network, mateIndex in zip(subnetworks, mates.tolist()):
+        # get corresponding network's gene for each locus
+        mateLoci = {lociLists.locusOf(gene2): gene2 for gene2 in origGenes[mateIndex]}
         # cant change dict keys in a loop
         nodes = list(network.keys())
         # mate
         # genes must come from same loci
-        for gene1 in range(len(nodes)):
-            for gene2 in mateN:
-                for loci in lociLists:
-                    if gene1 in loci and gene2 in loci:
-                        choice = random.randint(0,1)
-                        if choice:
-                            network.pop(gene1)
-                            network[gene2] = {}
-            if gene1 in network:
-                network[gene1] = {}
-
+        for g, gene1 in enumerate(nodes):
+            gene2 = mateLoci.get(lociLists.locusOf(gene1))
+            if gene2 is not None and gene2 != gene1:
+                choice = random.randint(0,1)
+                if choice:
+                    nodes[g] = gene2
 
+        network.clear()
+        network.update(dict.fromkeys(nodes))
         makeEdges(network, connections)
     return subnetworks
 
 
+# Crossover of every genome with its mate at once. Genome columns are loci so genes are only
+# ever exchanged with the mate's gene from the same locus. One random mask covers the population.
+# methods:
+#   'uniform'    each locus comes from the mate with chance 1/2
+#   'onePoint'   loci after a random cut come from the mate
+#   'twoPoint'   loci between two random cuts come from the mate
+# @param genomes: numNetworks x numLoci int matrix of LociIndex gene ids
+# @param mates: int array of the mate index of each genome, from selectParents
+# @param rng: numpy Generator
+# @param method: crossover method
+# @returns children: numNetworks x numLoci int matrix of child genomes
+def crossoverGenomes(genomes, mates, rng, method='uniform'):
+    numNetworks, numLoci = genomes.shape
+    cols = np.arange(numLoci)[None, :]
+    if method == 'uniform':
+        fromMate = rng.random((numNetworks, numLoci)) < 0.5
+    elif method == 'onePoint':
+        cut = rng.integers(1, max(numLoci, 2), size=numNetworks)
+        fromMate = cols >= cut[:, None]
+    elif method == 'twoPoint':
+        cuts = np.sort(rng.integers(0, numLoci + 1, size=(numNetworks, 2)), axis=1)
+        fromMate = (cols >= cuts[:, :1]) & (cols < cuts[:, 1:])
+    else:
+        raise ValueError('unknown crossover method: ' + str(method))
+    return np.where(fromMate, genomes[mates], genomes)
+
+
+# Mate every genome with a parent selected by fitness
+# @param genomes: numNetworks x numLoci int matrix of LociIndex gene ids
+# @param fitness: float array of total edge weight of each genome
+# @param lociWeights: inter-locus weight matrix from networkCreation.makeLociWeightMatrix
+# @param rng: numpy Generator
+# @param selection: selection method, see selectParents
+# @param crossover: crossover method, see crossoverGenomes
+# @param stats: optional dict from generationStats to add crossovers, fitness evaluations and phase times to
+# @returns children, childFitness: child genomes and their total edge weights
+def mateGenomes(genomes, fitness, lociWeights, rng, selection='proportional', crossover='uniform', stats=None):
+    start = time.perf_counter()
+    mates = selectParents(fitness, len(genomes), rng, selection)
+    selected = time.perf_counter()
+    children = crossoverGenomes(genomes, mates, rng, crossover)
+    crossedAt = time.perf_counter()
+
+    # children identical to a parent keep that parent's cached fitness, only the rest are scored
+    childFitness = np.asarray(fitness, dtype=np.float64).copy()
+    sameAsMate = (children == genomes[mates]).all(axis=1)
+    childFitness[sameAsMate] = fitness[mates[sameAsMate]]
+    crossed = ~(children == genomes).all(axis=1)
+    changed = ~sameAsMate & crossed
+    childFitness[changed] = statistics.calcGenomeEdgeDensityW(children[changed], lociWeights)
+
+    if stats is not None:
+        stats['selectionSeconds'] += selected - start
+        stats['crossoverSeconds'] += crossedAt - selected
+        stats['fitnessSeconds'] += time.perf_counter() - crossedAt
+        stats['crossovers'] += int(crossed.sum())
+        stats['fitnessEvaluations'] += int(changed.sum())
+    return children, childFitness
+
+
+# @returns stats: zeroed counts and phase times of a generation, filled in by Population.mutate and
+#   Population.mate and reported to instrumentation.Recorder.generation
+def generationStats():
+    return {'mutations': 0, 'crossovers': 0, 'fitnessEvaluations': 0, 'mutationSeconds': 0.0,
+            'selectionSeconds': 0.0, 'crossoverSeconds': 0.0, 'fitnessSeconds': 0.0}
+
+
+# Population of genomes that carries each genome's fitness and the population total. Mutation
+# and mating update both by the change they make, so an unchanged genome is never re-scored.
+# @param genomes: numNetworks x numLoci int matrix of LociIndex gene ids
+# @param lociLists: LociIndex or list of lists of loci and their genes
+# @param lociWeights: inter-locus weight matrix from networkCreation.makeLociWeightMatrix
+# @param fitness: optional cached fitness of genomes, computed if not given
+class Population:
+    def __init__(self, genomes, lociLists, lociWeights, fitness=None):
+        self.genomes = np.array(genomes, dtype=np.int64)
+        self.lociIndex = asLociIndex(lociLists)
+        self.lociWeights = lociWeights
+        if fitness is None:
+            fitness = statistics.calcGenomeEdgeDensityW(self.genomes, lociWeights)
+        self.fitness = np.asarray(fitness, dtype=np.float64)
+        self.totalDensity = float(self.fitness.sum())
+
+    def __len__(self):
+        return len(self.genomes)
+
+    # @param rng: numpy Generator
+    # @param rate: chance of each gene mutating
+    # @param stats: optional dict from generationStats to add the mutations and their time to
+    # @returns numMutations: number of genes mutated
+    def mutate(self, rng, rate=0.05, stats=None):
+        start = time.perf_counter()
+        numMutations, fitnessChange = mutateGenomes(self.genomes, self.fitness, self.lociIndex, self.lociWeights,
+                                                    rng, rate)
+        self.totalDensity += fitnessChange
+        if stats is not None:
+            stats['mutations'] += numMutations
+            stats['mutationSeconds'] += time.perf_counter() - start
+        return numMutations
+
+    # @param rng: numpy Generator
+    # @param selection: selection method, see selectParents
+    # @param crossover: crossover method, see crossoverGenomes
+    # @param stats: optional dict from generationStats, see mateGenomes
+    def mate(self, rng, selection='proportional', crossover='uniform', stats=None):
+        children, childFitness = mateGenomes(self.genomes, self.fitness, self.lociWeights, rng, selection, crossover,
+                                             stats)
+        self.totalDensity += float((childFitness - self.fitness).sum())
+        self.genomes = children
+        self.fitness = childFitness
+
+    # @returns state, arrays: checkpoint section of the population, the running total is kept exactly
+    def checkpointState(self):
+        return {'totalDensity': self.totalDensity}, {'genomes': compactGenomes(self.genomes),
+                                                     'fitness': self.fitness}
+
+    # @param state: state from checkpointState
+    # @param arrays: arrays from checkpointState
+    def restore(self, state, arrays):
+        self.genomes = arrays['genomes'].astype(np.int64)
+        self.fitness = arrays['fitness'].astype(np.float64)
+        self.totalDensity = state['totalDensity']
+
+    # @returns subnetworks: list of subnetwork dictionaries of the population
+    def toSubnetworks(self):
+        return networkCreation.genomesToSubnetworks(self.genomes, self.lociIndex, self.lociWeights)
+
+
 # calculate edge density of networks using edge weights
 # use to determine when to stop the genetic algorithm
 # @param population: networks to calculate density of
@@ -127,40 +379,101 @@ def calcPopEdgeDensity(population):
 # Mate
 # keep going until overall edge density has not improved by more than 0.5%
 # @param subnetworks: list of subnetworks to mate
-# @param lociLists: list of lists of loci and their genes
+# @param lociLists: LociIndex or list of lists of loci and their genes
+# Subnetworks are turned into genomes and run through geneticAlgGenomes
 # @param connections: dictionary of genes and interactions
 # @returns newPop: list of new subnetworks generated from the genetic algorithm
 def geneticAlg(subnetworks, lociLists, connections):
+    lociLists = asLociIndex(lociLists)
+    lociWeights = networkCreation.makeLociWeightMatrix(connections, lociLists)
+    genomes = networkCreation.subnetworksToGenomes(subnetworks, lociLists)
+    rng = np.random.default_rng(random.getrandbits(64))
+    population = geneticAlgGenomes(Population(genomes, lociLists, lociWeights), rng)
+    return population.toSubnetworks()
+
+
+# Mutate
+# Mate
+# keep going until overall edge density has not improved by more than tolerance
+# the population density is the running total kept by Population, never a re-scan
+# @param population: Population to evolve, changed in place
+# @param rng: numpy Generator
+# @param rate: chance of each gene mutating
+# @param selection: selection method, see selectParents
+# @param crossover: crossover method, see crossoverGenomes
+# @param tolerance: relative change in population density to stop at
+# @param maxGenerations: optional limit on the number of generations
+# @param recorder: optional instrumentation.Recorder that gets every generation's stats
+# @param outDir: directory the generation stats are written to
+# @param checkpoint: optional checkpoint.Checkpoint, the 'ga' section is resumed from and saved to it
+# @returns population: the evolved population
+def geneticAlgGenomes(population, rng, rate=0.05, selection='proportional', crossover='uniform', tolerance=0.005,
+                      maxGenerations=None, recorder=None, outDir='.', checkpoint=None):
     change = 100
     generation = 0
     changes = []
     generations = []
-    while change > 0.005:
+    saved = checkpoint.get('ga') if checkpoint is not None else None
+    if saved is not None:
+        state, arrays = saved
+        population.restore(state, arrays)
+        rng.bit_generator.state = state['rng']
+        generation, change, changes = state['generation'], state['change'], state['changes']
+        generations = list(range(1, generation + 1))
+
+    while change > tolerance and (maxGenerations is None or generation < maxGenerations):
         # genetic algorithm
-        startingEDensity = calcPopEdgeDensity(subnetworks)
-        newPop = mutation(subnetworks, lociLists, connections)
-        newPop = mating(newPop, lociLists, connections)
+        startingEDensity = population.totalDensity
+        stats = generationStats()
+        population.mutate(rng, rate, stats)
+        population.mate(rng, selection, crossover, stats)
 
         #caculate change
-        endEDensity = calcPopEdgeDensity(newPop)
-        change = abs((endEDensity - startingEDensity)/startingEDensity)
-        subnetworks = newPop
+        endEDensity = population.totalDensity
+        change = abs((endEDensity - startingEDensity)/startingEDensity) if startingEDensity else 0
         generation += 1
+        if recorder is not None:
+            recorder.generation(generation, endEDensity/len(population), change, stats)
 
-        print(generation)
-        print(change)
         changes.append(change)
         generations.append(generation)
+        if checkpoint is not None and checkpoint.due():
+            saveGACheckpoint(checkpoint, population, rng, generation, change, changes)
+
+    if checkpoint is not None:
+        saveGACheckpoint(checkpoint, population, rng, generation, change, changes)
+    outputGenerationStats(generations, changes, outDir)
+    return population
+
 
+# @param checkpoint: checkpoint.Checkpoint to save the 'ga' section to
+# @param population: Population being evolved
+# @param rng: numpy Generator of the GA
+# @param generation: generations run
+# @param change: relative density change of the last generation
+# @param changes: list of the changes of every generation
+def saveGACheckpoint(checkpoint, population, rng, generation, change, changes):
+    state, arrays = population.checkpointState()
+    state.update(rng=rng.bit_generator.state, generation=generation, change=change, changes=changes)
+    checkpoint.save('ga', state, arrays)
 
-    with open('GA_Generations_Stats', 'w') as f:
+
+# @param generations: list of generation numbers
+# @param changes: list of relative density changes of each generation
+# @param outDir: directory the stats file is written to
+# @outputs: GA_Generations_Stats file and plot of the changes
+def outputGenerationStats(generations, changes, outDir='.'):
+    with open(os.path.join(outDir, 'GA_Generations_Stats'), 'w') as f:
         for c in changes:
             f.write(str(c) + '\n')
 
-    plt.figure(figsize=(9, 3))
+    rendering.render('GA_Generations_Stats', plotGenerationStats, generations, changes)
 
-    plt.plot(generations, changes)
-    plt.show()
 
+# @param plt: matplotlib.pyplot
+# @param generations: list of generation numbers
+# @param changes: list of relative density changes of each generation
+def plotGenerationStats(plt, generations, changes):
+    plt.figure(figsize=(9, 3))
 
-    return newPop
\ No newline at end of file
+    plt.plot(generations, changes)
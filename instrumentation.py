@@ -0,0 +1,159 @@
+# Purpose: Named timers, counters and events for following a run while it happens. A Recorder is
+#   passed to the pipeline stages, which time themselves with it and report each GA generation
+#   and each null distribution batch as an event. Observers are callables that receive every
+#   event as a dict; JsonLinesLog writes them to a file one JSON object per line and
+#   ConsoleProgress prints each generation and loci density to stderr.
+#   Events
+#       stage       a timed stage finished: name, seconds, and peakBytes when memory is traced
+#       generation  a GA generation (or island epoch) finished: generation, density, change,
+#                   mutations, crossovers, fitnessEvaluations and the seconds of each phase
+#       nullBatch   a batch of null populations was checked: permutations, exceedances, ciLow, ciHigh
+#       empiricalPVal  statistics.empiricalPVal scored the loci: lociDensity, pval
+#       summary     totals of every timer and counter at the end of the run
+#   profile() wraps a run in cProfile or tracemalloc for finding hot spots.
+
+import collections, contextlib, cProfile, json, sys, time, tracemalloc
+
+
+# Timers, counters and observers of one run
+# @param observers: optional list of callables that receive each event dict
+class Recorder:
+    def __init__(self, observers=None):
+        self.observers = list(observers or [])
+        self.timers = collections.defaultdict(float)
+        self.calls = collections.Counter()
+        self.counters = collections.Counter()
+        self.peakBytes = None
+        self.start = time.perf_counter()
+
+    # @param observer: callable that receives each event dict
+    def subscribe(self, observer):
+        self.observers.append(observer)
+
+    # Send an event to every observer
+    # @param event: event type
+    # @param fields: values of the event
+    def emit(self, event, **fields):
+        if not self.observers:
+            return
+        record = {'event': event, 'elapsed': time.perf_counter() - self.start}
+        record.update(fields)
+        for observer in self.observers:
+            observer(record)
+
+    # @param name: counter name
+    # @param n: amount to add
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    # @param name: timer name
+    # @param seconds: time to add
+    def addTime(self, name, seconds):
+        self.timers[name] += seconds
+        self.calls[name] += 1
+
+    # Time the body as stage name and emit a stage event. The stage's peak allocation is
+    # included when tracemalloc is tracing, stages should not be nested then since each one
+    # resets the traced peak.
+    # @param name: stage name
+    @contextlib.contextmanager
+    def timer(self, name):
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            baseline = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.addTime(name, seconds)
+            if tracing:
+                peak = tracemalloc.get_traced_memory()[1]
+                self.peakBytes = max(self.peakBytes or 0, peak)
+                self.emit('stage', name=name, seconds=seconds, peakBytes=peak - baseline)
+            else:
+                self.emit('stage', name=name, seconds=seconds)
+
+    # Add a generation's stats to the counters and timers and emit a generation event
+    # @param generation: generation number
+    # @param density: population density after the generation
+    # @param change: relative change in density
+    # @param stats: dict from geneticAlgorithm.generationStats
+    def generation(self, generation, density, change, stats):
+        for key, value in stats.items():
+            if key.endswith('Seconds'):
+                self.addTime('ga.' + key[:-len('Seconds')], value)
+            else:
+                self.count(key, value)
+        self.emit('generation', generation=generation, density=density, change=change, **stats)
+
+    # @returns summary: dict of every timer's seconds and calls and every counter
+    def summary(self):
+        timers = {name: {'seconds': self.timers[name], 'calls': self.calls[name]} for name in self.timers}
+        summary = {'timers': timers, 'counters': dict(self.counters), 'elapsed': time.perf_counter() - self.start}
+        if self.peakBytes is not None:
+            summary['peakTracedBytes'] = self.peakBytes
+        return summary
+
+    # Emit the summary event
+    def finish(self):
+        self.emit('summary', **self.summary())
+
+
+# Observer that writes events to a JSON lines file
+# @param fileName: file to write
+class JsonLinesLog:
+    def __init__(self, fileName):
+        self.file = open(fileName, 'w')
+
+    def __call__(self, record):
+        self.file.write(json.dumps(record, default=float) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+# Observer that prints each GA generation and its change in density, and the loci density of
+# an empirical p-value
+# @param stream: file to print to, stderr if not given
+class ConsoleProgress:
+    def __init__(self, stream=None):
+        self.stream = stream
+
+    def __call__(self, record):
+        if record['event'] == 'generation':
+            print('Generation', record['generation'], 'change', record['change'], file=self.stream or sys.stderr)
+        elif record['event'] == 'empiricalPVal':
+            print('Loci density', record['lociDensity'], file=self.stream or sys.stderr)
+
+
+# Profile the body with cProfile or tracemalloc
+# @param mode: None to do nothing, 'cprofile' or 'tracemalloc'
+# @param outFile: cProfile stats file for pstats/snakeviz, or text file of the top allocation sites
+# @param top: number of allocation sites written for tracemalloc
+@contextlib.contextmanager
+def profile(mode, outFile, top=25):
+    if mode is None:
+        yield
+    elif mode == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(outFile)
+    elif mode == 'tracemalloc':
+        tracemalloc.start()
+        try:
+            yield
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            with open(outFile, 'w') as f:
+                for stat in snapshot.statistics('lineno')[:top]:
+                    f.write(str(stat) + '\n')
+    else:
+        raise ValueError('unknown profile mode: ' + str(mode))
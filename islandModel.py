@@ -0,0 +1,189 @@
+# Purpose: Island model genetic algorithm. The population is split into islands that evolve in
+#   parallel worker processes and exchange their best genomes every few generations.
+#   The inter-locus weight matrix is put in shared memory once instead of being pickled to
+#   every worker. Each island has its own random stream spawned from one base seed and
+#   migration happens in the parent process, so results do not depend on the worker count.
+
+import concurrent.futures
+import numpy as np
+import geneticAlgorithm
+from checkpoint import compactGenomes
+from sharedArrays import shareArray, attachArray, releaseShared
+
+# set in each worker by initWorker
+workerWeights = None
+workerLociIndex = None
+workerMemory = None
+
+
+# Worker process initializer
+# @param weightsSpec: shared memory spec of the inter-locus weight matrix
+# @param lociIndex: LociIndex of the loci genes
+def initWorker(weightsSpec, lociIndex):
+    global workerWeights, workerLociIndex, workerMemory
+    workerMemory, workerWeights = attachArray(weightsSpec)
+    workerLociIndex = lociIndex
+
+
+# Release the shared weights when the islands were run in this process
+def closeWorker():
+    global workerWeights, workerLociIndex, workerMemory
+    workerWeights = None
+    workerLociIndex = None
+    if workerMemory is not None:
+        workerMemory.close()
+        workerMemory = None
+
+
+# Evolve one island for a number of generations
+# @param genomes: island genomes
+# @param fitness: cached fitness of the island genomes
+# @param rngState: bit generator state of the island's random stream
+# @param generations: number of generations to run
+# @param rate: chance of each gene mutating
+# @param selection: selection method, see geneticAlgorithm.selectParents
+# @param crossover: crossover method, see geneticAlgorithm.crossoverGenomes
+# @returns genomes, fitness, rngState, stats: the island after evolving and its generationStats totals
+def evolveIsland(genomes, fitness, rngState, generations, rate, selection, crossover):
+    rng = np.random.default_rng()
+    rng.bit_generator.state = rngState
+    population = geneticAlgorithm.Population(genomes, workerLociIndex, workerWeights, fitness)
+    stats = geneticAlgorithm.generationStats()
+    for generation in range(generations):
+        population.mutate(rng, rate, stats)
+        population.mate(rng, selection, crossover, stats)
+    return population.genomes, population.fitness, rng.bit_generator.state, stats
+
+
+# @param numIslands: number of islands
+# @param topology: 'ring' sends to the next island, 'all' sends to every other island, 'none' never migrates
+# @returns routes: list of (source, destination) island pairs
+def migrationRoutes(numIslands, topology='ring'):
+    if topology == 'ring':
+        return [(i, (i + 1) % numIslands) for i in range(numIslands) if numIslands > 1]
+    if topology == 'all':
+        return [(i, j) for i in range(numIslands) for j in range(numIslands) if i != j]
+    if topology == 'none':
+        return []
+    raise ValueError('unknown migration topology: ' + str(topology))
+
+
+# Copy the best numMigrants genomes of each source island over the worst genomes of its
+# destinations. Migrants are chosen before any island is changed.
+# @param islands: list of [genomes, fitness, rngState] lists, changed in place
+# @param routes: list of (source, destination) pairs from migrationRoutes
+# @param numMigrants: genomes sent along each route
+def migrate(islands, routes, numMigrants):
+    if numMigrants <= 0:
+        return
+    best = [np.argsort(-island[1], kind='stable')[:numMigrants] for island in islands]
+    migrants = [(island[0][b].copy(), island[1][b].copy()) for island, b in zip(islands, best)]
+    received = {}
+    for source, destination in routes:
+        received.setdefault(destination, []).append(migrants[source])
+    for destination, arrivals in sorted(received.items()):
+        genomes, fitness = islands[destination][0], islands[destination][1]
+        newGenomes = np.concatenate([a[0] for a in arrivals])
+        newFitness = np.concatenate([a[1] for a in arrivals])
+        worst = np.argsort(fitness, kind='stable')[:len(newGenomes)]
+        genomes[worst] = newGenomes[:len(worst)]
+        fitness[worst] = newFitness[:len(worst)]
+
+
+# Island model version of geneticAlgorithm.geneticAlgGenomes. Stops once the total density of all
+# islands changes by less than tolerance over one migration interval.
+# @param population: geneticAlgorithm.Population to split into islands
+# @param numIslands: number of islands
+# @param seed: base seed, island random streams are spawned from it
+# @param numWorkers: worker processes, 0 or 1 to run the islands in this process
+# @param migrationInterval: generations between migrations
+# @param numMigrants: genomes sent along each migration route
+# @param topology: migration topology, see migrationRoutes
+# @param rate: chance of each gene mutating
+# @param selection: selection method, see geneticAlgorithm.selectParents
+# @param crossover: crossover method, see geneticAlgorithm.crossoverGenomes
+# @param tolerance: relative change in total density to stop at
+# @param maxGenerations: optional limit on the number of generations
+# @param recorder: optional instrumentation.Recorder that gets each migration interval's stats summed
+#   over the islands, phase times are then the islands' total time
+# @param checkpoint: optional checkpoint.Checkpoint, the 'islands' section is resumed from and saved to it
+#   after migrations
+# @returns population: Population of all islands' genomes
+def islandGeneticAlg(population, numIslands, seed, numWorkers=None, migrationInterval=10, numMigrants=5,
+                     topology='ring', rate=0.05, selection='proportional', crossover='uniform', tolerance=0.005,
+                     maxGenerations=None, recorder=None, checkpoint=None):
+    streams = [np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(numIslands)]
+    islands = [[genomes, fitness, rng.bit_generator.state] for genomes, fitness, rng in
+               zip(np.array_split(population.genomes, numIslands), np.array_split(population.fitness, numIslands),
+                   streams)]
+    routes = migrationRoutes(numIslands, topology)
+
+    memory, weightsSpec = shareArray(population.lociWeights)
+    executor = None
+    try:
+        if numWorkers is None or numWorkers > 1:
+            executor = concurrent.futures.ProcessPoolExecutor(numWorkers, initializer=initWorker,
+                                                              initargs=(weightsSpec, population.lociIndex))
+        else:
+            initWorker(weightsSpec, population.lociIndex)
+
+        change = 100
+        generation = 0
+        totalDensity = population.totalDensity
+        saved = checkpoint.get('islands') if checkpoint is not None else None
+        if saved is not None:
+            state, arrays = saved
+            islands = [[arrays['genomes' + str(i)].astype(np.int64), arrays['fitness' + str(i)], rngState]
+                       for i, rngState in enumerate(state['rng'])]
+            generation, change, totalDensity = state['generation'], state['change'], state['totalDensity']
+
+        while change > tolerance and (maxGenerations is None or generation < maxGenerations):
+            generations = migrationInterval
+            if maxGenerations is not None:
+                generations = min(generations, maxGenerations - generation)
+            tasks = [(island[0], island[1], island[2], generations, rate, selection, crossover) for island in islands]
+            if executor is not None:
+                results = list(executor.map(evolveIsland, *zip(*tasks)))
+            else:
+                results = [evolveIsland(*task) for task in tasks]
+            islands = [list(result[:3]) for result in results]
+            migrate(islands, routes, numMigrants)
+            generation += generations
+
+            newDensity = float(sum(island[1].sum() for island in islands))
+            change = abs((newDensity - totalDensity)/totalDensity) if totalDensity else 0
+            totalDensity = newDensity
+            if recorder is not None:
+                stats = geneticAlgorithm.generationStats()
+                for result in results:
+                    for key in stats:
+                        stats[key] += result[3][key]
+                recorder.generation(generation, newDensity/len(population), change, stats)
+            if checkpoint is not None and checkpoint.due():
+                saveIslandCheckpoint(checkpoint, islands, generation, change, totalDensity)
+        if checkpoint is not None:
+            saveIslandCheckpoint(checkpoint, islands, generation, change, totalDensity)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        else:
+            closeWorker()
+        releaseShared(memory)
+
+    return geneticAlgorithm.Population(np.concatenate([island[0] for island in islands]), population.lociIndex,
+                                       population.lociWeights, np.concatenate([island[1] for island in islands]))
+
+
+# @param checkpoint: checkpoint.Checkpoint to save the 'islands' section to
+# @param islands: list of [genomes, fitness, rngState] of each island
+# @param generation: generations run
+# @param change: relative density change of the last migration interval
+# @param totalDensity: total density of all islands
+def saveIslandCheckpoint(checkpoint, islands, generation, change, totalDensity):
+    arrays = {}
+    for i, island in enumerate(islands):
+        arrays['genomes' + str(i)] = compactGenomes(island[0])
+        arrays['fitness' + str(i)] = island[1]
+    state = {'rng': [island[2] for island in islands], 'generation': generation, 'change': change,
+             'totalDensity': totalDensity}
+    checkpoint.save('islands', state, arrays)
@@ -0,0 +1,79 @@
+# Purpose: Index of genes and loci built once from the input file so a gene's locus is a dict
+#   lookup instead of a scan over every loci list.
+#   Genes get ids in file order (locus 0 genes first), so the genes of locus l are the
+#   contiguous ids lociOffsets[l]:lociOffsets[l+1].
+
+import numpy as np
+
+
+# Gene to locus index over the loci lists from fileParsing.readInput
+# A LociIndex can be used anywhere lociLists is expected, iterating it gives the loci lists.
+# assumption: loci are disjoint, a gene listed more than once belongs only to the first locus it is in
+# @param lociLists: list of list of genes separated by loci
+class LociIndex:
+    def __init__(self, lociLists):
+        self.lociLists = [list(loci) for loci in lociLists]
+        self.genes = []
+        self.geneIds = {}
+        self.geneLocus = {}
+        lociGenes = []
+        for l, loci in enumerate(self.lociLists):
+            start = len(self.genes)
+            for gene in loci:
+                if gene not in self.geneIds:
+                    self.geneIds[gene] = len(self.genes)
+                    self.geneLocus[gene] = l
+                    self.genes.append(gene)
+            lociGenes.append(np.arange(start, len(self.genes), dtype=np.int64))
+
+        # locus -> gene ids, gene id -> locus
+        self.lociGenes = lociGenes
+        self.lociSizes = np.array([len(ids) for ids in lociGenes], dtype=np.int64)
+        self.lociOffsets = np.concatenate(([0], np.cumsum(self.lociSizes)))
+        self.geneLoci = np.array([self.geneLocus[gene] for gene in self.genes], dtype=np.int64)
+
+    def __len__(self):
+        return len(self.lociLists)
+
+    def __iter__(self):
+        return iter(self.lociLists)
+
+    def __getitem__(self, l):
+        return self.lociLists[l]
+
+    @property
+    def numLoci(self):
+        return len(self.lociLists)
+
+    @property
+    def numGenes(self):
+        return len(self.genes)
+
+    # @param gene: gene name
+    # @returns locus: locus number of gene, None if the gene is in no locus
+    def locusOf(self, gene):
+        return self.geneLocus.get(gene)
+
+    # @param gene: gene name
+    # @returns loci: list of genes in the same locus as gene, None if the gene is in no locus
+    def lociOf(self, gene):
+        l = self.geneLocus.get(gene)
+        if l is None:
+            return None
+        return self.lociLists[l]
+
+    # @param gene1: gene name
+    # @param gene2: gene name
+    # @returns same: bool of whether both genes are in the same locus
+    def sameLocus(self, gene1, gene2):
+        l = self.geneLocus.get(gene1)
+        return l is not None and l == self.geneLocus.get(gene2)
+
+
+# Compatibility for functions that were given plain loci lists
+# @param lociLists: LociIndex or list of list of genes separated by loci
+# @returns lociIndex: LociIndex of lociLists
+def asLociIndex(lociLists):
+    if isinstance(lociLists, LociIndex):
+        return lociLists
+    return LociIndex(lociLists)
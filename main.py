@@ -4,9 +4,11 @@
 #   create a sub network of the gene interactions from the input file using the STRING file
 #   get statistical significance
 
-import argparse, random, time
+import argparse, hashlib, json, os, random, time
+import numpy as np
 import networkCreation, fileParsing, statistics, geneScoring, \
-    networkVisualization, geneticAlgorithm, outputFiles
+    networkVisualization, geneticAlgorithm, outputFiles, islandModel, nullDistribution, degreeBins, \
+    instrumentation, rendering, networkCache, checkpoint
 
 # arguments:
 #   - input file
@@ -27,33 +29,228 @@ parser.add_argument('--geneOutFile', type=str, default='geneScores.txt', help='o
 parser.add_argument('--networkOutFile', type=str, default='geneNetwork.txt', help='outfile that contains top genes in displayed '
                                                                               'network with calculated gene scores')
 parser.add_argument('--calcPVal', type=bool, default=False, help='the number of bins to separate edge densities into')
+parser.add_argument('--numPermutations', type=int, default=1000, help='most null populations to sample for the '
+                                                                         'p-value')
+parser.add_argument('--alpha', type=float, default=0.05, help='significance threshold, null sampling stops early once '
+                                                               'the p-value is clearly above or below it')
 parser.add_argument('--numBins', type=int, default=128, help='the number of bins to separate edge densities into')
+parser.add_argument('--backend', type=str, default='compact', choices=['compact', 'sparse', 'symmetric'],
+                    help='STRING network storage, sparse uses scipy.sparse matrix operations, symmetric stores '
+                         'each gene pair once')
+parser.add_argument('--minScore', type=float, default=None,
+                    help='drop STRING edges scored below this while reading, in the file\'s units (e.g. 700)')
+parser.add_argument('--hops', type=int, default=None,
+                    help='draw the co-functional null only from STRING genes within this many edges of the input '
+                         'genes')
+parser.add_argument('--binning', type=str, default='quantile', choices=['fixed', 'quantile', 'log'],
+                    help='how to bin STRING nodes by edge density for the co-functional null')
 parser.add_argument('--numSubnetworks', type=int, default=5000, help='the number of subnetworks to make')
+parser.add_argument('--scoreMode', type=str, default='sum', choices=['sum', 'max', 'last'],
+                    help='gene score from the edges a gene adds to a subnetwork: sum or max of their weights, or last '
+                         'for the weight of the last edge found')
+parser.add_argument('--scoreTolerance', type=float, default=None,
+                    help='stop gene scoring early once the 95%% confidence interval of each top gene score is within '
+                         'this tolerance')
+parser.add_argument('--islands', type=int, default=1, help='number of island populations to evolve in parallel')
+parser.add_argument('--workers', type=int, default=None, help='worker processes for the islands, defaults to the '
+                                                              'number of cores')
+parser.add_argument('--migrationInterval', type=int, default=10, help='generations between island migrations')
+parser.add_argument('--numMigrants', type=int, default=5, help='top subnetworks sent along each migration route')
+parser.add_argument('--topology', type=str, default='ring', choices=['ring', 'all', 'none'],
+                    help='which islands send migrants to which')
 parser.add_argument('--topGenes', type=bool, default=False, help='graph only top n genes regardless of loci')
 parser.add_argument('--numGenes', type=int, default=3, help='number of genes from each loci or total genes'
                                                                  ' if topGenes is true')
+parser.add_argument('--plots', type=str, default='files', choices=rendering.MODES,
+                    help='save figures to --plotDir while the run continues, show them interactively, or skip them')
+parser.add_argument('--no-plots', dest='plots', action='store_const', const='none',
+                    help='skip figures without importing matplotlib, networkx or nxviz')
+parser.add_argument('--outDir', type=str, default='.', help='directory the output files are written to')
+parser.add_argument('--plotDir', type=str, default=None, help='directory figures are saved in, defaults to outDir')
+parser.add_argument('--plotBackground', type=str, default='thread', choices=['thread', 'process'],
+                    help='draw saved figures in a background thread or process')
+parser.add_argument('--log', type=str, default=None, help='write stage timings, GA generations and null batches to '
+                                                          'this file as JSON lines')
+parser.add_argument('--profile', type=str, default=None, choices=['cprofile', 'tracemalloc'],
+                    help='profile the run, tracemalloc also adds each stage\'s peak memory to the log')
+parser.add_argument('--profileFile', type=str, default='profile.out', help='where --profile writes its results')
+parser.add_argument('--checkpoint', type=str, default=None, help='save the GA population and the partial null '
+                                                                 'distribution to this file as the run goes')
+parser.add_argument('--checkpointSeconds', type=float, default=300, help='seconds between checkpoint saves')
+parser.add_argument('--resume', action='store_true', help='continue from the checkpoint file, outDir/checkpoint.npz '
+                                                          'unless --checkpoint is given')
 
-args = parser.parse_args()
+# options that do not change the results, a checkpoint can be resumed with different values
+RESUMABLE_OPTIONS = ('geneOutFile', 'networkOutFile', 'workers', 'plots', 'plotDir', 'plotBackground', 'outDir', 'log',
+                     'profile', 'profileFile', 'checkpoint', 'checkpointSeconds', 'resume')
 
-def main():
-    start = time.time()
-    random.seed(5)
-    visualize = True
+# Load the STRING network the way the arguments ask for, always the whole cached network so
+# degrees are the full STRING degrees
+# @param args: parsed arguments
+# @returns interactions: CompactGraph of the STRING network
+def loadInteractions(args):
+    if args.backend == 'sparse':
+        return fileParsing.makeSparseInteractionNetwork(args.interactionsFile, args.minScore)
+    return fileParsing.makeCompactInteractionNetwork(args.interactionsFile, minScore=args.minScore,
+                                                     symmetric=args.backend == 'symmetric')
 
-    # read in networks
-    lociLists = fileParsing.readInput(args.genesFile)
-    interactions = fileParsing.makeInteractionNetwork(args.interactionsFile)
-    network = fileParsing.makeNetwork(lociLists, interactions)
+
+# @param args: parsed arguments
+# @returns runKey: hash of the input files and the options that change the results
+def checkpointKey(args):
+    options = {key: value for key, value in sorted(vars(args).items()) if key not in RESUMABLE_OPTIONS}
+    options['genesFileHash'] = networkCache.fileHash(args.genesFile)
+    options['interactionsFileSignature'] = networkCache.fileSignature(args.interactionsFile, withHash=False)
+    return hashlib.sha1(json.dumps(options, sort_keys=True).encode()).hexdigest()
+
+
+# @param args: parsed arguments
+# @returns checkpoint: checkpoint.Checkpoint of the run, resumed with --resume, or None without
+#   --checkpoint or --resume
+def openCheckpoint(args):
+    if args.checkpoint is None and not args.resume:
+        return None
+    fileName = args.checkpoint or os.path.join(args.outDir, 'checkpoint.npz')
+    if args.resume:
+        return checkpoint.Checkpoint.resume(fileName, checkpointKey(args), args.checkpointSeconds)
+    return checkpoint.Checkpoint(fileName, checkpointKey(args), args.checkpointSeconds)
+
+
+# Score the loci genes and evolve the subnetwork population
+# @param args: parsed arguments
+# @param lociLists: LociIndex of the input genes
+# @param interactions: CompactGraph of the STRING network
+# @param recorder: optional instrumentation.Recorder to time the stages with
+# @param runCheckpoint: optional checkpoint.Checkpoint the GA resumes from and saves to
+# @returns network, geneAvg, population: loci network, average gene scores and the final
+#   geneticAlgorithm.Population
+def evolve(args, lociLists, interactions, recorder=None, runCheckpoint=None):
+    if recorder is None:
+        recorder = instrumentation.Recorder()
+    random.seed(5)
+    rng = np.random.default_rng(5)
+    with recorder.timer('makeNetwork'):
+        network = fileParsing.makeNetwork(lociLists, interactions)
 
     # make loci subnetworks
-    lociSubN = networkCreation.makeLociSubnetworks(args.numSubnetworks, network, lociLists)
+    with recorder.timer('makeLociSubnetworks'):
+        lociWeights = networkCreation.makeLociWeightMatrix(network, lociLists)
+        lociGenomes = networkCreation.makeLociGenomes(args.numSubnetworks, lociLists, rng)
 
     # calculate gene scores and sort genes by score
-    geneScores = geneScoring.getGeneScores(lociSubN, lociLists, network)
-    geneAvg = geneScoring.getGeneScoreAvg(geneScores)
-    networkSorted = sorted(geneAvg, key=lambda k: geneAvg[k], reverse=True)
+    with recorder.timer('getGeneScores'):
+        if args.scoreTolerance is None:
+            scoreSums, scoreCounts = geneScoring.getGenomeGeneScores(lociGenomes, lociLists, lociWeights,
+                                                                     args.scoreMode)
+            geneAvg = geneScoring.getGenomeGeneScoreAvg(scoreSums, scoreCounts, lociLists)
+        else:
+            # score the subnetworks in batches until the top genes' scores are stable
+            batches = (lociGenomes[b:b + 500] for b in range(0, len(lociGenomes), 500))
+            accumulator = geneScoring.GeneScoreAccumulator(lociLists, lociWeights, args.scoreMode)
+            # check the genes that are reported, numGenes per locus unless --topGenes
+            accumulator = geneScoring.accumulateGeneScores(batches, accumulator, args.numGenes, args.scoreTolerance,
+                                                           perLocus=not args.topGenes)
+            geneAvg = accumulator.geneScoreAvg()
+
+    with recorder.timer('geneticAlg'):
+        population = geneticAlgorithm.Population(lociGenomes, lociLists, lociWeights)
+        if args.islands > 1:
+            population = islandModel.islandGeneticAlg(population, args.islands, 5, args.workers,
+                                                      args.migrationInterval, args.numMigrants, args.topology,
+                                                      recorder=recorder, checkpoint=runCheckpoint)
+        else:
+            population = geneticAlgorithm.geneticAlgGenomes(population, rng, recorder=recorder, outDir=args.outDir,
+                                                            checkpoint=runCheckpoint)
+    return network, geneAvg, population
+
+
+# Empirical p-value of the population against co-functional STRING subnetworks
+# @param args: parsed arguments
+# @param interactions: CompactGraph of the STRING network
+# @param population: geneticAlgorithm.Population from evolve
+# @param plots: bool of whether to plot the null distribution
+# @param recorder: optional instrumentation.Recorder to time the stages with
+# @param runCheckpoint: optional checkpoint.Checkpoint the null sampling resumes from and saves to
+# @returns nullResult: nullDistribution.NullResult
+def nullPValue(args, interactions, population, plots=True, recorder=None, runCheckpoint=None):
+    if recorder is None:
+        recorder = instrumentation.Recorder()
+    # make bins for coFunctional subnetwork creation, cached with the compiled STRING network
+    with recorder.timer('degreeBins'):
+        networkBins = degreeBins.graphDegreeBins(interactions, args.numBins, args.binning)
+    # make coFunctional random subnetworks
+    # null populations are sampled in parallel until the p-value is clearly above or below alpha
+    newPop = population.toSubnetworks()
+    with recorder.timer('nullModel'):
+        # optionally sample only genes near the input genes, matched on their full STRING degree
+        allowed = None
+        if args.hops is not None:
+            allowed = interactions.neighborhood(interactions.ids(population.lociIndex.genes), args.hops)
+        nullModel = nullDistribution.NullModel.fromSubnetworks(interactions, networkBins, newPop, allowed)
+    with recorder.timer('nullLoop'):
+        nullResult = nullDistribution.empiricalNullPVal(nullModel, population.totalDensity/len(population), 5,
+                                                        args.workers, maxPermutations=args.numPermutations,
+                                                        alpha=args.alpha, recorder=recorder,
+                                                        checkpoint=runCheckpoint)
+    if plots:
+        coFPopDensities = nullResult.densities.tolist()
+        # plot the null distribution against the population density, labelled with the p-value above
+        statistics.nullPValHistogram(coFPopDensities, population.totalDensity/len(population), nullResult.pval)
+
+        # make a graph showing the edge density distributions
+        lociDensities = population.fitness.tolist()
+
+        statistics.overlappingHistogram(lociDensities, coFPopDensities)
+    return nullResult
+
+
+# @param argv: optional argument list, sys.argv is used if not given
+def main(argv=None):
+    args = parser.parse_args(argv)
+    recorder = instrumentation.Recorder([instrumentation.ConsoleProgress()])
+    log = None
+    if args.log is not None:
+        log = instrumentation.JsonLinesLog(args.log)
+        recorder.subscribe(log)
+    rendering.configure(args.plots, args.plotDir or args.outDir, args.plotBackground)
+    try:
+        with instrumentation.profile(args.profile, args.profileFile):
+            run(args, recorder)
+    finally:
+        # figures still being drawn are waited for even when the run fails
+        with recorder.timer('plots'):
+            rendering.finish()
+        recorder.finish()
+        if log is not None:
+            log.close()
 
-    newPop = geneticAlgorithm.geneticAlg(lociSubN, lociLists, network)
+
+# @param args: parsed arguments
+# @param recorder: instrumentation.Recorder to time the stages with
+def run(args, recorder):
+    # read in networks
+    with recorder.timer('parse'):
+        lociLists = fileParsing.readLociIndex(args.genesFile)
+        interactions = loadInteractions(args)
+    analyze(args, lociLists, interactions, recorder)
+
+
+# Evolve, test and write the outputs of one gene set into args.outDir
+# @param args: parsed arguments
+# @param lociLists: LociIndex of the input genes
+# @param interactions: CompactGraph of the STRING network
+# @param recorder: instrumentation.Recorder to time the stages with
+# @returns summary: dict of the p-value, its interval and the final population density
+def analyze(args, lociLists, interactions, recorder):
+    start = time.time()
+    visualize = True
+    plots = args.plots != 'none'
+    os.makedirs(args.outDir, exist_ok=True)
+    runCheckpoint = openCheckpoint(args)
+
+    network, geneAvg, population = evolve(args, lociLists, interactions, recorder, runCheckpoint)
+    networkSorted = sorted(geneAvg, key=lambda k: geneAvg[k], reverse=True)
+    newPop = population.toSubnetworks()
 
 
     print(time.time() - start)
@@ -61,62 +258,43 @@ def main():
     # get top numGenes from each loci
     # make network with genes
     if visualize:
-        if not args.topGenes:
-            genes = geneScoring.getTopLociGenes(geneAvg, lociLists, args.numGenes)
-            visualNetwork = networkVisualization.makeCrossLociNetwork(genes, network, lociLists)
-
-        # get top numGenes regardless of loci
-        # make network with genes
-        if args.topGenes:
-            genes = networkSorted[:args.numGenes]
-            visualNetwork = networkVisualization.makeCrossLociNetwork(genes, network, lociLists)
-
-        # write to output file the genes loci and gene score of genes in the network
-        networkVisualization.outputGeneScores(geneAvg, genes, args.geneOutFile, lociLists)
-        # make graph with specified genes
-        # 1. gene score - size of node
-        # 2. loci of gene - color of node
-        # 3. weight of edge - darkness of edge
-        # make network between loci genes no edges between genes in same loci
-        graph = networkVisualization.makeGraph(visualNetwork, lociLists, geneAvg)
-        networkVisualization.visualizeGraph(graph, args.topGenes)
-
-    if args.calcPVal:
-        numBins = args.numBins
-        # make bins for coFunctional subnetwork creation
-        qNetworkBins = networkCreation.makeQuantileBins(interactions, numBins)
-        fNetworkBins = networkCreation.makeFixedBins(interactions, numBins)
-        # make coFunctional random subnetworks
-        # need 1000 populations where populations are the 5000 networks
-        coFPopDensities = []
-        for i in range(1000):
-            coFSubnetworks = networkCreation.makeCoFSubnetworks(interactions, qNetworkBins, newPop)
-            popD = 0
-
-            for subCoF in coFSubnetworks:
-                popD += statistics.calcEdgeDensityW(subCoF)
-            coFPopDensities.append(popD/len(coFSubnetworks))
-
-        # calculate the avg of each population -> makeCoFSubnetorks is one population?
-        # calculate the pvalue
-        # probability edges using cof distribution is greater than avg of loci edged divided by # of random networks
-
-        pval = statistics.empiricalPVal(newPop, coFPopDensities)
+        with recorder.timer('visualize'):
+            if not args.topGenes:
+                genes = geneScoring.getTopLociGenes(geneAvg, lociLists, args.numGenes)
+                visualNetwork = networkVisualization.makeCrossLociNetwork(genes, network, lociLists)
 
-        # make a graph showing the edge density distributions
-        coFDensities = []
-        for network in coFSubnetworks:
-            coFDensities.append(statistics.calcEdgeDensityW(network))
-
-        lociDensities = []
-        for network in newPop:
-            lociDensities.append(statistics.calcEdgeDensityW(network))
+            # get top numGenes regardless of loci
+            # make network with genes
+            if args.topGenes:
+                genes = networkSorted[:args.numGenes]
+                visualNetwork = networkVisualization.makeCrossLociNetwork(genes, network, lociLists)
 
-        statistics.overlappingHistogram(lociDensities, coFPopDensities)
+            # write to output file the genes loci and gene score of genes in the network
+            networkVisualization.outputGeneScores(geneAvg, genes, os.path.join(args.outDir, args.geneOutFile),
+                                                  lociLists)
+            # make graph with specified genes
+            # 1. gene score - size of node
+            # 2. loci of gene - color of node
+            # 3. weight of edge - darkness of edge
+            # make network between loci genes no edges between genes in same loci
+            if plots:
+                graph = networkVisualization.makeGraph(visualNetwork, lociLists, geneAvg)
+                networkVisualization.visualizeGraph(graph, args.topGenes)
 
+    pval = 'NA'
+    summary = {'populationDensity': population.totalDensity/len(population), 'pval': pval}
+    if args.calcPVal:
+        nullResult = nullPValue(args, interactions, population, plots, recorder, runCheckpoint)
+        pval = nullResult.pval
+        print('P-val CI : ', nullResult.ciLow, nullResult.ciHigh, ' permutations : ', nullResult.numPermutations)
         print('P-val : ', pval)
+        summary.update(pval=pval, ciLow=nullResult.ciLow, ciHigh=nullResult.ciHigh,
+                       numPermutations=nullResult.numPermutations)
     print(time.time() - start)
-    outputFiles.outputNetworks(pval, newPop, 10)
-    outputFiles.outputGeneScoresinLoci(geneAvg, lociLists)
+    with recorder.timer('output'):
+        outputFiles.outputNetworks(pval, newPop, 10, args.outDir)
+        outputFiles.outputGeneScoresinLoci(geneAvg, lociLists, args.outDir)
+    return summary
 
-main()
\ No newline at end of file
+if __name__ == '__main__':
+    main()
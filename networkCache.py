@@ -0,0 +1,219 @@
+# Purpose: Compile the STRING interaction file once into a binary cache and memory-map it
+#   on later runs. The cache is a directory next to the STRING file holding
+#       genes.txt      interned gene names, line number is the gene id
+#       offsets.npy    CSR row offsets, neighbors of gene i are neighbors[offsets[i]:offsets[i+1]]
+#       neighbors.npy  int32 neighbor gene ids, sorted within each row
+#       weights.npy    float32 edge weights aligned with neighbors.npy
+#       symmetric-*.npy the same network with each gene pair stored once, see SymmetricGraph,
+#                      only compiled the first time the cache is loaded with symmetric=True
+#       meta.json      size, mtime and sha1 of the source STRING file, the stores compiled, and
+#                      counts of duplicated, one way, mismatched and self-loop edges in it
+#       bins-*.npz     degree bins, written by degreeBins.graphDegreeBins when first used, with
+#                      the symmetric- prefix for the symmetric store
+
+import hashlib, json, os, sys
+import numpy as np
+from compactGraph import CompactGraph, SymmetricGraph, buildCSR, buildUpperCSR, checkSymmetry
+from degreeBins import clearCachedBins
+import stringParser
+
+CACHE_VERSION = 5
+# file name prefix of each adjacency store
+STORES = {'full': '', 'symmetric': 'symmetric-'}
+
+
+# Filtered networks get their own cache directory so they never replace the full network's
+# @param stringFile: STRING file of protein-protein interactions
+# @param minScore: lowest score kept, or None
+# @param genes: gene whitelist, or None
+# @returns cacheDir: default cache directory for the STRING file
+def defaultCacheDir(stringFile, minScore=None, genes=None):
+    if minScore is None and genes is None:
+        return stringFile + '.cache'
+    key = hashlib.sha1(json.dumps(filterSignature(minScore, genes)).encode()).hexdigest()[:12]
+    return stringFile + '.' + key + '.cache'
+
+
+# @param stringFile: file to hash
+# @returns digest: sha1 hex digest of the file contents
+def fileHash(stringFile):
+    h = hashlib.sha1()
+    with open(stringFile, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+# @param stringFile: STRING file of protein-protein interactions
+# @param withHash: bool of whether to hash the file contents, slow for large files
+# @returns signature: dict of size, mtime and optionally the sha1 of the file
+def fileSignature(stringFile, withHash=True):
+    st = os.stat(stringFile)
+    signature = {'version': CACHE_VERSION, 'size': st.st_size, 'mtime': st.st_mtime_ns}
+    if withHash:
+        signature['sha1'] = fileHash(stringFile)
+    return signature
+
+
+# Parse the STRING file into interned gene names and edge arrays
+# @param stringFile: STRING file of protein-protein interactions, see stringParser for the formats read
+# @param minScore: optional lowest score to keep, in the file's units
+# @param genes: optional gene whitelist, only edges between two of them are kept
+# @returns genes, src, dst, weight: gene name table and edge arrays
+def parseInteractions(stringFile, minScore=None, genes=None):
+    return stringParser.timedReadInteractions(stringFile, minScore, genes)
+
+
+# @param minScore: lowest score kept, or None
+# @param genes: gene whitelist, or None
+# @returns filters: dict describing the filters, stored in meta.json
+def filterSignature(minScore=None, genes=None):
+    filters = {'minScore': minScore, 'genes': None}
+    if genes is not None:
+        filters['genes'] = hashlib.sha1('\n'.join(sorted(genes)).encode()).hexdigest()
+    return filters
+
+
+# One-time compile step: parse the STRING file and write the binary cache with one adjacency
+# store, full CSR or symmetric. Stores already compiled from the same file can be kept so a cache
+# only holds the stores that were asked for.
+# meta.json is written last so a half-written cache is never considered valid
+# @param stringFile: STRING file of protein-protein interactions
+# @param cacheDir: directory to write the cache to, defaults to defaultCacheDir
+# @param minScore: optional lowest score to keep, in the file's units
+# @param genes: optional gene whitelist, only edges between two of them are kept
+# @param symmetric: bool to compile the symmetric store instead of the full CSR
+# @param keepStores: names of stores in the cache that are still valid and should be kept
+# @returns cacheDir: directory the cache was written to
+def compileInteractionNetwork(stringFile, cacheDir=None, minScore=None, genes=None, symmetric=False, keepStores=()):
+    if cacheDir is None:
+        cacheDir = defaultCacheDir(stringFile, minScore, genes)
+    os.makedirs(cacheDir, exist_ok=True)
+    metaFile = os.path.join(cacheDir, 'meta.json')
+    if os.path.exists(metaFile):
+        os.remove(metaFile)
+    store = 'symmetric' if symmetric else 'full'
+    stores = sorted(set(keepStores) | {store})
+    if not keepStores:
+        clearCachedBins(cacheDir)
+    for name, prefix in STORES.items():
+        if name not in stores:
+            for part in ('offsets', 'neighbors', 'weights'):
+                partFile = os.path.join(cacheDir, prefix + part + '.npy')
+                if os.path.exists(partFile):
+                    os.remove(partFile)
+
+    geneNames, src, dst, weight = parseInteractions(stringFile, minScore, genes)
+    report = checkSymmetry(geneNames, src, dst, weight)
+    if report.duplicated or report.oneWay or report.mismatched or report.selfLoops:
+        print('STRING edges:', report.duplicated, 'duplicated,', report.oneWay, 'pairs listed one way,',
+              report.mismatched, 'pairs with different weights each way,', report.selfLoops, 'self loops, e.g.',
+              report.examples)
+    build = buildUpperCSR if symmetric else buildCSR
+    offsets, neighbors, weights = build(len(geneNames), src, dst, weight)
+
+    with open(os.path.join(cacheDir, 'genes.txt'), 'w') as f:
+        f.write('\n'.join(geneNames))
+    prefix = STORES[store]
+    np.save(os.path.join(cacheDir, prefix + 'offsets.npy'), offsets)
+    np.save(os.path.join(cacheDir, prefix + 'neighbors.npy'), neighbors)
+    np.save(os.path.join(cacheDir, prefix + 'weights.npy'), weights)
+
+    signature = fileSignature(stringFile)
+    signature.update(filterSignature(minScore, genes))
+    signature['stores'] = stores
+    signature['numGenes'] = len(geneNames)
+    # distinct directed edges, the size of the full CSR
+    signature['numEdges'] = report.numEdges - report.duplicated
+    signature['duplicatedEdges'] = report.duplicated
+    signature['oneWayPairs'] = report.oneWay
+    signature['mismatchedPairs'] = report.mismatched
+    signature['selfLoops'] = report.selfLoops
+    with open(metaFile, 'w') as f:
+        json.dump(signature, f)
+    return cacheDir
+
+
+# @param cacheDir: cache directory with a meta.json
+# @returns stores: names of the adjacency stores compiled into the cache
+def cachedStores(cacheDir):
+    with open(os.path.join(cacheDir, 'meta.json'), 'r') as f:
+        return json.load(f).get('stores', [])
+
+
+# Check a cache against its source file. Size and mtime matching is trusted without reading
+# the source; if only the mtime changed the file is hashed and the cache kept when the
+# contents are the same.
+# @param stringFile: STRING file the cache was compiled from
+# @param cacheDir: cache directory
+# @param minScore: lowest score the cache should keep, or None
+# @param genes: gene whitelist the cache should use, or None
+# @returns valid: bool of whether the cache can be used
+def isCacheValid(stringFile, cacheDir, minScore=None, genes=None):
+    metaFile = os.path.join(cacheDir, 'meta.json')
+    if not os.path.exists(metaFile):
+        return False
+    with open(metaFile, 'r') as f:
+        meta = json.load(f)
+    for key, value in filterSignature(minScore, genes).items():
+        if meta.get(key) != value:
+            return False
+
+    current = fileSignature(stringFile, withHash=False)
+    if meta.get('version') != current['version'] or meta.get('size') != current['size']:
+        return False
+    if meta.get('mtime') == current['mtime']:
+        return True
+    if meta.get('sha1') != fileHash(stringFile):
+        return False
+
+    # same contents with a new mtime, refresh so the next run takes the fast path
+    meta['mtime'] = current['mtime']
+    with open(metaFile, 'w') as f:
+        json.dump(meta, f)
+    return True
+
+
+# Memory-map a compiled cache
+# @param cacheDir: cache directory written by compileInteractionNetwork
+# @param symmetric: bool to load the store with each gene pair once as a SymmetricGraph
+# @returns network: CompactGraph over read-only memory-mapped arrays
+def loadCompiledNetwork(cacheDir, symmetric=False):
+    with open(os.path.join(cacheDir, 'genes.txt'), 'r') as f:
+        genes = f.read().split('\n')
+    prefix = STORES['symmetric' if symmetric else 'full']
+    offsets = np.load(os.path.join(cacheDir, prefix + 'offsets.npy'), mmap_mode='r')
+    neighbors = np.load(os.path.join(cacheDir, prefix + 'neighbors.npy'), mmap_mode='r')
+    weights = np.load(os.path.join(cacheDir, prefix + 'weights.npy'), mmap_mode='r')
+    if len(genes) == 1 and genes[0] == '':
+        genes = []
+    graphClass = SymmetricGraph if symmetric else CompactGraph
+    network = graphClass(genes, offsets, neighbors, weights)
+    network.cacheDir = cacheDir
+    return network
+
+
+# Load the STRING network from its binary cache, compiling it first if the cache is
+# missing or stale, or does not have the store asked for yet
+# @param stringFile: STRING file of protein-protein interactions
+# @param cacheDir: cache directory, defaults to defaultCacheDir
+# @param rebuild: bool to force recompiling the cache
+# @param minScore: optional lowest score to keep, in the file's units
+# @param genes: optional gene whitelist, only edges between two of them are kept
+# @param symmetric: bool to load the store with each gene pair once as a SymmetricGraph
+# @returns network: CompactGraph over memory-mapped arrays
+def loadInteractionNetwork(stringFile, cacheDir=None, rebuild=False, minScore=None, genes=None, symmetric=False):
+    if cacheDir is None:
+        cacheDir = defaultCacheDir(stringFile, minScore, genes)
+    stores = []
+    if not rebuild and isCacheValid(stringFile, cacheDir, minScore, genes):
+        stores = cachedStores(cacheDir)
+    if ('symmetric' if symmetric else 'full') not in stores:
+        compileInteractionNetwork(stringFile, cacheDir, minScore, genes, symmetric, stores)
+    return loadCompiledNetwork(cacheDir, symmetric)
+
+
+if __name__ == '__main__':
+    # python networkCache.py STRING.txt [cacheDir] [minScore]
+    compileInteractionNetwork(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None,
+                              float(sys.argv[3]) if len(sys.argv) > 3 else None)
@@ -2,19 +2,96 @@
 # Date: September 29, 2021
 # Purpose: Create subnetworks and full network from FA loci genes and STRING database
 
-import random, math
+import random
+import numpy as np
+from compactGraph import CompactGraph, asCompactGraph
+from lociIndex import asLociIndex
+import degreeBins
 
 # @param numNetworks number of subnetworks to make from the locilists
 # @param fullNetwork gene:gene interactions dictionary
 # @param lociLists list of lists where each sublist is the genes at one loci
 # @returns subnetworks list of the loci subnetwork dictionaries
 def makeLociSubnetworks(numNetworks, fullNetwork, lociLists):
+    if isinstance(fullNetwork, CompactGraph):
+        # same gene choices as createSubnetwork, edges of every subnetwork found in one batch
+        geneSets = [[random.choice(list(loci)) for loci in lociLists] for i in range(numNetworks)]
+        return fullNetwork.subnetworkDicts(geneSets)
+
     subNetworks = []
     for i in range(numNetworks):
         subNetworks.append(createSubnetwork(fullNetwork, lociLists))
     return subNetworks
 
 
+# Dense lookup of edge weights between all loci genes, rows and columns are LociIndex gene ids
+# edges between genes in the same locus are zeroed since a prix fixe subnetwork has one gene per locus
+# assumption: the loci gene count is small enough for a genes x genes float32 matrix
+# @param fullNetwork: gene:gene interactions dictionary or CompactGraph
+# @param lociLists: LociIndex or list of lists where each sublist is the genes at one loci
+# @returns lociWeights: numGenes x numGenes float32 matrix of inter-locus edge weights
+def makeLociWeightMatrix(fullNetwork, lociLists):
+    lociIndex = asLociIndex(lociLists)
+    if isinstance(fullNetwork, CompactGraph):
+        lociWeights = fullNetwork.denseWeights(fullNetwork.ids(lociIndex.genes)).astype(np.float32)
+    else:
+        lociWeights = np.zeros((lociIndex.numGenes, lociIndex.numGenes), dtype=np.float32)
+        for i, gene1 in enumerate(lociIndex.genes):
+            for gene2, weight in fullNetwork.get(gene1, {}).items():
+                j = lociIndex.geneIds.get(gene2)
+                if j is not None:
+                    lociWeights[i, j] = float(weight)
+
+    lociWeights[lociIndex.geneLoci[:, None] == lociIndex.geneLoci[None, :]] = 0
+    return lociWeights
+
+
+# Batch version of makeLociSubnetworks. Every subnetwork is drawn at once as one row of a
+# matrix holding one LociIndex gene id per locus.
+# @param numNetworks: number of subnetworks to make
+# @param lociLists: LociIndex or list of lists where each sublist is the genes at one loci
+# @param rng: numpy Generator or seed
+# @returns genomes: numNetworks x numLoci int matrix, column l is the gene id picked from locus l
+def makeLociGenomes(numNetworks, lociLists, rng=None):
+    lociIndex = asLociIndex(lociLists)
+    rng = np.random.default_rng(rng)
+    choices = rng.integers(0, lociIndex.lociSizes, size=(numNetworks, lociIndex.numLoci))
+    return lociIndex.lociOffsets[:-1] + choices
+
+
+# Turn genomes back into subnetwork dictionaries for code that still works on dicts
+# @param genomes: numNetworks x numLoci int matrix from makeLociGenomes
+# @param lociLists: LociIndex or list of lists where each sublist is the genes at one loci
+# @param lociWeights: matrix from makeLociWeightMatrix
+# @returns subnetworks: list of the loci subnetwork dictionaries
+def genomesToSubnetworks(genomes, lociLists, lociWeights):
+    lociIndex = asLociIndex(lociLists)
+    genes = lociIndex.genes
+    subNetworks = []
+    for genome in np.asarray(genomes).tolist():
+        subWeights = lociWeights[np.ix_(genome, genome)]
+        subNetwork = {genes[g]: {} for g in genome}
+        for a, b in zip(*np.nonzero(subWeights)):
+            subNetwork[genes[genome[a]]][genes[genome[b]]] = float(subWeights[a, b])
+        subNetworks.append(subNetwork)
+    return subNetworks
+
+
+# Genomes of prix fixe subnetwork dictionaries, the inverse of genomesToSubnetworks
+# @param subnetworks: list of subnetwork dictionaries with one gene from each loci
+# @param lociLists: LociIndex or list of lists where each sublist is the genes at one loci
+# @returns genomes: numNetworks x numLoci int matrix, column l is the gene id picked from locus l
+def subnetworksToGenomes(subnetworks, lociLists):
+    lociIndex = asLociIndex(lociLists)
+    genomes = np.full((len(subnetworks), lociIndex.numLoci), -1, dtype=np.int64)
+    for n, subNetwork in enumerate(subnetworks):
+        for gene in subNetwork:
+            genomes[n, lociIndex.geneLocus[gene]] = lociIndex.geneIds[gene]
+    if (genomes < 0).any():
+        raise ValueError('subnetworks must have one gene from each loci')
+    return genomes
+
+
 # @param fullNetwork: gene:gene interactions dictionary
 # @param lociLists: list of lists where each sublist is the genes at one loci
 # @returns subNetwork: dictionary subnetwork of loci network with one random gene from each loci
@@ -26,6 +103,9 @@ def createSubnetwork(fullNetwork, lociLists):
         randGene = random.choice(list(loci))
         subNetwork[randGene] = {}
 
+    if isinstance(fullNetwork, CompactGraph):
+        return fullNetwork.subnetworkDict(list(subNetwork))
+
     # get edges
     for gene1 in subNetwork:
         # connect nodes with edges
@@ -38,111 +118,172 @@ def createSubnetwork(fullNetwork, lociLists):
 
 
 
+# @param fullNetwork: gene:gene interactions dictionary or CompactGraph
+# @return genes, degrees: node names and int array of their number of edges
+def networkDegrees(fullNetwork):
+    if isinstance(fullNetwork, CompactGraph):
+        return fullNetwork.genes, fullNetwork.degrees
+    genes = list(fullNetwork)
+    return genes, np.array([len(fullNetwork[gene]) for gene in genes], dtype=np.int64)
+
+
+# @param fullNetwork: gene:gene interactions dictionary or CompactGraph
+# @param numBins: number of bins to separate the nodes into by edge density
+# @param strategy: 'fixed', 'quantile' or 'log', see degreeBins
+# @return numBins: nodes from fullNetwork organized into bins, lowest edge density first in each bin
+def makeBins(fullNetwork, numBins, strategy):
+    genes, degrees = networkDegrees(fullNetwork)
+    if isinstance(fullNetwork, CompactGraph):
+        bins = degreeBins.graphDegreeBins(fullNetwork, numBins, strategy)
+    else:
+        bins = degreeBins.makeDegreeBins(degrees, numBins, strategy)
+    return bins.toLists(genes)
+
+
 # limitations: once you get higher the bins get more empty
 # @param fullNetwork: gene:gene interactions dictionary
 # @param numBins: number of bins to separate the bins into by edge density
 # @return numBins: nodes from fullNetwork organized into bins
 def makeFixedBins(fullNetwork, numBins):
-    fullNetworkBins = []
-    # dict should be node: num Edges
-    # sort dict by values
     # 128 bins like in paper -> equally spaced
-
-    # sort nodes by number of edges
-    networkSorted = sorted(fullNetwork, key=lambda k: len(fullNetwork[k]), reverse=False)
-    maxEdges = len(fullNetwork[networkSorted[-1]])
-    binSize = round(maxEdges/numBins)
-
-    for i in range(numBins):
-        fullNetworkBins.append([])
-
-    # put nodes in bins according to edge number
     # bins can be variable sizes
-    for node in networkSorted:
-        nodeDensity = len(fullNetwork[node])
-        nodeBin = math.floor(nodeDensity/binSize)
-        fullNetworkBins[nodeBin].append(node)
-
-    return fullNetworkBins
+    return makeBins(fullNetwork, numBins, 'fixed')
 
 
 # @param fullNetwork: gene:gene interactions dictionary
 # @param numBins: number of bins to separate the bins into by edge density
 # @return numBins: nodes from fullNetwork organized into bins
 def makeQuantileBins(fullNetwork, numBins):
-    fullNetworkBins = []
-    # dict should be node: num Edges
-    # sort dict by values
-    # 128 bins like in paper -> equally spaced
-
-    # sort nodes by number of edges
-    networkSorted = sorted(fullNetwork, key=lambda k: len(fullNetwork[k]), reverse=False)
-    numNodes = len(fullNetwork)
-    binSize = round(numNodes/numBins)
-
     # make each bin the same size
     # nodes in bins according to number of edges
-    for i in range(numBins):
-        binStart = i*binSize
-        binEnd = (i+1)*binSize
-        fullNetworkBins.append(networkSorted[binStart:binEnd])
-    return fullNetworkBins
+    return makeBins(fullNetwork, numBins, 'quantile')
+
+
+# @param fullNetwork: gene:gene interactions dictionary
+# @param numBins: number of bins to separate the bins into by edge density
+# @return numBins: nodes from fullNetwork organized into log spaced bins of edge density
+def makeLogBins(fullNetwork, numBins):
+    return makeBins(fullNetwork, numBins, 'log')
+
+
+# Degree matched node sampler over degree bins, built once from degreeBins or makeQuantileBins/makeFixedBins.
+# Bin upper bounds are kept sorted so a node's bin is a binary search, and all bin members are
+# kept in one array so a whole population of nodes is sampled in one call.
+# A node is matched to the first bin whose densest node has at least as many edges, nodes
+# denser than every bin use the last bin.
+# @param graph: CompactGraph of the full network
+# @param members: int array of graph gene ids of every non-empty bin, one bin after another
+# @param binOffsets: bin b is members[binOffsets[b]:binOffsets[b+1]]
+# @param binMax: sorted int array of the largest degree in each bin
+class DegreeBinSampler:
+    def __init__(self, graph, members, binOffsets, binMax):
+        self.graph = graph
+        self.degrees = graph.degrees
+        self.members = np.asarray(members, dtype=np.int64)
+        self.binOffsets = np.asarray(binOffsets, dtype=np.int64)
+        self.binSizes = np.diff(self.binOffsets)
+        self.binMax = np.asarray(binMax, dtype=np.int64)
+
+    # @param graph: CompactGraph of the full network
+    # @param fullNetworkBins: degreeBins.DegreeBins of graph, or nodes organized into bins by edge density
+    # @param allowed: optional int array of the graph gene ids that may be sampled, nodes keep
+    #   their bins and degrees from the full network
+    # @returns sampler: DegreeBinSampler over the non-empty bins
+    @classmethod
+    def fromBins(cls, graph, fullNetworkBins, allowed=None):
+        if isinstance(fullNetworkBins, degreeBins.DegreeBins):
+            bins = [fullNetworkBins.binMembers(b) for b in range(len(fullNetworkBins))]
+        else:
+            bins = [graph.ids(b) for b in fullNetworkBins]
+        if allowed is not None:
+            keep = np.zeros(len(graph.genes), dtype=bool)
+            keep[np.asarray(allowed, dtype=np.int64)] = True
+            bins = [b[keep[b]] for b in bins]
+        bins = [b for b in bins if len(b) > 0]
+        members = np.concatenate(bins) if bins else np.zeros(0, dtype=np.int64)
+        binOffsets = np.concatenate(([0], np.cumsum([len(b) for b in bins])))
+        binMax = np.maximum.accumulate([graph.degrees[b].max() for b in bins]) if bins else []
+        return cls(graph, members, binOffsets, binMax)
+
+    # @param genes: gene names, genes not in the graph have no edges
+    # @returns bins: int array of the degree bin of each gene
+    def binsOfGenes(self, genes):
+        ids = self.graph.ids(genes)
+        degrees = np.where(ids >= 0, self.degrees[np.maximum(ids, 0)], 0)
+        return self.binsOfDegrees(degrees)
+
+    # @param degrees: int array of node degrees
+    # @returns bins: int array of the degree bin of each degree
+    def binsOfDegrees(self, degrees):
+        bins = np.searchsorted(self.binMax, degrees, side='left')
+        return np.minimum(bins, len(self.binMax) - 1)
+
+    # Sample one node from each position's bin, nodes in the same row are all different.
+    # Repeats within a row are redrawn until none are left, unless a row needs more nodes
+    # from a bin than the bin has.
+    # @param nodeBins: numNetworks x numNodes int array of degree bins
+    # @param rng: numpy Generator
+    # @returns nodes: numNetworks x numNodes int array of graph gene ids
+    def sample(self, nodeBins, rng):
+        nodeBins = np.atleast_2d(np.asarray(nodeBins, dtype=np.int64))
+        sizes = self.binSizes[nodeBins]
+        starts = self.binOffsets[nodeBins]
+        nodes = self.members[starts + (rng.random(nodeBins.shape)*sizes).astype(np.int64)]
+
+        # rows that need more distinct nodes from a bin than it holds keep their repeats
+        numBins = len(self.binSizes)
+        rowCounts = np.zeros((len(nodeBins), numBins), dtype=np.int64)
+        np.add.at(rowCounts, (np.arange(len(nodeBins))[:, None], nodeBins), 1)
+        possible = (rowCounts <= self.binSizes[None, :]).all(axis=1)
+
+        while True:
+            repeats = findRowRepeats(nodes) & possible[:, None]
+            if not repeats.any():
+                return nodes
+            rows, cols = np.nonzero(repeats)
+            redraw = (rng.random(len(rows))*sizes[rows, cols]).astype(np.int64)
+            nodes[rows, cols] = self.members[starts[rows, cols] + redraw]
+
+
+# @param nodes: numNetworks x numNodes int array
+# @returns repeats: bool array marking every entry equal to an earlier entry in its row
+def findRowRepeats(nodes):
+    order = np.argsort(nodes, axis=1, kind='stable')
+    sortedNodes = np.take_along_axis(nodes, order, axis=1)
+    sortedRepeats = np.zeros(nodes.shape, dtype=bool)
+    sortedRepeats[:, 1:] = sortedNodes[:, 1:] == sortedNodes[:, :-1]
+    repeats = np.zeros(nodes.shape, dtype=bool)
+    np.put_along_axis(repeats, order, sortedRepeats, axis=1)
+    return repeats
 
 
-# assumptions: no node in the lociSubN will have over 10k edges
 # create a subnetwork of the cofunctional network
 # where nodes have similar density to nodes in the loci sub network
-# @param fullNetwork: gene:gene interactions dictionary
-# @param fullNetworkBins: nodes from fullNetwork organized into bins by edge density
+# @param fullNetwork: gene:gene interactions dictionary or CompactGraph
+# @param fullNetworkBins: nodes from fullNetwork organized into bins by edge density, degreeBins.DegreeBins
+#   of them, or a DegreeBinSampler of them to reuse across calls
 # @param lociSubN: subnetworks made from the loci genes
 # @return coFSubnetworks: subnetworks of fullNetwork where nodes random selected to be equivalent to nodes in
 #   loci subnetworks
 def makeCoFSubnetworks(fullNetwork, fullNetworkBins, lociSubN,):
     # for each node in lociSubN
     #   pick node from networkBins where numEdges is similar for both
+    #   nodes are never repeated within a subnetwork
     # make edges between picked nodes
-    # if bin is empty go to the closest... look above and below
-
-    coFSubnetworks = []
-    #lociD = []
-    coFD = []
-
-    for subNetwork in lociSubN:
-        tempSubnetwork = {}
-        for node in subNetwork:
-            # check node density from the fullNetwork so that its equivalent
-            if node in fullNetwork:
-                nodeDensity = len(fullNetwork[node])
-            else:
-                nodeDensity = 0
-            #lociD.append(nodeDensity)
-
-            # loop through bin
-            # first bin that smaller than last element pick from that bin
-            for bin in fullNetworkBins:
-                if len(bin) > 0:
-                    binMax = len(fullNetwork[bin[-1]])
-                else:
-                    binMax = -1
-                if binMax >= nodeDensity:
-                    # pick random from bin
-                    # make sure random not already in subnetwork
-                    node = random.choice(bin)
-                    if node in tempSubnetwork:
-                        node = random.choice(bin)
-                    tempSubnetwork[node] = {}
-                    coFD.append(len(fullNetwork[node]))
-                    break
-
-            # pick node with similar density
-            # density is from
-            # make sure node isn't already in network
-            # if bin is empty go to nearest -> look above and below
-        # make edges between picked nodes
-        for tempNode in tempSubnetwork:
-            for edge in fullNetwork[tempNode]:
-                if edge in tempSubnetwork:
-                    tempSubnetwork[tempNode][edge] = fullNetwork[tempNode][edge]
-
-        coFSubnetworks.append(tempSubnetwork)
-    return coFSubnetworks
+    sampler = fullNetworkBins
+    if not isinstance(sampler, DegreeBinSampler):
+        sampler = DegreeBinSampler.fromBins(asCompactGraph(fullNetwork), fullNetworkBins)
+    graph = sampler.graph
+    rng = np.random.default_rng(random.getrandbits(64))
+
+    # the whole population is drawn in one sample call per subnetwork size, loci subnetworks
+    # all have one gene per locus so there is normally a single call
+    geneLists = [list(subNetwork) for subNetwork in lociSubN]
+    geneSets = [None]*len(geneLists)
+    for size in sorted({len(genes) for genes in geneLists}):
+        rows = [n for n, genes in enumerate(geneLists) if len(genes) == size]
+        nodeBins = sampler.binsOfGenes([gene for n in rows for gene in geneLists[n]]).reshape(len(rows), size)
+        nodes = sampler.sample(nodeBins, rng)
+        for n, row in zip(rows, nodes.tolist()):
+            geneSets[n] = [graph.genes[node] for node in row]
+    return graph.subnetworkDicts(geneSets)
@@ -5,41 +5,47 @@
 #       1. gene score - size of node
 #       2. loci of gene - color of node
 #       3. weight of edge - darkness of edge
+#   networkx and nxviz are imported only when a graph is made or drawn, so runs without plots
+#   never load them.
 
 
-import networkx as nx
-import matplotlib.pyplot as plt
-import nxviz
-from nxviz import annotate
-from nxviz.plots import despine, aspect_equal
+import rendering
+from lociIndex import asLociIndex
+from compactGraph import CompactGraph
 
 
 # @param nodes: list of nodes in network
-# @param connections: dictionary of nodes and their edges
-# @param lociLists: list of list of genes separated by loci
+# @param connections: dictionary of nodes and their edges or CompactGraph
+# @param lociLists: LociIndex or list of list of genes separated by loci
 # @returns network: dictionary of genes of interest and edges, no edges between genes in same loci
 def makeCrossLociNetwork(nodes, connections, lociLists):
+    lociLists = asLociIndex(lociLists)
+    if isinstance(connections, CompactGraph):
+        network = connections.subnetworkDict(nodes)
+        for n in network:
+            network[n] = {edge: w for edge, w in network[n].items() if not lociLists.sameLocus(n, edge)}
+        return network
+
+    nodeSet = set(nodes)
     network = {}
     for n in nodes:
         network[n] = {}
-        # get loci of gene
-        for l in lociLists:
-            if n in l:
-                loci = l
         # make edges
         # no edges allowed between genes in same loci
         for edge in connections[n]:
-            if edge in nodes:
-                if edge not in loci:
+            if edge in nodeSet:
+                if not lociLists.sameLocus(n, edge):
                     network[n][edge] = connections[n][edge]
     return network
 
 
 # @param network: dictionary of nodes and their edges
-# @param lociLists: list of list of genes separated by loci
+# @param lociLists: LociIndex or list of list of genes separated by loci
 # @param geneVals: genes and their gene scores
 # @returns g: networkx graph object with node, edge, edge weight information
 def makeGraph(network, lociLists, geneVals):
+    import networkx as nx
+    lociLists = asLociIndex(lociLists)
     g = nx.Graph(name='Locus Gene Interactions Graph')
     # add nodes and their edges
     for node in network:
@@ -54,9 +60,9 @@ def makeGraph(network, lociLists, geneVals):
 
     # add loci information for each node
     for n in network:
-        for loci in range(len(lociLists)):
-            if n in lociLists[loci]:
-                g.nodes[n]['class'] = 'Loci ' + str(loci)
+        loci = lociLists.locusOf(n)
+        if loci is not None:
+            g.nodes[n]['class'] = 'Loci ' + str(loci)
     return g
 
 
@@ -70,6 +76,17 @@ def makeGraph(network, lociLists, geneVals):
 # @param topGenes: bool where True gives loci legend
 # @displays: nxviz circos graph
 def visualizeGraph(G, topGenes):
+    rendering.render('Loci_Gene_Network', plotCircos, G, topGenes)
+    return
+
+
+# @param plt: matplotlib.pyplot
+# @param G: graph to display
+# @param topGenes: bool where True gives loci legend
+def plotCircos(plt, G, topGenes):
+    import nxviz
+    from nxviz import annotate
+    from nxviz.plots import despine, aspect_equal
     nxviz.circos(G, group_by='class', node_color_by='class', node_size_by='value', edge_alpha_by='weight')
 
     if topGenes:
@@ -80,20 +97,17 @@ def visualizeGraph(G, topGenes):
     annotate.circos_labels(G)
     aspect_equal()
     despine()
-    plt.show()
-    return
 
 
 # @param geneAvg: dictionary of gene scores
 # @param genes: list of genes of interest
 # @param outFile: file name to write gene information to
-# @param lociLists: list of list of genes separated by loci
+# @param lociLists: LociIndex or list of list of genes separated by loci
 # @outputs: file of gene loci gene Scores
 def outputGeneScores(geneAvg, genes, outFile, lociLists):
+    lociLists = asLociIndex(lociLists)
     with open(outFile, 'w') as f:
         for gene in genes:
-            for loci in range(len(lociLists)):
-                if gene in lociLists[loci]:
-                    break
+            loci = lociLists.locusOf(gene)
             f.write(gene + '\t' + str(loci) + '\t' + str(geneAvg[gene]) +'\n')
     return
@@ -0,0 +1,188 @@
+# Purpose: Null distribution of population edge density from co-functional subnetworks, nodes
+#   replaced by random STRING nodes of similar degree, and the empirical p-value of the
+#   genetic algorithm population against it.
+#   Permutations run in batches across worker processes, each batch with its own random stream
+#   spawned from one seed so results do not depend on the worker count. Sampling stops early
+#   once the p-value is clearly above or below the significance threshold.
+
+import collections, concurrent.futures, os
+import numpy as np
+import networkCreation
+from sharedArrays import shareGraph, attachGraph, releaseShared
+
+NullResult = collections.namedtuple('NullResult', ['pval', 'ciLow', 'ciHigh', 'numPermutations', 'exceedances',
+                                                   'densities'])
+
+# set in each worker by initWorker
+workerModel = None
+workerMemories = None
+
+
+# Co-functional null model of a population of subnetworks
+# @param sampler: networkCreation.DegreeBinSampler over the full STRING network
+# @param nodeBins: numNetworks x numNodes int array, degree bin of each population node
+class NullModel:
+    def __init__(self, sampler, nodeBins):
+        self.sampler = sampler
+        self.graph = sampler.graph
+        self.nodeBins = np.asarray(nodeBins, dtype=np.int64)
+
+    # @param graph: CompactGraph of the full STRING network
+    # @param fullNetworkBins: degreeBins.DegreeBins of graph, or nodes organized into bins by edge density
+    # @param subnetworks: list of subnetwork dictionaries or gene lists, all the same size
+    # @param allowed: optional int array of the graph gene ids the null may sample from
+    # @returns nullModel: NullModel of the subnetworks
+    @classmethod
+    def fromSubnetworks(cls, graph, fullNetworkBins, subnetworks, allowed=None):
+        sampler = networkCreation.DegreeBinSampler.fromBins(graph, fullNetworkBins, allowed)
+        nodeBins = [sampler.binsOfGenes(list(subNetwork)) for subNetwork in subnetworks]
+        return cls(sampler, nodeBins)
+
+    # @param rng: numpy Generator
+    # @returns nodes: numNetworks x numNodes int array of sampled graph gene ids
+    def sampleNodes(self, rng):
+        return self.sampler.sample(self.nodeBins, rng)
+
+    # @param rng: numpy Generator
+    # @param numPermutations: number of null populations to sample
+    # @returns densities: average edge density of each null population
+    def sampleDensities(self, rng, numPermutations):
+        densities = np.empty(numPermutations, dtype=np.float64)
+        for p in range(numPermutations):
+            nodes = self.sampleNodes(rng)
+            densities[p] = self.graph.inducedWeights(nodes).sum()/len(nodes)
+        return densities
+
+
+# Worker process initializer
+# @param graphSpec: shared memory spec of the STRING graph from sharedArrays.shareGraph
+# @param binArrays: (members, binOffsets, binMax) arrays of the DegreeBinSampler
+# @param nodeBins: degree bin of each population node
+def initWorker(graphSpec, binArrays, nodeBins):
+    global workerModel, workerMemories
+    workerMemories, graph = attachGraph(graphSpec)
+    workerModel = NullModel(networkCreation.DegreeBinSampler(graph, *binArrays), nodeBins)
+
+
+# @param seedSequence: numpy SeedSequence of the batch
+# @param numPermutations: number of null populations in the batch
+# @returns densities: average edge density of each null population
+def runBatch(seedSequence, numPermutations):
+    return workerModel.sampleDensities(np.random.default_rng(seedSequence), numPermutations)
+
+
+# Clopper-Pearson interval of a binomial proportion
+# @param exceedances: number of null densities at or above the observed density
+# @param numPermutations: number of null densities
+# @param confidence: interval coverage
+# @returns low, high: interval bounds
+def pValInterval(exceedances, numPermutations, confidence=0.95):
+    # imported here so runs without a p-value do not pay for loading scipy
+    from scipy.special import betaincinv
+    tail = (1 - confidence)/2
+    low = betaincinv(exceedances, numPermutations - exceedances + 1, tail) if exceedances > 0 else 0.0
+    high = betaincinv(exceedances + 1, numPermutations - exceedances, 1 - tail) \
+        if exceedances < numPermutations else 1.0
+    return float(low), float(high)
+
+
+# Empirical p-value of the observed population density against the co-functional null.
+# Batches are checked in order and sampling stops at the first batch after which either
+#   Besag-Clifford: minExceedances null densities were at or above the observed one, p = h/n
+#   the confidence interval of p lies entirely above or below alpha
+# otherwise it stops at maxPermutations with p = (h + 1)/(n + 1).
+# @param nullModel: NullModel of the population
+# @param observedDensity: average edge density of the population
+# @param seed: base seed, every batch gets a stream spawned from it
+# @param numWorkers: worker processes, 0 or 1 to sample in this process
+# @param batchSize: null populations per batch
+# @param maxPermutations: most null populations to sample
+# @param alpha: significance threshold
+# @param minExceedances: Besag-Clifford stopping count
+# @param confidence: coverage of the reported interval and of the alpha stopping rule
+# @param recorder: optional instrumentation.Recorder that gets a nullBatch event after each batch
+# @param checkpoint: optional checkpoint.Checkpoint, the 'null' section is resumed from and saved to it.
+#   Every batch has its own seed, so a resumed run samples the same null populations.
+# @returns result: NullResult with the p-value, its interval, permutations used, exceedances and densities
+def empiricalNullPVal(nullModel, observedDensity, seed, numWorkers=None, batchSize=20, maxPermutations=1000,
+                      alpha=0.05, minExceedances=10, confidence=0.95, recorder=None, checkpoint=None):
+    global workerModel
+    numBatches = -(-maxPermutations//batchSize)
+    seeds = np.random.SeedSequence(seed).spawn(numBatches)
+    sizes = [min(batchSize, maxPermutations - b*batchSize) for b in range(numBatches)]
+
+    memories = []
+    executor = None
+    densities = []
+    exceedances = 0
+    stoppedEarly = False
+    saved = checkpoint.get('null') if checkpoint is not None else None
+    if saved is not None:
+        state, arrays = saved
+        ends = np.cumsum(arrays['batchLengths'])
+        densities = [arrays['densities'][end - length:end] for end, length in zip(ends, arrays['batchLengths'])]
+        exceedances, stoppedEarly = state['exceedances'], state['stoppedEarly']
+    # a resumed run that had already stopped has nothing left to sample
+    firstBatch = numBatches if stoppedEarly else len(densities)
+    try:
+        if firstBatch < numBatches and (numWorkers is None or numWorkers > 1):
+            memories, graphSpec = shareGraph(nullModel.graph)
+            sampler = nullModel.sampler
+            binArrays = (sampler.members, sampler.binOffsets, sampler.binMax)
+            wave = numWorkers or os.cpu_count() or 1
+            executor = concurrent.futures.ProcessPoolExecutor(wave, initializer=initWorker,
+                                                              initargs=(graphSpec, binArrays, nullModel.nodeBins))
+        else:
+            workerModel = nullModel
+            wave = 1
+
+        for start in range(firstBatch, numBatches, wave):
+            batches = range(start, min(start + wave, numBatches))
+            if executor is not None:
+                results = executor.map(runBatch, [seeds[b] for b in batches], [sizes[b] for b in batches])
+            else:
+                results = [runBatch(seeds[b], sizes[b]) for b in batches]
+
+            # decide batch by batch so extra batches of a wave never change the result
+            for batchDensities in results:
+                densities.append(batchDensities)
+                exceedances += int((batchDensities >= observedDensity).sum())
+                n = sum(len(d) for d in densities)
+                low, high = pValInterval(exceedances, n, confidence)
+                if recorder is not None:
+                    recorder.count('nullPermutations', len(batchDensities))
+                    recorder.emit('nullBatch', permutations=n, exceedances=exceedances, ciLow=low, ciHigh=high)
+                if exceedances >= minExceedances or high < alpha or low > alpha:
+                    stoppedEarly = True
+                    break
+            if stoppedEarly:
+                break
+            if checkpoint is not None and checkpoint.due():
+                saveNullCheckpoint(checkpoint, densities, exceedances, stoppedEarly)
+        if checkpoint is not None:
+            saveNullCheckpoint(checkpoint, densities, exceedances, stoppedEarly)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        else:
+            workerModel = None
+        releaseShared(memories)
+
+    densities = np.concatenate(densities)
+    n = len(densities)
+    if exceedances >= minExceedances:
+        pval = exceedances/n
+    else:
+        pval = (exceedances + 1)/(n + 1)
+    low, high = pValInterval(exceedances, n, confidence)
+    return NullResult(pval, low, high, n, exceedances, densities)
+
+
+# @param checkpoint: checkpoint.Checkpoint to save the 'null' section to
+# @param densities: list of the null densities of each batch checked
+# @param exceedances: null densities at or above the observed one
+# @param stoppedEarly: bool of whether sampling has stopped
+def saveNullCheckpoint(checkpoint, densities, exceedances, stoppedEarly):
+    arrays = {'densities': np.concatenate(densities) if densities else np.zeros(0),
+              'batchLengths': np.array([len(d) for d in densities], dtype=np.int64)}
+    checkpoint.save('null', {'exceedances': exceedances, 'stoppedEarly': stoppedEarly}, arrays)
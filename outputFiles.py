@@ -4,6 +4,7 @@
 #   about the genetic algorithm generations
 
 
+import os
 import geneticAlgorithm
 
 
@@ -11,8 +12,9 @@ import geneticAlgorithm
 # @param pval: pval for genetic algorithm output
 # @param networks:
 # @param topNets:
+# @param outDir: directory the files are written to
 # @outputs: file with
-def outputNetworks(pval, networks, topNets):
+def outputNetworks(pval, networks, topNets, outDir='.'):
     networkScores = geneticAlgorithm.calculateSelectionScores(networks)
     scoredNetworks = dict(zip(networkScores, networks))
     sortedScores = sorted(networkScores, reverse=True)
@@ -21,7 +23,7 @@ def outputNetworks(pval, networks, topNets):
 
     for i in range(topNets):
         network = scoredNetworks[sortedScores[i]]
-        fName = fileN + str(i) + '_pval'+ str(pval) + '.txt'
+        fName = os.path.join(outDir, fileN + str(i) + '_pval'+ str(pval) + '.txt')
         with open(fName, 'w') as f:
             for gene1 in network:
                 for gene2 in network:
@@ -37,8 +39,9 @@ def outputNetworks(pval, networks, topNets):
 
 # @param lociLists:
 # @param geneScores:
-def outputGeneScoresinLoci(geneScores, lociLists):
-    fileN = 'Day3_Output.gmt'
+# @param outDir: directory the file is written to
+def outputGeneScoresinLoci(geneScores, lociLists, outDir='.'):
+    fileN = os.path.join(outDir, 'Day3_Output.gmt')
     with open(fileN, 'w') as f:
         for loci in lociLists:
             for gene in loci:
@@ -0,0 +1,138 @@
+# Purpose: Draw the pipeline's figures without importing plotting libraries until a figure is
+#   actually drawn. Modules describe a figure as a draw function and its data, and the renderer
+#   decides what happens to it.
+#   modes
+#       show    draw with pyplot and show the figure, blocks until it is closed (the original behaviour)
+#       files   draw with the Agg backend and save the figure to outDir, in a background thread or
+#               process so the pipeline keeps running while figures are written
+#       none    draw nothing, matplotlib, networkx and nxviz are never imported
+#   A draw function takes pyplot and the figure's data, and is module level so it can be sent to
+#   a process.
+
+import concurrent.futures, os, sys
+
+MODES = ('show', 'files', 'none')
+
+# renderer used by render, show mode until configure is called
+renderer = None
+
+
+# @param backend: optional matplotlib backend to switch to first
+# @returns plt: matplotlib.pyplot
+def usePyplot(backend=None):
+    import matplotlib
+    if backend is not None:
+        matplotlib.use(backend)
+    import matplotlib.pyplot as plt
+    return plt
+
+
+# Background worker initializer, imports pyplot on the Agg backend
+def initWorker():
+    usePyplot('Agg')
+
+
+# Draw a figure and save it
+# @param fileName: image file to write
+# @param draw: draw function
+# @param args: data of the figure
+# @returns fileName: the file written
+def drawToFile(fileName, draw, *args):
+    plt = usePyplot('Agg')
+    try:
+        draw(plt, *args)
+        plt.savefig(fileName)
+    finally:
+        plt.close('all')
+    return fileName
+
+
+# @param mode: one of MODES
+# @param outDir: directory figures are saved in, for files mode
+# @param background: 'thread', 'process' or None to draw in the calling thread, for files mode
+# @param imageFormat: file extension of saved figures
+class Renderer:
+    def __init__(self, mode='show', outDir='.', background='thread', imageFormat='png'):
+        if mode not in MODES:
+            raise ValueError('unknown plot mode: ' + str(mode))
+        self.mode = mode
+        self.outDir = outDir
+        self.imageFormat = imageFormat
+        self.executor = None
+        self.pending = []
+        if mode == 'files':
+            os.makedirs(outDir, exist_ok=True)
+            # one worker so figures never draw on pyplot at the same time
+            if background == 'thread':
+                self.executor = concurrent.futures.ThreadPoolExecutor(1, initializer=initWorker)
+            elif background == 'process':
+                self.executor = concurrent.futures.ProcessPoolExecutor(1, initializer=initWorker)
+            elif background is not None:
+                raise ValueError('unknown background: ' + str(background))
+
+    # @param name: figure name, the file name in files mode
+    # @param draw: draw function
+    # @param args: data of the figure
+    def render(self, name, draw, *args):
+        if self.mode == 'none':
+            return
+        if self.mode == 'show':
+            plt = usePyplot()
+            draw(plt, *args)
+            plt.show()
+            return
+        fileName = os.path.join(self.outDir, name + '.' + self.imageFormat)
+        if self.executor is None:
+            try:
+                drawToFile(fileName, draw, *args)
+            except Exception as e:
+                print('could not draw ' + name + ': ' + repr(e), file=sys.stderr)
+        else:
+            self.pending.append((name, self.executor.submit(drawToFile, fileName, draw, *args)))
+
+    # Wait for figures still being drawn. Figures are extra output, so one that fails is
+    # reported without stopping the run.
+    # @returns fileNames: files written since the last close
+    def close(self):
+        fileNames = []
+        for name, future in self.pending:
+            try:
+                fileNames.append(future.result())
+            except Exception as e:
+                print('could not draw ' + name + ': ' + repr(e), file=sys.stderr)
+        self.pending = []
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        return fileNames
+
+
+# Replace the renderer used by render, waiting for the previous one's figures
+# @param mode: one of MODES
+# @param outDir: directory figures are saved in, for files mode
+# @param background: 'thread', 'process' or None, for files mode
+# @returns renderer: the new Renderer
+def configure(mode='files', outDir='.', background='thread'):
+    global renderer
+    if renderer is not None:
+        renderer.close()
+    renderer = Renderer(mode, outDir, background)
+    return renderer
+
+
+# Draw a figure with the configured renderer
+# @param name: figure name
+# @param draw: draw function
+# @param args: data of the figure
+def render(name, draw, *args):
+    global renderer
+    if renderer is None:
+        renderer = Renderer()
+    renderer.render(name, draw, *args)
+
+
+# @returns fileNames: figure files written, after waiting for the ones still being drawn
+def finish():
+    if renderer is None:
+        return []
+    return renderer.close()
@@ -0,0 +1,70 @@
+# Purpose: Share numpy arrays and CompactGraphs with worker processes through shared memory
+#   instead of pickling a copy to every worker. Graphs loaded from a networkCache directory are
+#   shared by the directory, workers memory-map the same files so nothing is copied at all.
+
+from multiprocessing import shared_memory
+import numpy as np
+from compactGraph import SymmetricGraph
+import networkCache
+
+
+# Copy an array into a new shared memory block
+# @param array: numpy array to share
+# @returns memory, spec: SharedMemory block (kept open by the owner) and (name, shape, dtype) to attach with
+def shareArray(array):
+    array = np.ascontiguousarray(array)
+    memory = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=memory.buf)[...] = array
+    return memory, (memory.name, array.shape, array.dtype.str)
+
+
+# @param spec: (name, shape, dtype) from shareArray
+# @returns memory, array: attached SharedMemory block and the array view of it
+def attachArray(spec):
+    name, shape, dtype = spec
+    memory = shared_memory.SharedMemory(name=name)
+    return memory, np.ndarray(shape, dtype=np.dtype(dtype), buffer=memory.buf)
+
+
+# @param graph: CompactGraph or subclass to share
+# @returns memories, spec: shared memory blocks (kept open by the owner) and the spec to attach with
+def shareGraph(graph):
+    if graph.cacheDir is not None:
+        return [], (type(graph), graph.cacheDir, None)
+    memories = []
+    specs = []
+    for array in (graph.offsets, graph.neighbors, graph.weights):
+        memory, spec = shareArray(array)
+        memories.append(memory)
+        specs.append(spec)
+    return memories, (type(graph), graph.genes, specs)
+
+
+# @param spec: spec from shareGraph
+# @returns memories, graph: attached shared memory blocks and a graph of the shared graph's class over them
+def attachGraph(spec):
+    # source is the gene list, or the cache directory of a graph shared by its cache
+    graphClass, source, specs = spec
+    if specs is None:
+        graph = networkCache.loadCompiledNetwork(source, issubclass(graphClass, SymmetricGraph))
+        if type(graph) is not graphClass:
+            graph = graphClass(graph.genes, graph.offsets, graph.neighbors, graph.weights, graph.geneIndex)
+            graph.cacheDir = source
+        return [], graph
+    memories = []
+    arrays = []
+    for arraySpec in specs:
+        memory, array = attachArray(arraySpec)
+        memories.append(memory)
+        arrays.append(array)
+    return memories, graphClass(source, *arrays)
+
+
+# Close and remove shared memory blocks made by shareArray or shareGraph
+# @param memories: SharedMemory block or list of blocks
+def releaseShared(memories):
+    if not isinstance(memories, list):
+        memories = [memories]
+    for memory in memories:
+        memory.close()
+        memory.unlink()
@@ -0,0 +1,84 @@
+# Purpose: Optional scipy.sparse backend for the full STRING network. The CSR arrays of the
+#   compiled network are wrapped in a scipy.sparse.csr_matrix with the gene name index of
+#   CompactGraph, so degrees, induced subgraph densities and neighborhoods are sparse matrix
+#   operations. It is still a CompactGraph, so the dict of dicts view works for small inputs
+#   and visualization.
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from compactGraph import CompactGraph, uniqueRows
+import networkCache
+
+
+# STRING network as a sparse matrix, rows and columns are gene ids
+# @param genes: list of gene names, index is the gene id
+# @param offsets: CSR row offsets of length len(genes) + 1
+# @param neighbors: neighbor ids, sorted within each row
+# @param weights: edge weights aligned with neighbors
+# @param geneIndex: optional dict of gene name: id, built from genes if not given
+class SparseNetwork(CompactGraph):
+    def __init__(self, genes, offsets, neighbors, weights, geneIndex=None):
+        super().__init__(genes, offsets, neighbors, weights, geneIndex)
+        # shares the neighbor and weight arrays, only the row offsets may be converted
+        self.matrix = csr_matrix((weights, neighbors, offsets), shape=(len(genes), len(genes)))
+        self.degrees = self.matrix.getnnz(axis=1)
+
+    # @param graph: CompactGraph
+    # @returns network: SparseNetwork over the same arrays
+    @classmethod
+    def fromCompactGraph(cls, graph):
+        network = cls(graph.genes, graph.offsets, graph.neighbors, graph.weights, graph.geneIndex)
+        network.cacheDir = graph.cacheDir
+        return network
+
+    # @param idSets: numSets x setSize int array of gene ids from uniqueRows, -1 for padding
+    # @returns selected: numSets x numGenes sparse matrix with a 1 at each gene of each set
+    def indicator(self, idSets):
+        sets, cols = np.nonzero(idSets >= 0)
+        return csr_matrix((np.ones(len(sets), dtype=np.float32), (sets, idSets[sets, cols])),
+                          shape=(len(idSets), len(self.genes)))
+
+    # Same as CompactGraph.inducedWeights, totals are found as the row sums of (S A) * S
+    # where S marks the genes of each set
+    def inducedWeights(self, idSets, withEdges=False, denseLimit=1024, chunkEntries=1 << 22):
+        if withEdges:
+            return super().inducedWeights(idSets, withEdges, denseLimit, chunkEntries)
+        idSets = uniqueRows(np.atleast_2d(np.asarray(idSets, dtype=np.int64)))
+        totals = np.zeros(len(idSets), dtype=np.float64)
+        for start, end in self.degreeChunks(idSets, chunkEntries):
+            selected = self.indicator(idSets[start:end])
+            inside = (selected @ self.matrix).multiply(selected)
+            totals[start:end] = np.asarray(inside.sum(axis=1, dtype=np.float64)).ravel()/2
+        return totals
+
+    # Same as CompactGraph.neighborhood. Edges out of the frontier are a CSR row slice, edges
+    # into it are found from the rows whose stored columns hit the frontier, since STRING pairs
+    # may be listed one way.
+    def neighborhood(self, ids, hops=1):
+        ids = np.asarray(ids, dtype=np.int64)
+        indptr, indices = self.matrix.indptr, self.matrix.indices
+        reached = np.zeros(len(self.genes), dtype=bool)
+        reached[ids[ids >= 0]] = True
+        frontier = reached.copy()
+        for hop in range(hops):
+            if not frontier.any():
+                break
+            found = np.zeros(len(self.genes), dtype=bool)
+            found[self.matrix[np.flatnonzero(frontier)].indices] = True
+            hits = np.concatenate(([0], np.cumsum(frontier[indices])))
+            found |= hits[indptr[1:]] > hits[indptr[:-1]]
+            frontier = found & ~reached
+            reached |= frontier
+        return np.flatnonzero(reached)
+
+
+# Load the STRING network from its binary cache as a SparseNetwork
+# @param stringFile: STRING file of protein-protein interactions
+# @param cacheDir: cache directory, defaults to networkCache.defaultCacheDir
+# @param rebuild: bool to force recompiling the cache
+# @param minScore: optional lowest score to keep, in the file's units
+# @param genes: optional gene whitelist, only edges between two of them are kept
+# @returns network: SparseNetwork of the STRING network
+def loadSparseNetwork(stringFile, cacheDir=None, rebuild=False, minScore=None, genes=None):
+    graph = networkCache.loadInteractionNetwork(stringFile, cacheDir, rebuild, minScore, genes)
+    return SparseNetwork.fromCompactGraph(graph)
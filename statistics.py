@@ -2,7 +2,9 @@
 # Date: September 29, 2021
 # Purpose: Different possible statistical tests for networks and subnetworks
 
-import matplotlib.pyplot as plt
+import numpy as np
+import rendering
+from compactGraph import CompactGraph
 
 
 # edge density defined in the paper as edge count
@@ -12,6 +14,8 @@ import matplotlib.pyplot as plt
 # @returns density: number of edges in network
 def calcEdgeDensity(network):
     density = 0
+    if isinstance(network, CompactGraph):
+        return network.numEdges()
 
     # each edge is represented twice so
     for node in network:
@@ -28,40 +32,141 @@ def calcEdgeDensity(network):
 # @returns density: total edge density in network
 def calcEdgeDensityW(network):
     density =0
+    if isinstance(network, CompactGraph):
+        return network.totalWeight()
 
     for node in network:
-        for edge in network[node]:
-            density += float(network[node][edge])
+        for weight in network[node].values():
+            density += float(weight)
     density = density/2
     return density
 
 
+# edge density using edge weights for a batch of genomes, the same value as calcEdgeDensityW
+# on each subnetwork. Rows are processed in chunks to bound the numNetworks x numLoci x numLoci gather
+# @param genomes: numNetworks x numLoci int matrix of LociIndex gene ids
+# @param lociWeights: numGenes x numGenes matrix of edge weights between loci genes
+# @param chunkSize: number of genomes gathered at once
+# @returns densities: float array of total edge weight of each genome
+def calcGenomeEdgeDensityW(genomes, lociWeights, chunkSize=8192):
+    genomes = np.asarray(genomes)
+    densities = np.empty(len(genomes), dtype=np.float64)
+    for start in range(0, len(genomes), chunkSize):
+        chunk = genomes[start:start + chunkSize]
+        pairWeights = lociWeights[chunk[:, :, None], chunk[:, None, :]]
+        densities[start:start + chunkSize] = pairWeights.sum(axis=(1, 2), dtype=np.float64)/2
+    return densities
+
+
+# Streaming mean and variance of many values at once (one per gene) using Welford's algorithm,
+# merging a batch at a time with the parallel form of the update. Memory is O(size) plus an
+# optional reservoir sample of reservoirSize values per entry for quantiles.
+# @param size: number of values tracked, e.g. number of genes
+# @param reservoirSize: number of samples kept per value for quantiles, 0 for none
+# @param rng: numpy Generator or seed for the reservoir sampling
+class RunningStats:
+    def __init__(self, size, reservoirSize=0, rng=None):
+        self.count = 0
+        self.mean = np.zeros(size, dtype=np.float64)
+        self.m2 = np.zeros(size, dtype=np.float64)
+        self.reservoirSize = reservoirSize
+        self.reservoir = np.zeros((size, reservoirSize), dtype=np.float64)
+        self.rng = np.random.default_rng(rng)
+
+    # @param values: size x n array, n new observations of every value
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if values.ndim == 1:
+            values = values[:, None]
+        n = values.shape[1]
+        if n == 0:
+            return
+
+        batchMean = values.mean(axis=1)
+        batchM2 = ((values - batchMean[:, None])**2).sum(axis=1)
+        total = self.count + n
+        delta = batchMean - self.mean
+        self.mean += delta*n/total
+        self.m2 += batchM2 + delta**2*self.count*n/total
+
+        if self.reservoirSize:
+            self.updateReservoir(values)
+        self.count = total
+
+    # Algorithm R, the same slots are replaced for every value so one draw serves all of them
+    # @param values: size x n array of new observations
+    def updateReservoir(self, values):
+        seen = self.count + np.arange(values.shape[1])
+        fill = seen < self.reservoirSize
+        self.reservoir[:, seen[fill]] = values[:, fill]
+        slots = self.rng.integers(0, seen[~fill] + 1) if (~fill).any() else np.zeros(0, dtype=np.int64)
+        for col, slot in zip(np.flatnonzero(~fill), slots):
+            if slot < self.reservoirSize:
+                self.reservoir[:, slot] = values[:, col]
+
+    # @returns variance: sample variance of each value
+    def variance(self):
+        if self.count < 2:
+            return np.zeros_like(self.mean)
+        return self.m2/(self.count - 1)
+
+    def std(self):
+        return np.sqrt(self.variance())
+
+    # @param z: z score of the interval, 1.96 for 95%
+    # @returns halfWidth: half width of the normal confidence interval of each mean
+    def confidenceHalfWidth(self, z=1.96):
+        if self.count < 2:
+            return np.full_like(self.mean, np.inf)
+        return z*self.std()/np.sqrt(self.count)
+
+    # @param q: quantile or array of quantiles in [0, 1]
+    # @returns quantiles: quantiles of each value estimated from the reservoir
+    def quantile(self, q):
+        if not self.reservoirSize:
+            raise ValueError('quantiles need a reservoir, set reservoirSize')
+        kept = min(self.count, self.reservoirSize)
+        return np.quantile(self.reservoir[:, :kept], q, axis=1)
+
+
 # @param: densities
 # @displays: histogram of densities
 def histogram(densities):
+    rendering.render('Density_Histogram', plotHistogram, densities)
+    return
+
+
+# @param plt: matplotlib.pyplot
+# @param densities: list of densities
+def plotHistogram(plt, densities):
     # Plot Histogram on x
     plt.hist(densities)
     plt.gca().set(title='Density Distribution Histogram', ylabel='Density');
-    plt.show()
-    return
 
 
 # @param dens1: list of density distribution
 # @param dens2: list of different density distribution
 # @displays: histogram of the two densities
 def overlappingHistogram(dens1, dens2):
+    rendering.render('Edge_Density_Histogram', plotOverlappingHistogram, dens1, dens2)
+
+
+# @param plt: matplotlib.pyplot
+# @param dens1: list of density distribution
+# @param dens2: list of different density distribution
+def plotOverlappingHistogram(plt, dens1, dens2):
 
     # Plot Histogram on x
     plt.hist([dens1, dens2])
     plt.gca().set(title='Edge Density Histogram', ylabel='Number of Nodes');
     plt.legend(loc='upper right')
-    plt.show()
 
 
 # @param lociSubN: list of loci subnetworks dictionaries
 # @param coFSubN: list of cofunctional subnetworks dictionaries
+# @param recorder: optional instrumentation.Recorder that gets the loci density and p-value as an event
 # @returns pval: int pval for loci subnetworks with cofunctional subnetworks as null hypothesis
-def empiricalPVal(lociSubN, coFPopDensities):
+def empiricalPVal(lociSubN, coFPopDensities, recorder=None):
     # use avg density of final population in random trial
     # P value representing fraction of random trials producing final pop of subnetworks
     # with higher avg density than the avg density seen with true loci inputs
@@ -74,8 +179,6 @@ def empiricalPVal(lociSubN, coFPopDensities):
         lociDensity += tempLD
     lociDensity = lociDensity/len(lociSubN)
 
-    print(lociDensity)
-
     # calculate p-val by using cof (null analysis) density distribution
     # and avg loci density
     coFDensities = sorted(coFPopDensities)
@@ -89,7 +192,31 @@ def empiricalPVal(lociSubN, coFPopDensities):
         pos +=1
 
     pval = (len(coFDensities) - p)/len(coFDensities)
+    if recorder is not None:
+        recorder.emit('empiricalPVal', lociDensity=lociDensity, pval=pval)
+
+    rendering.render('Empirical_PVal', plotEmpiricalPVal, coFDensities, densPos, lociDensity, pval)
+    return pval
+
 
+# Plot the null distribution against the population density with a p-value that is already
+# known, such as the one from nullDistribution.empiricalNullPVal, without scoring subnetworks again
+# @param coFPopDensities: null population densities
+# @param lociDensity: average density of the loci population
+# @param pval: p-value to label the plot with
+def nullPValHistogram(coFPopDensities, lociDensity, pval):
+    coFDensities = sorted(coFPopDensities)
+    below = [c for c in coFDensities if c <= lociDensity]
+    densPos = below[-1] if below else 0
+    rendering.render('Empirical_PVal', plotEmpiricalPVal, coFDensities, densPos, lociDensity, pval)
+
+
+# @param plt: matplotlib.pyplot
+# @param coFDensities: sorted null population densities
+# @param densPos: largest null density at or below the loci density
+# @param lociDensity: average loci subnetwork density
+# @param pval: p-value to label the plot with
+def plotEmpiricalPVal(plt, coFDensities, densPos, lociDensity, pval):
     # plot a histogram of cof density distribution and avd loci density
     # put pval next to avg loci dashed line
     plt.hist(coFDensities)
@@ -97,5 +224,3 @@ def empiricalPVal(lociSubN, coFPopDensities):
     plt.title('Empirical P-Value')
     min_ylim, max_ylim = plt.ylim()
     plt.text(lociDensity, max_ylim*0.9, 'Pval = '+ str(pval))
-    plt.show()
-    return pval
@@ -0,0 +1,276 @@
+# Purpose: Fast STRING file reader. The file is read in large byte chunks, optionally through
+#   gzip or zstd, and each chunk is parsed with numpy column operations on worker threads.
+#   Lines below a minimum score or with a gene outside a whitelist are dropped inside the chunk
+#   parser, so only the kept genes ever become Python strings.
+#   Accepted input
+#       - an optional header line, e.g. 'protein1 protein2 combined_score'
+#       - tab or space delimited columns, gene names first and second, score in scoreColumn
+#       - 0-1 decimal scores, or STRING's 0-1000 integer scores which are scaled to 0-1
+
+import concurrent.futures, gzip, os, time
+import numpy as np
+
+CHUNK_SIZE = 1 << 22
+
+
+# @param stringFile: STRING file, '.gz' and '.zst' files are decompressed while reading
+# @returns f: binary file object
+def openStringFile(stringFile):
+    if stringFile.endswith('.gz'):
+        return gzip.open(stringFile, 'rb')
+    if stringFile.endswith('.zst'):
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError('reading .zst STRING files needs the zstandard package')
+        return zstandard.ZstdDecompressor().stream_reader(open(stringFile, 'rb'), closefd=True)
+    return open(stringFile, 'rb')
+
+
+# @param f: binary file object
+# @param chunkSize: bytes per chunk
+# @returns chunks: generator of byte chunks that each end at a line break
+def readChunks(f, chunkSize=CHUNK_SIZE):
+    rest = b''
+    while True:
+        block = f.read(chunkSize)
+        if not block:
+            break
+        block = rest + block
+        end = block.rfind(b'\n') + 1
+        if end == 0:
+            rest = block
+            continue
+        rest = block[end:]
+        yield block[:end]
+    if rest.strip():
+        yield rest
+
+
+# Number of columns of the file, whether its first line is a header and whether its scores are
+# STRING's 0-1000 integers. The scale is decided from the file's first lines, not from the edges
+# left after filtering: a score column of integers is per mille, any decimal score means 0-1.
+# @param chunk: first chunk of the file
+# @param scoreColumn: column of the score
+# @param sampleLines: most lines checked for decimal scores
+# @returns numColumns, hasHeader, perMille
+def detectLayout(chunk, scoreColumn, sampleLines=1000):
+    lines = [line.split() for line in chunk.split(b'\n', sampleLines)[:sampleLines] if line.strip()]
+    if not lines:
+        return 3, False, False
+    first = lines[0]
+    try:
+        float(first[scoreColumn])
+    except (ValueError, IndexError):
+        if len(lines) < 2:
+            return len(first), True, False
+        lines = lines[1:]
+        return len(lines[0]), True, all(line[scoreColumn].isdigit() for line in lines)
+    return len(first), False, all(line[scoreColumn].isdigit() for line in lines)
+
+
+# Token positions of a chunk of lines, found on the raw bytes
+# @param chunk: bytes of whole lines
+# @param numColumns: number of columns on each line
+# @returns buf, starts, lengths: uint8 array of the chunk and numLines x numColumns arrays of the
+#   start and length of each token
+def tokenize(chunk, numColumns):
+    buf = np.frombuffer(chunk, dtype=np.uint8)
+    newline = buf == 10
+    inToken = ~(newline | (buf == 9) | (buf == 32) | (buf == 13))
+    change = np.diff(inToken.astype(np.int8), prepend=np.int8(0), append=np.int8(0))
+    starts = np.flatnonzero(change == 1)
+    lengths = np.flatnonzero(change == -1) - starts
+
+    # every non-empty line must have numColumns tokens
+    lineOf = np.searchsorted(np.flatnonzero(newline), starts)
+    perLine = np.bincount(lineOf)
+    if (perLine[perLine > 0] != numColumns).any():
+        raise ValueError('STRING lines must all have ' + str(numColumns) + ' columns')
+    return buf, starts.reshape(-1, numColumns), lengths.reshape(-1, numColumns)
+
+
+# @param buf: uint8 array of the chunk
+# @param starts: int array of token starts
+# @param lengths: int array of token lengths
+# @param width: bytes per row, at least the longest token
+# @returns fields: len(starts) x width uint8 matrix of the tokens, zero padded
+def fieldBytes(buf, starts, lengths, width):
+    padded = np.concatenate((buf, np.zeros(width, dtype=np.uint8)))
+    fields = np.lib.stride_tricks.sliding_window_view(padded, width)[starts]
+    fields *= np.arange(width) < lengths[:, None]
+    return fields
+
+
+# Parse plain decimal scores such as 0.255 or 700 with integer arithmetic, so each value is
+# the same correctly rounded float as float(text). Anything else goes through numpy's parser.
+# @param buf: uint8 array of the chunk
+# @param starts: int array of score token starts
+# @param lengths: int array of score token lengths
+# @returns scores: float array
+def parseScores(buf, starts, lengths):
+    if len(starts) == 0:
+        return np.zeros(0, dtype=np.float64)
+    width = int(lengths.max())
+    fields = fieldBytes(buf, starts, lengths, width)
+    digit = (fields >= 48) & (fields <= 57)
+    dot = fields == 46
+    if width > 18 or not (digit | dot | (fields == 0)).all() or (dot.sum(axis=1) > 1).any():
+        return fields.view('S' + str(width)).ravel().astype(np.float64)
+
+    # digits at or right of each position give its power of ten in the mantissa
+    digitsRight = np.cumsum(digit[:, ::-1], axis=1)[:, ::-1]
+    powers = 10**np.arange(19, dtype=np.int64)
+    values = (fields.astype(np.int64) - 48)*powers[np.maximum(digitsRight - 1, 0)]
+    mantissa = np.where(digit, values, 0).sum(axis=1)
+    fractionDigits = np.where(dot, digitsRight, 0).sum(axis=1)
+    return mantissa/10.0**fractionDigits
+
+
+# Group equal tokens without making Python objects: tokens are hashed as 8 byte words and the
+# groups are checked word by word, falling back to an exact sort if two names share a hash.
+# @param buf: uint8 array of the chunk
+# @param starts: int array of token starts
+# @param lengths: int array of token lengths
+# @returns first, inverse: index of the first token of each group in order of appearance, and
+#   the group of each token
+def groupTokens(buf, starts, lengths):
+    width = -(-int(lengths.max())//8)*8
+    words = fieldBytes(buf, starts, lengths, width).view(np.uint64)
+    keys = np.random.default_rng(0).integers(1, 1 << 62, words.shape[1], dtype=np.uint64)*2 + 1
+    hashes = (words*keys).sum(axis=1, dtype=np.uint64)
+
+    unique, first, inverse = np.unique(hashes, return_index=True, return_inverse=True)
+    if not (words[first][inverse] == words).all():
+        unique, first, inverse = np.unique(words.view('V' + str(width)).ravel(), return_index=True,
+                                           return_inverse=True)
+    # renumber groups in order of first appearance
+    order = np.argsort(first, kind='stable')
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    return first[order], rank[inverse.ravel()]
+
+
+# Parse one chunk of lines into gene names, edges and scores
+# @param chunk: bytes of whole lines
+# @param numColumns: number of columns on each line
+# @param scoreColumn: column of the score
+# @param minScore: lines with a lower score are dropped, in the file's units
+# @param whitelist: set of allowed gene names as bytes, or None for all genes
+# @returns names, pairs, scores, numLines: gene names kept in the chunk as bytes in order of
+#   appearance, numKept x 2 indexes into names, kept scores and lines read
+def parseChunk(chunk, numColumns, scoreColumn, minScore, whitelist):
+    buf, starts, lengths = tokenize(chunk, numColumns)
+    numLines = len(starts)
+    scores = parseScores(buf, starts[:, scoreColumn], lengths[:, scoreColumn])
+    if minScore is not None:
+        keep = scores >= minScore
+        starts, lengths, scores = starts[keep], lengths[keep], scores[keep]
+    if len(starts) == 0:
+        return [], np.zeros((0, 2), dtype=np.int64), scores, numLines
+
+    # gene columns in file order, line by line
+    nameStarts = starts[:, :2].ravel()
+    nameLengths = lengths[:, :2].ravel()
+    first, inverse = groupTokens(buf, nameStarts, nameLengths)
+    names = [chunk[s:s + l] for s, l in zip(nameStarts[first].tolist(), nameLengths[first].tolist())]
+    pairs = inverse.reshape(-1, 2)
+
+    if whitelist is not None:
+        allowed = np.array([name in whitelist for name in names], dtype=bool)
+        keep = allowed[pairs[:, 0]] & allowed[pairs[:, 1]]
+        pairs, scores = pairs[keep], scores[keep]
+        # drop names only seen on removed lines, keeping order of appearance
+        used = np.zeros(len(names), dtype=bool)
+        used[pairs.ravel()] = True
+        newIndex = np.cumsum(used) - 1
+        names = [name for name, u in zip(names, used.tolist()) if u]
+        pairs = newIndex[pairs]
+    return names, pairs, scores, numLines
+
+
+# Read a STRING file into interned gene names and edge arrays. Gene ids are given in order of
+# first appearance, the same as reading the file line by line.
+# @param stringFile: STRING file of protein-protein interactions
+# @param minScore: optional lowest score to keep, in the file's units (e.g. 700 or 0.7)
+# @param genes: optional iterable of gene names, only edges between two of them are kept
+# @param scoreColumn: column of the score, the last column by default
+# @param numThreads: parser threads, defaults to the number of CPUs
+# @param chunkSize: bytes per chunk
+# @returns genes, src, dst, weight, numLines: gene name table, edge arrays and lines read
+def readInteractions(stringFile, minScore=None, genes=None, scoreColumn=-1, numThreads=None,
+                     chunkSize=CHUNK_SIZE):
+    whitelist = None
+    if genes is not None:
+        whitelist = {gene.encode() for gene in genes}
+
+    geneIndex = {}
+    geneNames = []
+    src = []
+    dst = []
+    weight = []
+    numLines = 0
+    numThreads = numThreads or os.cpu_count() or 1
+
+    with openStringFile(stringFile) as f, concurrent.futures.ThreadPoolExecutor(numThreads) as executor:
+        chunks = readChunks(f, chunkSize)
+        first = next(chunks, None)
+        if first is None:
+            return [], np.zeros(0, np.int32), np.zeros(0, np.int32), np.zeros(0, np.float64), 0
+        numColumns, hasHeader, perMille = detectLayout(first, scoreColumn)
+        if hasHeader:
+            first = first.split(b'\n', 1)[1] if b'\n' in first else b''
+            numLines += 1
+
+        # parse ahead on the threads, merge in file order here
+        pending = [executor.submit(parseChunk, first, numColumns, scoreColumn, minScore, whitelist)]
+        for chunk in chunks:
+            pending.append(executor.submit(parseChunk, chunk, numColumns, scoreColumn, minScore, whitelist))
+            if len(pending) > 2*numThreads:
+                numLines += mergeChunk(pending.pop(0).result(), geneIndex, geneNames, src, dst, weight)
+        for future in pending:
+            numLines += mergeChunk(future.result(), geneIndex, geneNames, src, dst, weight)
+
+    weight = np.concatenate(weight) if weight else np.zeros(0, np.float64)
+    # STRING's integer scores are per mille
+    if perMille:
+        weight = weight/1000
+    src = np.concatenate(src) if src else np.zeros(0, np.int32)
+    dst = np.concatenate(dst) if dst else np.zeros(0, np.int32)
+    return geneNames, src, dst, weight, numLines
+
+
+# Add a parsed chunk's genes to the gene table and its edges to the edge lists
+# @param parsed: result of parseChunk
+# @param geneIndex: dict of gene name: id, updated
+# @param geneNames: list of gene names, updated
+# @param src, dst, weight: lists of edge arrays, appended to
+# @returns numLines: lines in the chunk
+def mergeChunk(parsed, geneIndex, geneNames, src, dst, weight):
+    names, pairs, scores, numLines = parsed
+    ids = np.empty(len(names), dtype=np.int32)
+    for n, name in enumerate(names):
+        gene = name.decode()
+        i = geneIndex.get(gene)
+        if i is None:
+            i = geneIndex[gene] = len(geneNames)
+            geneNames.append(gene)
+        ids[n] = i
+    src.append(ids[pairs[:, 0]])
+    dst.append(ids[pairs[:, 1]])
+    weight.append(scores)
+    return numLines
+
+
+# Read a STRING file and print the parsing throughput
+# @param stringFile: STRING file of protein-protein interactions
+# @param minScore: optional lowest score to keep
+# @param genes: optional gene whitelist
+# @returns genes, src, dst, weight: gene name table and edge arrays
+def timedReadInteractions(stringFile, minScore=None, genes=None):
+    start = time.time()
+    geneNames, src, dst, weight, numLines = readInteractions(stringFile, minScore, genes)
+    seconds = max(time.time() - start, 1e-9)
+    print('Parsed', numLines, 'STRING lines in', round(seconds, 2), 's :', int(numLines/seconds), 'lines/sec,',
+          len(src), 'edges kept')
+    return geneNames, src, dst, weight
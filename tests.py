@@ -1,14 +1,458 @@
-import unittest
+import gzip, os, tempfile, unittest, warnings
+import numpy as np
+import analysisServer, checkpoint, degreeBins, fileParsing, geneticAlgorithm, instrumentation, islandModel, \
+    networkCache, nullDistribution, rendering, statistics
+from compactGraph import CompactGraph, SymmetricGraph, checkSymmetry
+from lociIndex import LociIndex
 
-# //TODO
-# 1. edges between nodes in same loci not counted
-# 2. picks the correct loci for each gene
-# 3. looks at every gene for each network
-# 4. ensure edges are only with chosen genes
 
-class MyTestCase(unittest.TestCase):
-    def test_something(self):
-        self.assertEqual(True, False)  # add assertion here
+class LociIndexTest(unittest.TestCase):
+    def test_genes_are_numbered_locus_by_locus(self):
+        lociIndex = LociIndex([['A', 'B'], ['C'], ['D', 'B', 'E']])
+        self.assertEqual(lociIndex.genes, ['A', 'B', 'C', 'D', 'E'])
+        np.testing.assert_array_equal(lociIndex.lociOffsets, [0, 2, 3, 5])
+        np.testing.assert_array_equal(lociIndex.geneLoci, [0, 0, 1, 2, 2])
+        self.assertEqual(list(lociIndex), [['A', 'B'], ['C'], ['D', 'B', 'E']])
+
+    def test_lookups(self):
+        lociIndex = LociIndex([['A', 'B'], ['C'], ['D', 'B', 'E']])
+        # a gene listed twice belongs to the first locus it is in
+        self.assertEqual(lociIndex.locusOf('B'), 0)
+        self.assertIsNone(lociIndex.locusOf('Z'))
+        self.assertEqual(lociIndex.lociOf('E'), ['D', 'B', 'E'])
+        self.assertIsNone(lociIndex.lociOf('Z'))
+        self.assertTrue(lociIndex.sameLocus('A', 'B'))
+        self.assertFalse(lociIndex.sameLocus('A', 'C'))
+        self.assertFalse(lociIndex.sameLocus('Z', 'Z'))
+
+
+class DegreeBinsTest(unittest.TestCase):
+    def test_quantile_bins_are_equal_and_keep_the_tail(self):
+        degrees = np.array([5, 1, 9, 3, 7, 2, 100, 4, 6, 8])
+        bins = degreeBins.makeDegreeBins(degrees, 3)
+        self.assertEqual(bins.sizes.sum(), len(degrees))
+        self.assertLessEqual(bins.sizes.max() - bins.sizes.min(), 1)
+        # the highest degree nodes are in the last bin, every bin is sorted by degree
+        self.assertEqual(bins.assignment[6], 2)
+        for b in range(len(bins)):
+            self.assertTrue((np.diff(degrees[bins.binMembers(b)]) >= 0).all())
+        self.assertTrue(degrees[bins.binMembers(0)].max() <= degrees[bins.binMembers(1)].min())
+
+    def test_more_bins_than_nodes(self):
+        bins = degreeBins.makeDegreeBins(np.array([3, 1]), 5)
+        self.assertEqual(len(bins), 5)
+        self.assertEqual(sorted(bins.assignment.tolist()), [0, 2])
+
+    def test_fixed_and_log_bins_of_degree_zero(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            for strategy in ('fixed', 'log'):
+                bins = degreeBins.makeDegreeBins(np.zeros(4, dtype=np.int64), 8, strategy)
+                np.testing.assert_array_equal(bins.assignment, 0)
+                self.assertEqual(bins.sizes[0], 4)
+
+    def test_fixed_bins_are_equal_width(self):
+        bins = degreeBins.makeDegreeBins(np.array([0, 10, 25, 49, 50, 99, 100]), 4, 'fixed')
+        np.testing.assert_array_equal(bins.assignment, [0, 0, 1, 1, 2, 3, 3])
+
+    def test_bad_arguments(self):
+        with self.assertRaises(ValueError):
+            degreeBins.makeDegreeBins(np.array([1, 2]), 0)
+        with self.assertRaises(ValueError):
+            degreeBins.makeDegreeBins(np.array([1, 2]), 2, 'none')
+
+
+class SelectionTest(unittest.TestCase):
+    def test_alias_table_matches_weights(self):
+        weights = np.array([1.0, 0.0, 3.0, 6.0, 0.5])
+        prob, alias = geneticAlgorithm.makeAliasTable(weights)
+        # chance of each index is its own slot's acceptance plus what other slots alias to it
+        chance = prob.copy()
+        np.add.at(chance, alias, 1 - prob)
+        np.testing.assert_allclose(chance/len(weights), weights/weights.sum())
+        draws = geneticAlgorithm.aliasSample(prob, alias, 100000, np.random.default_rng(11))
+        self.assertNotIn(1, draws)
+        np.testing.assert_allclose(np.bincount(draws, minlength=5)/len(draws), weights/weights.sum(), atol=0.01)
+
+    def test_selection_methods(self):
+        fitness = np.array([0.0, 1.0, 2.0, 10.0])
+        expected = geneticAlgorithm.selectionWeights(fitness)/geneticAlgorithm.selectionWeights(fitness).sum()
+        for method in ('proportional', 'alias'):
+            parents = geneticAlgorithm.selectParents(fitness, 100000, np.random.default_rng(12), method)
+            np.testing.assert_allclose(np.bincount(parents, minlength=4)/len(parents), expected, atol=0.01)
+        parents = geneticAlgorithm.selectParents(fitness, 100000, np.random.default_rng(12), 'rank')
+        np.testing.assert_allclose(np.bincount(parents, minlength=4)/len(parents), np.arange(1, 5)/10, atol=0.01)
+        parents = geneticAlgorithm.selectParents(fitness, 1000, np.random.default_rng(12), 'tournament', 4)
+        self.assertGreater((parents == 3).mean(), 0.6)
+        with self.assertRaises(ValueError):
+            geneticAlgorithm.selectParents(fitness, 10, np.random.default_rng(12), 'none')
+
+# random loci and an inter-locus weight matrix that is not symmetric, like a STRING file with
+# one-way or disagreeing pairs
+def randomLoci(rng, numLoci=8, lociSize=6):
+    lociIndex = LociIndex([['L' + str(l) + 'G' + str(g) for g in range(lociSize)] for l in range(numLoci)])
+    lociWeights = rng.random((lociIndex.numGenes, lociIndex.numGenes)).astype(np.float32)
+    lociWeights[rng.random(lociWeights.shape) < 0.5] = 0
+    lociWeights[lociIndex.geneLoci[:, None] == lociIndex.geneLoci[None, :]] = 0
+    return lociIndex, lociWeights
+
+
+class IncrementalFitnessTest(unittest.TestCase):
+    def test_mutation_matches_full_recompute(self):
+        rng = np.random.default_rng(1)
+        lociIndex, lociWeights = randomLoci(rng)
+        genomes = lociIndex.lociOffsets[:-1] + rng.integers(0, lociIndex.lociSizes, size=(200, lociIndex.numLoci))
+        fitness = statistics.calcGenomeEdgeDensityW(genomes, lociWeights)
+        total = fitness.sum()
+        for i in range(5):
+            numMutations, change = geneticAlgorithm.mutateGenomes(genomes, fitness, lociIndex, lociWeights, rng,
+                                                                  rate=0.3)
+            total += change
+            self.assertGreater(numMutations, 0)
+            np.testing.assert_allclose(fitness, statistics.calcGenomeEdgeDensityW(genomes, lociWeights), atol=1e-5)
+        self.assertAlmostEqual(total, fitness.sum(), places=4)
+
+
+# random STRING edges with scores of three decimals so 0-1000 files hold the same weights, some
+# pairs listed one way and one gene pair repeated
+def randomEdges(rng, numGenes=40, numEdges=200):
+    genes = ['9606.ENSP' + str(g).zfill(5) for g in range(numGenes)]
+    edges = []
+    for a, b in rng.integers(0, numGenes, size=(numEdges, 2)).tolist():
+        score = int(rng.integers(150, 1000))
+        edges.append((genes[a], genes[b], score))
+        if rng.random() < 0.7:
+            edges.append((genes[b], genes[a], score))
+    edges.append(edges[0][:2] + (999,))
+    return edges
+
+
+# @param fileName: file to write
+# @param edges: list of (gene1, gene2, score out of 1000)
+# @param perMille: bool to write 0-1000 integer scores instead of 0-1
+# @param delimiter: column delimiter
+# @param header: optional header line
+def writeString(fileName, edges, perMille=False, delimiter='\t', header=None):
+    lines = [] if header is None else [header]
+    for gene1, gene2, score in edges:
+        lines.append(delimiter.join((gene1, gene2, str(score) if perMille else str(score/1000))))
+    opener = gzip.open if fileName.endswith('.gz') else open
+    with opener(fileName, 'wt') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+class NetworkCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.stringFile = os.path.join(self.tmp.name, 'STRING.txt')
+        writeString(self.stringFile, randomEdges(np.random.default_rng(2)))
+        self.cacheDir = os.path.join(self.tmp.name, 'STRING.cache')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def assertMatchesReference(self, graph):
+        reference = fileParsing.makeInteractionNetwork(self.stringFile)
+        for gene1, edges in reference.items():
+            self.assertEqual(len(graph[gene1]), len(edges))
+            for gene2, weight in edges.items():
+                self.assertAlmostEqual(graph[gene1][gene2], float(weight), places=6)
+        self.assertEqual(graph.numEdges()*2, sum(len(edges) for edges in reference.values()))
+
+    def test_cache_matches_reference(self):
+        graph = networkCache.loadInteractionNetwork(self.stringFile, self.cacheDir)
+        self.assertMatchesReference(graph)
+        self.assertIsInstance(graph.neighbors, np.memmap)
+        self.assertEqual(networkCache.cachedStores(self.cacheDir), ['full'])
+        self.assertFalse(os.path.exists(os.path.join(self.cacheDir, 'symmetric-offsets.npy')))
+
+        cached = networkCache.loadInteractionNetwork(self.stringFile, self.cacheDir)
+        self.assertEqual(cached.genes, graph.genes)
+        np.testing.assert_array_equal(cached.offsets, graph.offsets)
+        np.testing.assert_array_equal(cached.neighbors, graph.neighbors)
+        np.testing.assert_array_equal(cached.weights, graph.weights)
+
+    def test_cache_recompiles_when_file_changes(self):
+        networkCache.loadInteractionNetwork(self.stringFile, self.cacheDir)
+        # a new mtime with the same contents keeps the cache
+        os.utime(self.stringFile, ns=(0, 0))
+        self.assertTrue(networkCache.isCacheValid(self.stringFile, self.cacheDir))
+        writeString(self.stringFile, randomEdges(np.random.default_rng(3)))
+        self.assertFalse(networkCache.isCacheValid(self.stringFile, self.cacheDir))
+        self.assertMatchesReference(networkCache.loadInteractionNetwork(self.stringFile, self.cacheDir))
+
+    def test_symmetric_store_is_added_when_used(self):
+        graph = networkCache.loadInteractionNetwork(self.stringFile, self.cacheDir)
+        symmetric = networkCache.loadInteractionNetwork(self.stringFile, self.cacheDir, symmetric=True)
+        self.assertEqual(networkCache.cachedStores(self.cacheDir), ['full', 'symmetric'])
+        # every gene id and -1 for a gene that is not in the graph
+        ids = np.arange(-1, len(graph.genes))
+        for i in range(len(graph.genes)):
+            w, found = symmetric.weightsTo(i, ids)
+            self.assertEqual(set(ids[found].tolist()), set(symmetric.neighborIds(i).tolist()))
+            # the symmetric store leaves out self-loops
+            self.assertTrue(set(graph.neighborIds(i).tolist()) - {i} <= set(ids[found].tolist()))
+            self.assertFalse(found[i + 1])
+            for j in set(graph.neighborIds(i).tolist()) - {i}:
+                self.assertEqual(w[j + 1], symmetric.weight(i, j))
+
+
+class SymmetricStoreTest(unittest.TestCase):
+    def test_check_symmetry_counts(self):
+        genes = ['A', 'B', 'C', 'D']
+        src = np.array([0, 1, 0, 2, 3, 1, 1, 2])
+        dst = np.array([1, 0, 2, 0, 3, 3, 3, 3])
+        weight = np.array([0.5, 0.5, 0.4, 0.7, 0.9, 0.2, 0.2, 0.1])
+        report = checkSymmetry(genes, src, dst, weight)
+        self.assertEqual(report.numEdges, 8)
+        # A-B both ways, A-C disagreeing, B-D repeated one way, C-D one way
+        self.assertEqual(report.numPairs, 4)
+        self.assertEqual(report.duplicated, 1)
+        self.assertEqual(report.oneWay, 2)
+        self.assertEqual(report.mismatched, 1)
+        self.assertEqual(report.selfLoops, 1)
+        self.assertIn(('D', 'D', 'self loop'), report.examples)
+
+    def test_symmetric_graph_matches_both_directions(self):
+        rng = np.random.default_rng(13)
+        genes = ['G' + str(g) for g in range(30)]
+        # each gene pair once, some of them self-loops
+        pairs = rng.choice(30*30, 150, replace=False)
+        src, dst = pairs//30, pairs % 30
+        pairs = np.unique(np.minimum(src, dst)*30 + np.maximum(src, dst))
+        src, dst = pairs//30, pairs % 30
+        weight = rng.random(len(pairs))
+        symmetric = SymmetricGraph.fromEdges(genes, src, dst, weight)
+        # self-loops are left out of the symmetric store
+        loop = src == dst
+        self.assertTrue(loop.any())
+        withoutLoops = SymmetricGraph.fromEdges(genes, src[~loop], dst[~loop], weight[~loop])
+        np.testing.assert_array_equal(symmetric.offsets, withoutLoops.offsets)
+        np.testing.assert_array_equal(symmetric.neighbors, withoutLoops.neighbors)
+
+        src, dst, weight = src[~loop], dst[~loop], weight[~loop]
+        full = CompactGraph.fromEdges(genes, np.concatenate((src, dst)), np.concatenate((dst, src)),
+                                      np.concatenate((weight, weight)))
+        np.testing.assert_array_equal(symmetric.degrees, full.degrees)
+        self.assertEqual(symmetric.numEdges(), full.numEdges())
+        self.assertAlmostEqual(symmetric.totalWeight(), full.totalWeight(), places=4)
+        for i in range(30):
+            self.assertEqual(symmetric.neighborIds(i).tolist(), full.neighborIds(i).tolist())
+            np.testing.assert_array_equal(symmetric.neighborWeights(i), full.neighborWeights(i))
+            w, found = symmetric.weightsTo(i, np.arange(30))
+            np.testing.assert_array_equal(found, np.isin(np.arange(30), full.neighborIds(i)))
+            np.testing.assert_array_equal(w, full.weightsTo(i, np.arange(30))[0])
+        idSets = np.array([rng.choice(30, 6, replace=False) for n in range(20)])
+        np.testing.assert_allclose(symmetric.inducedWeights(idSets), full.inducedWeights(idSets), rtol=1e-6)
+
+
+class StringParserTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.edges = randomEdges(np.random.default_rng(4))
+        self.referenceFile = os.path.join(self.tmp.name, 'reference.txt')
+        writeString(self.referenceFile, self.edges)
+        self.reference = fileParsing.makeInteractionNetwork(self.referenceFile)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def assertParsedLikeReference(self, fileName, **options):
+        writeString(fileName, self.edges, **options)
+        graph = fileParsing.makeCompactInteractionNetwork(fileName, useCache=False)
+        self.assertEqual(sorted(graph.genes), sorted(set(self.reference) | {g for e in self.reference.values()
+                                                                             for g in e}))
+        for gene1, edges in self.reference.items():
+            self.assertEqual(dict(graph[gene1].items()).keys(), edges.keys())
+            for gene2, weight in edges.items():
+                self.assertAlmostEqual(graph[gene1][gene2], float(weight), places=6)
+
+    def test_tab_delimited(self):
+        self.assertParsedLikeReference(os.path.join(self.tmp.name, 'tab.txt'))
+
+    def test_header_and_spaces(self):
+        self.assertParsedLikeReference(os.path.join(self.tmp.name, 'spaces.txt'), delimiter=' ',
+                                       header='protein1 protein2 combined_score')
+
+    def test_per_mille_scores(self):
+        self.assertParsedLikeReference(os.path.join(self.tmp.name, 'perMille.txt'), perMille=True)
+        self.assertParsedLikeReference(os.path.join(self.tmp.name, 'perMilleHeader.txt'), perMille=True,
+                                       delimiter=' ', header='protein1 protein2 combined_score')
+
+    def test_gzip(self):
+        self.assertParsedLikeReference(os.path.join(self.tmp.name, 'string.txt.gz'), perMille=True, delimiter=' ')
+
+
+class CrossoverTest(unittest.TestCase):
+    def test_children_keep_each_locus_in_its_column(self):
+        rng = np.random.default_rng(5)
+        lociIndex, lociWeights = randomLoci(rng)
+        genomes = lociIndex.lociOffsets[:-1] + rng.integers(0, lociIndex.lociSizes, size=(100, lociIndex.numLoci))
+        mates = rng.integers(0, len(genomes), size=len(genomes))
+        for method in ('uniform', 'onePoint', 'twoPoint'):
+            children = geneticAlgorithm.crossoverGenomes(genomes, mates, rng, method)
+            self.assertEqual(children.shape, genomes.shape)
+            np.testing.assert_array_equal(lociIndex.geneLoci[children],
+                                          np.broadcast_to(np.arange(lociIndex.numLoci), children.shape))
+            self.assertTrue(((children == genomes) | (children == genomes[mates])).all())
+        with self.assertRaises(ValueError):
+            geneticAlgorithm.crossoverGenomes(genomes, mates, rng, 'none')
+
+
+# null model of 20 gene populations of 5 genes each over a random network
+def randomNullModel(rng, numGenes=300, numEdges=3000):
+    genes = ['G' + str(g) for g in range(numGenes)]
+    src, dst = rng.integers(0, numGenes, size=(2, numEdges))
+    weight = rng.random(numEdges)
+    graph = CompactGraph.fromEdges(genes, np.concatenate((src, dst)), np.concatenate((dst, src)),
+                                   np.concatenate((weight, weight)))
+    bins = degreeBins.makeDegreeBins(graph.degrees, 8)
+    subnetworks = [[genes[g] for g in rng.choice(numGenes, 5, replace=False)] for n in range(20)]
+    return nullDistribution.NullModel.fromSubnetworks(graph, bins, subnetworks)
+
+
+class NullStoppingTest(unittest.TestCase):
+    def setUp(self):
+        self.nullModel = randomNullModel(np.random.default_rng(6))
+
+    def test_stops_at_min_exceedances(self):
+        result = nullDistribution.empiricalNullPVal(self.nullModel, -1.0, 7, numWorkers=1, batchSize=20,
+                                                    maxPermutations=1000, minExceedances=10)
+        self.assertEqual(result.numPermutations, 20)
+        self.assertEqual(result.pval, 1.0)
+
+    def test_stops_when_interval_is_below_alpha(self):
+        # no null density reaches the observed one, p is clearly below alpha after 80 populations
+        result = nullDistribution.empiricalNullPVal(self.nullModel, np.inf, 7, numWorkers=1, batchSize=20,
+                                                    maxPermutations=1000, alpha=0.05)
+        self.assertEqual(result.numPermutations, 80)
+        self.assertEqual(result.pval, 1/81)
+        self.assertLess(result.ciHigh, 0.05)
+
+    def test_runs_to_max_permutations_near_alpha(self):
+        densities = self.nullModel.sampleDensities(np.random.default_rng(8), 200)
+        observed = float(np.quantile(densities, 0.96))
+        result = nullDistribution.empiricalNullPVal(self.nullModel, observed, 7, numWorkers=1, batchSize=20,
+                                                    maxPermutations=100, minExceedances=50)
+        self.assertEqual(result.numPermutations, 100)
+        self.assertEqual(result.pval, (result.exceedances + 1)/101)
+
+    def test_workers_give_the_same_densities(self):
+        single = nullDistribution.empiricalNullPVal(self.nullModel, 1.0, 7, numWorkers=1, maxPermutations=100)
+        pooled = nullDistribution.empiricalNullPVal(self.nullModel, 1.0, 7, numWorkers=2, maxPermutations=100)
+        np.testing.assert_array_equal(single.densities, pooled.densities)
+        self.assertEqual(single.pval, pooled.pval)
+
+
+class IslandModelTest(unittest.TestCase):
+    def test_same_result_for_any_worker_count(self):
+        rng = np.random.default_rng(14)
+        lociIndex, lociWeights = randomLoci(rng)
+        genomes = lociIndex.lociOffsets[:-1] + rng.integers(0, lociIndex.lociSizes, size=(60, lociIndex.numLoci))
+        results = []
+        for numWorkers in (1, 2):
+            population = geneticAlgorithm.Population(genomes, lociIndex, lociWeights)
+            results.append(islandModel.islandGeneticAlg(population, 3, 15, numWorkers=numWorkers,
+                                                        migrationInterval=2, numMigrants=2, tolerance=0,
+                                                        maxGenerations=6))
+        np.testing.assert_array_equal(results[0].genomes, results[1].genomes)
+        np.testing.assert_array_equal(results[0].fitness, results[1].fitness)
+        np.testing.assert_allclose(results[0].fitness, statistics.calcGenomeEdgeDensityW(results[0].genomes,
+                                                                                         lociWeights), atol=1e-5)
+
+
+class ServerJobTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.genesFile = os.path.join(self.tmp.name, 'in.gmt')
+        with open(self.genesFile, 'w') as f:
+            f.write('locus0\tdesc\tA\tB\n')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_values_are_converted(self):
+        args = analysisServer.jobArgs(self.genesFile, {'numSubnetworks': '50', 'alpha': 0.01, 'calcPVal': True,
+                                                       'binning': 'log'})
+        self.assertEqual((args.numSubnetworks, args.alpha, args.calcPVal, args.binning), (50, 0.01, True, 'log'))
+        self.assertEqual(args.workers, 1)
+
+    def test_bad_values_are_rejected(self):
+        for params in ({'numSubnetworks': 0}, {'numPermutations': -5}, {'alpha': 2}, {'hops': -1},
+                       {'numSubnetworks': 'many'}, {'numSubnetworks': None}, {'calcPVal': 'false'},
+                       {'binning': 'other'}, {'outDir': '/tmp'}, {'interactionsFile': 'other.txt'},
+                       {'unknown': 1}):
+            with self.assertRaises(ValueError, msg=str(params)):
+                analysisServer.jobArgs(self.genesFile, params)
+        with self.assertRaises(ValueError):
+            analysisServer.jobArgs(os.path.join(self.tmp.name, 'missing.gmt'), {})
+        with self.assertRaises(ValueError):
+            analysisServer.jobArgs(self.genesFile, ['numSubnetworks', 5])
+
+
+# Observer that stops a run at the given event, like a crash or a pre-empted job
+class StopAt:
+    def __init__(self, event, count):
+        self.event = event
+        self.count = count
+
+    def __call__(self, record):
+        if record['event'] == self.event:
+            self.count -= 1
+            if self.count == 0:
+                raise KeyboardInterrupt
+
+
+class CheckpointResumeTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        rendering.configure('none')
+
+    def tearDown(self):
+        rendering.configure('none')
+        self.tmp.cleanup()
+
+    # @param outDir: directory of the run's files
+    # @param stopAt: optional StopAt observer
+    # @returns population: evolved Population
+    def evolve(self, outDir, stopAt=None):
+        os.makedirs(outDir, exist_ok=True)
+        rng = np.random.default_rng(9)
+        lociIndex, lociWeights = randomLoci(np.random.default_rng(10))
+        genomes = lociIndex.lociOffsets[:-1] + rng.integers(0, lociIndex.lociSizes, size=(50, lociIndex.numLoci))
+        population = geneticAlgorithm.Population(genomes, lociIndex, lociWeights)
+        runCheckpoint = checkpoint.Checkpoint.resume(os.path.join(outDir, 'run.npz'), 'test', interval=0)
+        recorder = instrumentation.Recorder([stopAt] if stopAt is not None else [])
+        return geneticAlgorithm.geneticAlgGenomes(population, rng, tolerance=0, maxGenerations=8, recorder=recorder,
+                                                  outDir=outDir, checkpoint=runCheckpoint)
+
+    def test_resumed_ga_writes_the_same_output(self):
+        straight = self.evolve(os.path.join(self.tmp.name, 'straight'))
+        resumedDir = os.path.join(self.tmp.name, 'resumed')
+        with self.assertRaises(KeyboardInterrupt):
+            self.evolve(resumedDir, StopAt('generation', 4))
+        resumed = self.evolve(resumedDir)
+        np.testing.assert_array_equal(resumed.genomes, straight.genomes)
+        self.assertEqual(resumed.totalDensity, straight.totalDensity)
+        with open(os.path.join(self.tmp.name, 'straight', 'GA_Generations_Stats'), 'rb') as f:
+            straightStats = f.read()
+        with open(os.path.join(resumedDir, 'GA_Generations_Stats'), 'rb') as f:
+            self.assertEqual(f.read(), straightStats)
+
+    def test_resumed_null_gives_the_same_result(self):
+        nullModel = randomNullModel(np.random.default_rng(6))
+        straight = nullDistribution.empiricalNullPVal(nullModel, 1.0, 7, numWorkers=1, maxPermutations=100)
+        fileName = os.path.join(self.tmp.name, 'null.npz')
+        with self.assertRaises(KeyboardInterrupt):
+            nullDistribution.empiricalNullPVal(nullModel, 1.0, 7, numWorkers=1, maxPermutations=100,
+                                               recorder=instrumentation.Recorder([StopAt('nullBatch', 3)]),
+                                               checkpoint=checkpoint.Checkpoint(fileName, 'test', interval=0))
+        self.assertEqual(len(checkpoint.Checkpoint.resume(fileName, 'test').get('null')[1]['densities']), 40)
+        resumed = nullDistribution.empiricalNullPVal(nullModel, 1.0, 7, numWorkers=1, maxPermutations=100,
+                                                     checkpoint=checkpoint.Checkpoint.resume(fileName, 'test', 0))
+        self.assertEqual(resumed.densities.tobytes(), straight.densities.tobytes())
+        self.assertEqual((resumed.pval, resumed.ciLow, resumed.ciHigh, resumed.exceedances),
+                         (straight.pval, straight.ciLow, straight.ciHigh, straight.exceedances))
 
 
 if __name__ == '__main__':